@@ -0,0 +1,50 @@
+"""Fixtures for the benchmark suite, providing synthetic datasets whose size is set on the command line."""
+
+import pytest
+from sleap_io import Labels
+
+from paws_tools.slp_to_csv import get_nodes_for_bodyparts, invert_y_axis, node_positions_to_dataframe
+from tests.fixtures.slp import make_labels, write_slp
+
+# Nodes extracted by the benchmarks, including the calibration nodes
+BENCH_NODES = ["Toe", "Heel", "Top_Box", "Bot_Box"]
+
+
+def pytest_addoption(parser):
+    """Add options controlling the size of the synthetic datasets."""
+    group = parser.getgroup("paws-tools benchmarks")
+    group.addoption("--bench-videos", type=int, default=4, help="Number of videos in the synthetic dataset")
+    group.addoption("--bench-frames", type=int, default=10000, help="Number of labeled frames per video in the synthetic dataset")
+    group.addoption("--bench-instances", type=int, default=1, help="Number of predicted instances per frame in the synthetic dataset")
+
+
+@pytest.fixture(scope="session")
+def bench_labels(request) -> Labels:
+    """Synthetic labels, sized by the --bench-* options."""
+    return make_labels(
+        n_videos=request.config.getoption("--bench-videos"),
+        n_frames=request.config.getoption("--bench-frames"),
+        n_instances=request.config.getoption("--bench-instances"),
+        n_tracks=request.config.getoption("--bench-instances"),
+        missing_node_rate=0.05,
+    )
+
+
+@pytest.fixture(scope="session")
+def bench_slp_file(tmp_path_factory, bench_labels: Labels) -> str:
+    """Path to a *.slp file containing `bench_labels`."""
+    return write_slp(bench_labels, str(tmp_path_factory.mktemp("bench") / "bench.slp"))
+
+
+@pytest.fixture(scope="session")
+def bench_coords(bench_labels: Labels):
+    """Coordinate dataframe extracted from `bench_labels`, with the y-axis inverted."""
+    return invert_y_axis(node_positions_to_dataframe(bench_labels, get_nodes_for_bodyparts(bench_labels, BENCH_NODES)), 512)
+
+
+@pytest.fixture(autouse=True)
+def bench_info(request, benchmark, bench_labels: Labels):
+    """Record the size of the dataset with each result, so saved results can be compared like for like."""
+    benchmark.extra_info["frames"] = len(bench_labels.labeled_frames)
+    benchmark.extra_info["videos"] = len(bench_labels.videos)
+    benchmark.extra_info["instances"] = request.config.getoption("--bench-instances")
@@ -0,0 +1,66 @@
+"""Benchmark `node_positions_to_dataframe()` against the legacy per-frame dict implementation.
+
+Both are timed from a *.slp file to a dataframe: the legacy implementation loads the file with
+`sleap_io.load_slp()` and walks its `Labels` frame by frame, while the current implementation gathers
+the coordinates straight from the arrays of the file with a `SlpReader`. The extraction step alone,
+from `Labels` already in memory, is also reported.
+
+Run from the repository root:
+    python -m benchmarks.extraction --videos 4 --frames 25000
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+from sleap_io import load_slp
+
+from paws_tools.slp_reader import SlpReader
+from paws_tools.slp_to_csv import get_nodes_for_bodyparts, node_positions_to_dataframe
+from tests.fixtures.slp import make_labels, write_slp
+from tests.test_slp_to_csv import legacy_node_positions_to_dataframe
+
+
+def _report(name: str, legacy: float, current: float):
+    """Print the time taken by both implementations and the speedup."""
+    print(f"{name}:")
+    print(f"  legacy:  {legacy:.3f} s")
+    print(f"  current: {current:.3f} s")
+    print(f"  speedup: {legacy / current:.1f}x")
+
+
+def main():
+    """Time both implementations on synthetic labels and report the speedup."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=4, help="Number of synthetic videos")
+    parser.add_argument("--frames", type=int, default=25000, help="Number of labeled frames per video")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timing repeats, best time is reported")
+    args = parser.parse_args()
+
+    labels = make_labels(n_videos=args.videos, n_frames=args.frames)
+    nodes = get_nodes_for_bodyparts(labels, ["Toe", "Heel"])
+    node_names = [node.name for node in nodes]
+
+    def from_file_legacy():
+        return legacy_node_positions_to_dataframe(load_slp(slp_file), nodes)
+
+    def from_file_current():
+        with SlpReader(slp_file) as reader:
+            return node_positions_to_dataframe(reader, node_names)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        slp_file = write_slp(labels, os.path.join(tmp_dir, "bench.slp"))
+        legacy_file = min(timeit.repeat(from_file_legacy, number=1, repeat=args.repeat))
+        current_file = min(timeit.repeat(from_file_current, number=1, repeat=args.repeat))
+
+    legacy = min(timeit.repeat(lambda: legacy_node_positions_to_dataframe(labels, nodes), number=1, repeat=args.repeat))
+    current = min(timeit.repeat(lambda: node_positions_to_dataframe(labels, nodes), number=1, repeat=args.repeat))
+
+    print(f"frames: {len(labels.labeled_frames)}")
+    _report("*.slp file to dataframe", legacy_file, current_file)
+    _report("in-memory labels to dataframe", legacy, current)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Benchmarks of the conversion steps of `slp-to-csv`, and of the command end-to-end.
+
+Run from the repository root, saving the results for comparison with later runs:
+    pytest benchmarks --benchmark-autosave
+
+Then, after making changes, compare against the last saved results:
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+The size of the synthetic dataset is set with --bench-videos, --bench-frames and --bench-instances.
+"""
+
+from typing import List
+
+import pytest
+from click.testing import CliRunner
+from sleap_io import Labels
+
+from benchmarks.conftest import BENCH_NODES
+from paws_tools.cli import cli
+from paws_tools.slp_reader import SlpReader
+from paws_tools.slp_to_csv import (
+    convert_physical_units,
+    get_nodes_for_bodyparts,
+    init_plot_worker,
+    invert_y_axis,
+    node_positions_to_dataframe,
+    plot_bodyparts_y_pos_over_time,
+    save_dataframe_to_grouped_csv,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_get_nodes_for_bodyparts(benchmark, bench_labels: Labels):
+    """Benchmark selecting nodes by name."""
+    benchmark(get_nodes_for_bodyparts, bench_labels, "all")
+
+
+@pytest.mark.parametrize("instance_policy", ["first", "all"])
+def test_node_positions_to_dataframe(benchmark, bench_labels: Labels, instance_policy: str):
+    """Benchmark extracting coordinates from in-memory labels."""
+    nodes = get_nodes_for_bodyparts(bench_labels, BENCH_NODES)
+    benchmark(node_positions_to_dataframe, bench_labels, nodes, instance_policy)
+
+
+@pytest.mark.parametrize("instance_policy", ["first", "all"])
+def test_node_positions_to_dataframe_from_file(benchmark, bench_slp_file: str, instance_policy: str):
+    """Benchmark extracting coordinates straight from the arrays of a *.slp file, without loading `Labels`."""
+
+    def run():
+        with SlpReader(bench_slp_file) as reader:
+            return node_positions_to_dataframe(reader, BENCH_NODES, instance_policy)
+
+    benchmark(run)
+
+
+def test_invert_y_axis(benchmark, bench_coords):
+    """Benchmark inverting the y-axis."""
+    benchmark(invert_y_axis, bench_coords, 512)
+
+
+def test_convert_physical_units(benchmark, bench_coords):
+    """Benchmark converting coordinates to physical units."""
+    videos = bench_coords.index.unique(level="video")
+    conv_factors = {video: 0.1 * (i + 1) for i, video in enumerate(videos)}
+    benchmark(convert_physical_units, bench_coords, conv_factors)
+
+
+@pytest.mark.parametrize("format", ["tsv", "npz"])
+def test_save_dataframe_to_grouped_csv(benchmark, tmp_path, bench_coords, format: str):
+    """Benchmark saving one file per video."""
+    benchmark(save_dataframe_to_grouped_csv, bench_coords, "video", str(tmp_path), suffix="px", format=format)
+
+
+def test_plot_bodyparts_y_pos_over_time(benchmark, tmp_path, bench_coords):
+    """Benchmark rendering the trace plot of a single video."""
+    init_plot_worker()
+    video_df = bench_coords.loc[[bench_coords.index.get_level_values("video")[0]]]
+    benchmark(plot_bodyparts_y_pos_over_time, video_df, str(tmp_path), ["Toe", "Heel"], suffix="px")
+
+
+@pytest.mark.parametrize("mode_args", [[], ["--streaming"], ["--jobs", "2"]], ids=["memory", "streaming", "jobs"])
+def test_slp_to_csv(benchmark, tmp_path, bench_slp_file: str, mode_args: List[str]):
+    """Benchmark the `slp-to-csv` command end-to-end, converting and plotting every video on every round."""
+    init_plot_worker()
+    args = ["slp-to-csv", bench_slp_file, "-bp", "Toe", "-bp", "Heel", "--dest-dir", str(tmp_path), "--force", "--always-plot"]
+
+    def run():
+        result = CliRunner().invoke(cli, args + mode_args)
+        assert result.exit_code == 0, result.output
+
+    benchmark.pedantic(run, rounds=3, iterations=1, warmup_rounds=0)
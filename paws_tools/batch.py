@@ -0,0 +1,198 @@
+"""Convert many *.slp files in one invocation, over a pool of long-lived worker processes."""
+
+import glob
+import multiprocessing
+import os
+import time
+import traceback
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+from tqdm import tqdm
+
+from paws_tools.cache import ConversionCache
+from paws_tools.plotting import init_plot_worker
+from paws_tools.profiling import Metrics
+from paws_tools.slp_to_csv import convert_slp_file
+
+# Columns of the summary table produced by `batch_convert()`
+SUMMARY_COLUMNS = ["file", "status", "videos", "frames", "converted", "skipped", "seconds", "error"]
+
+
+def check_unique_names(slp_files: List[str]) -> None:
+    """Check no two *.slp files share a name, as they would overwrite each other's outputs in a destination directory.
+
+    Args:
+        slp_files: paths to the *.slp files
+
+    Raises:
+        ValueError: if files in different directories have the same basename
+    """
+    by_name: Dict[str, List[str]] = {}
+    for slp_file in slp_files:
+        by_name.setdefault(os.path.splitext(os.path.basename(slp_file))[0], []).append(slp_file)
+    duplicates = [files for files in by_name.values() if len(files) > 1]
+    if len(duplicates) > 0:
+        listing = "; ".join(", ".join(f'"{fn}"' for fn in files) for files in duplicates)
+        raise ValueError(f"Files with the same name would overwrite each other's outputs, rename or convert them separately: {listing}")
+
+
+def find_slp_files(paths: List[str]) -> List[str]:
+    """Expand a list of files, directories and glob patterns into a list of *.slp files.
+
+    Directories are searched recursively for *.slp files, and glob patterns may use `**` to match
+    any number of directories.
+
+    Args:
+        paths: *.slp files, directories or glob patterns
+
+    Returns:
+        list of unique *.slp files, in the order they were first found
+
+    Raises:
+        FileNotFoundError: if a glob pattern matches no file
+        ValueError: if two of the files found have the same basename, see `check_unique_names()`
+    """
+    found: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(glob.glob(os.path.join(glob.escape(path), "**", "*.slp"), recursive=True))
+        elif os.path.isfile(path):
+            matches = [path]
+        else:
+            matches = sorted(fn for fn in glob.glob(path, recursive=True) if os.path.isfile(fn))
+            if len(matches) == 0:
+                raise FileNotFoundError(f'No files found matching "{path}"')
+
+        for match in matches:
+            if match not in found:
+                found.append(match)
+    check_unique_names(found)
+    return found
+
+
+class FileTask(NamedTuple):
+    """Conversion of a single *.slp file, which may be sent to a worker process, see `make_file_task()`."""
+
+    slp_file: str
+    dest_dir: str
+    force: bool
+    metrics: Optional[Metrics]
+    kwargs: Dict[str, Any]
+
+
+def make_file_task(slp_file: str, dest_dir: str, force: bool = False, metrics: Optional[Metrics] = None, **kwargs) -> FileTask:
+    """Make the task converting a single file, to be run by `convert_file_task()`.
+
+    Args:
+        slp_file: path to the *.slp file
+        dest_dir: destination directory for the produced files
+        force: if True, convert every video, even if unchanged since a previous conversion
+        metrics: metrics of the whole run, if any. The task records into fresh metrics, to be merged into these
+            once done, and dumps profiles to a sub-directory of `metrics.cprofile_dir` named after the file
+        **kwargs: additional arguments for `convert_slp_file()`
+
+    Returns:
+        the task
+    """
+    file_metrics = None
+    if metrics is not None:
+        cprofile_dir = metrics.cprofile_dir
+        file_metrics = Metrics(os.path.join(cprofile_dir, os.path.splitext(os.path.basename(slp_file))[0]) if cprofile_dir else None)
+    return FileTask(slp_file, dest_dir, force, file_metrics, kwargs)
+
+
+def convert_file_task(task: FileTask) -> Tuple[Dict[str, Any], Optional[ConversionCache], Optional[Metrics]]:
+    """Convert the single file of `task`, continuing past any failure.
+
+    Args:
+        task: the task, see `make_file_task()`
+
+    Returns:
+        tuple of (row, cache, metrics): the summary row of the file, with columns `SUMMARY_COLUMNS` (plus the
+        `traceback` of a failure), the conversion cache to merge into that of `dest_dir` (None if the conversion
+        failed), and the metrics recorded by the task
+    """
+    slp_file, dest_dir, force, metrics, kwargs = task
+    row: Dict[str, Any] = {"file": slp_file, "status": "ok", "error": ""}
+    cache: Optional[ConversionCache] = ConversionCache(dest_dir, force=force)
+    start = time.perf_counter()
+    try:
+        row.update(convert_slp_file(slp_file, dest_dir, cache=cache, metrics=metrics, **kwargs))
+    except Exception as e:  # pylint: disable=broad-except
+        row.update(status="failed", error=f"{type(e).__name__}: {e}")
+        row["traceback"] = traceback.format_exc()
+        cache = None  # a failed conversion is not recorded
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    if metrics is not None:
+        metrics.dump_profiles()
+    return row, cache, metrics
+
+
+def batch_convert(
+    slp_files: List[str],
+    dest_dir: str,
+    jobs: int = 1,
+    max_tasks_per_worker: Optional[int] = None,
+    force: bool = False,
+    metrics: Optional[Metrics] = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """Convert many *.slp files, see `convert_slp_file()`, continuing past any file which fails.
+
+    With `jobs` > 1, files are scheduled over a pool of worker processes. Each worker imports the heavy
+    dependencies once and converts many files, but is replaced after `max_tasks_per_worker` files, so that
+    memory held by a worker is periodically released.
+
+    Conversions are recorded in the cache manifest of `dest_dir` as each file completes.
+
+    Args:
+        slp_files: paths to the *.slp files
+        dest_dir: destination directory for the produced files
+        jobs: number of worker processes, each converting one file at a time
+        max_tasks_per_worker: number of files a worker converts before being replaced, or None for no limit
+        force: if True, convert every video, even if unchanged since a previous conversion
+        metrics: if provided, the time taken by each stage of every conversion is recorded here. Profiles of each
+            file are dumped to a sub-directory of `metrics.cprofile_dir` named after the file, see `paws_tools.profiling`
+        **kwargs: additional arguments for `convert_slp_file()`
+
+    Returns:
+        summary table with one row per file, with columns `SUMMARY_COLUMNS`
+
+    Raises:
+        ValueError: if two of `slp_files` have the same basename, see `check_unique_names()`
+    """
+    check_unique_names(slp_files)
+    os.makedirs(dest_dir, exist_ok=True)
+    cache = ConversionCache(dest_dir, force=force)
+    # each file is converted serially within its task, worker processes cannot start processes of their own
+    kwargs = dict(kwargs, jobs=1)
+    tasks = [make_file_task(slp_file, dest_dir, force, metrics, **kwargs) for slp_file in slp_files]
+
+    rows = {}
+    pool = multiprocessing.Pool(jobs, initializer=init_plot_worker, maxtasksperchild=max_tasks_per_worker) if jobs > 1 else None
+    interrupted = True
+    try:
+        results: Iterator = pool.imap_unordered(convert_file_task, tasks) if pool is not None else map(convert_file_task, tasks)
+        for row, file_cache, file_metrics in tqdm(results, total=len(tasks), desc="Converting Files"):
+            if row["status"] != "ok":
+                tqdm.write(f'Failed to convert "{row["file"]}":\n{row.pop("traceback")}')
+            if file_cache is not None:
+                cache.merge(file_cache)
+                cache.save()
+            if metrics is not None and file_metrics is not None:
+                metrics.merge(file_metrics)
+            rows[row["file"]] = row
+        interrupted = False
+    finally:
+        if pool is not None:
+            # on an exception (i.e. KeyboardInterrupt), abandon the files still queued rather than waiting for them
+            if interrupted:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+    summary = pd.DataFrame([rows[slp_file] for slp_file in slp_files], columns=SUMMARY_COLUMNS)
+    # counts are missing for failed files, use a nullable integer type so they do not become floats
+    return summary.astype({column: "Int64" for column in ["videos", "frames", "converted", "skipped"]})
@@ -0,0 +1,223 @@
+"""Cache manifest allowing repeated conversions to skip videos whose inputs are unchanged.
+
+The manifest is a JSON file stored in the destination directory. For each *.slp file it records the size and
+modification time of the file, and for each video a digest of the extracted coordinates together with the
+conversion parameters, plus the files which were produced.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from paws_tools import __version__
+from paws_tools.slp_reader import DEFAULT_CHUNK_SIZE, FrameSelection, InstancePolicy, SlpReader
+
+# Name of the manifest file, stored in the destination directory
+MANIFEST_FILENAME = ".paws-tools-cache.json"
+
+# Version of the manifest layout, manifests with another version are discarded
+MANIFEST_VERSION = 1
+
+
+def file_fingerprint(filename: str) -> Dict[str, int]:
+    """Get a cheap fingerprint of a file, consisting of its size and modification time.
+
+    Args:
+        filename: path to the file
+
+    Returns:
+        dict with `size` and `mtime_ns` keys
+    """
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def params_digest(params: Dict[str, Any]) -> str:
+    """Compute a digest of conversion parameters.
+
+    Args:
+        params: JSON serializable conversion parameters
+
+    Returns:
+        hex digest of `params`, which also covers the version of paws-tools
+    """
+    return hashlib.sha1(json.dumps([__version__, params], sort_keys=True).encode()).hexdigest()
+
+
+def video_digests(
+    slp_file: str,
+    node_names: List[str],
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    instance_policy: InstancePolicy = "first",
+    videos: Optional[Iterable[str]] = None,
+    frames: Optional[FrameSelection] = None,
+) -> Dict[str, str]:
+    """Compute a digest of the coordinates of `node_names` for each video in `slp_file`.
+
+    Only the data which determines the output of a conversion is hashed, so a video is considered
+    unchanged when other videos, or other nodes, in the file have changed.
+
+    Args:
+        slp_file: path to the *.slp file
+        node_names: names of the nodes to hash, should include any calibration nodes
+        chunk_size: maximum number of frames read at once
+        instance_policy: which predicted instances of each frame are extracted, see `SlpReader.read_instances()`.
+            Instance keys and scores are also hashed for policies other than `first`
+        videos: filenames of the videos to hash, or None for all videos
+        frames: if provided, only the selected frames are hashed
+
+    Returns:
+        dict mapping video filename to a hex digest
+    """
+    scores = instance_policy != "first"
+    digests = {}
+    with SlpReader(slp_file) as reader:
+        for video in reader.videos if videos is None else videos:
+            digest = hashlib.sha1(json.dumps(node_names).encode())
+            for positions in reader.iter_instances(video, node_names, instance_policy, chunk_size, scores=scores, frames=frames):
+                digest.update(positions.frame_inds.tobytes())
+                digest.update(positions.coords.tobytes())
+                if scores:
+                    digest.update(positions.instances.tobytes())
+                    digest.update(positions.point_scores.tobytes())  # type: ignore[union-attr]
+                    digest.update(positions.instance_scores.tobytes())  # type: ignore[union-attr]
+            if scores:
+                digest.update(json.dumps(reader.tracks).encode())
+            digests[video] = digest.hexdigest()
+    return digests
+
+
+class ConversionCache:
+    """Manifest of previous conversions into a destination directory.
+
+    Usage is to `check()` which videos of a *.slp file need to be converted, convert those, then `record()`
+    the produced files and `save()` the manifest.
+    """
+
+    def __init__(self, dest_dir: str, force: bool = False):
+        """Load the manifest stored in `dest_dir`, if any.
+
+        Args:
+            dest_dir: destination directory of the conversion
+            force: if True, every video is treated as changed, but the manifest is still updated
+        """
+        self.filename = os.path.join(dest_dir, MANIFEST_FILENAME)
+        self.force = force
+        self.hits: List[str] = []
+        self.misses: List[str] = []
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._recorded: List[str] = []
+
+        self._manifest: Dict[str, Any] = {"version": MANIFEST_VERSION, "files": {}}
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == MANIFEST_VERSION:
+                    self._manifest = manifest
+            except (OSError, ValueError):
+                pass  # an unreadable manifest is equivalent to an empty one
+
+    def check(
+        self,
+        slp_file: str,
+        params: Dict[str, Any],
+        node_names: List[str],
+        output_groups: Dict[str, str],
+        instance_policy: InstancePolicy = "first",
+        frames: Optional[FrameSelection] = None,
+    ) -> List[str]:
+        """Determine which of the videos of `slp_file` in `output_groups` need to be converted.
+
+        When `slp_file` is unchanged since the last conversion, no data is read at all. Otherwise a digest of the
+        coordinates of each video is computed, see `video_digests()`. Only the videos in `output_groups` are
+        hashed, so when converting a selection of videos the others are not read.
+
+        Args:
+            slp_file: path to the *.slp file
+            params: JSON serializable parameters of the conversion
+            node_names: names of the nodes read by the conversion, including any calibration nodes
+            output_groups: dict mapping each video to the output file it is saved to. Videos sharing an output
+                file are converted together, so if one needs to be converted all of them will
+            instance_policy: which predicted instances of each frame are extracted, see `video_digests()`
+            frames: if provided, only the selected frames are hashed. The selection should be part of `params`
+
+        Returns:
+            list of videos which need to be converted, in the order of `output_groups`
+        """
+        key = os.path.abspath(slp_file)
+        fingerprint = file_fingerprint(slp_file)
+        digest = params_digest(params)
+        entry = self._manifest["files"].get(key, {})
+
+        # digests recorded for an unchanged file remain valid, even for videos not converted this time
+        digests: Dict[str, str] = {}
+        if entry.get("fingerprint") == fingerprint and entry.get("params") == digest:
+            digests = {video: cached["digest"] for video, cached in entry.get("videos", {}).items()}
+        missing = [video for video in output_groups if video not in digests]
+        if len(missing) > 0:
+            digests.update(video_digests(slp_file, node_names, instance_policy=instance_policy, videos=missing, frames=frames))
+
+        changed = set()
+        for video in output_groups:
+            cached = entry.get("videos", {}).get(video)
+            if (
+                self.force
+                or cached is None
+                or entry.get("params") != digest
+                or cached["digest"] != digests.get(video)
+                or not all(os.path.exists(fn) for fn in cached["outputs"])
+            ):
+                changed.add(output_groups[video])
+
+        misses = [video for video, group in output_groups.items() if group in changed]
+        self.hits.extend(video for video in output_groups if video not in misses)
+        self.misses.extend(misses)
+        self._pending[key] = {"fingerprint": fingerprint, "params": digest, "digests": digests, "videos": entry.get("videos", {})}
+        return misses
+
+    def record(self, slp_file: str, outputs: Dict[str, List[str]]) -> None:
+        """Record the files produced by converting some videos of `slp_file`, see `check()`.
+
+        Args:
+            slp_file: path to the *.slp file
+            outputs: dict mapping each converted video to the files which may have been produced for it; only
+                files which exist are recorded
+        """
+        key = os.path.abspath(slp_file)
+        pending = self._pending.pop(key)
+        # forget videos which are no longer part of the file
+        videos = {video: cached for video, cached in pending["videos"].items() if video in pending["digests"]}
+        for video, filenames in outputs.items():
+            videos[video] = {"digest": pending["digests"][video], "outputs": [fn for fn in filenames if os.path.exists(fn)]}
+
+        self._manifest["files"][key] = {"fingerprint": pending["fingerprint"], "params": pending["params"], "videos": videos}
+        self._recorded.append(key)
+
+    def merge(self, other: "ConversionCache") -> None:
+        """Merge the conversions recorded in `other`, e.g. a cache used by a worker process, into this cache.
+
+        Args:
+            other: cache of the same destination directory
+        """
+        for key in other._recorded:
+            self._manifest["files"][key] = other._manifest["files"][key]
+            self._recorded.append(key)
+        self.hits.extend(other.hits)
+        self.misses.extend(other.misses)
+
+    def save(self) -> None:
+        """Write the manifest, replacing the previous one atomically."""
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_filename, self.filename)
+
+    def report(self) -> str:
+        """Summarize the cache hits and misses.
+
+        Returns:
+            human readable summary
+        """
+        return f"Cache: {len(self.hits)} video(s) unchanged and skipped, {len(self.misses)} video(s) converted"
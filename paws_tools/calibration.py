@@ -0,0 +1,232 @@
+"""Calibration of pixel coordinates to physical units, computed for all videos in batched array operations.
+
+Each video is calibrated from the per-frame Euclidean distance between two calibration nodes, which are a known
+physical distance apart. For every video the median and median absolute deviation (MAD) of this distance are
+computed, along with the number of frames where both nodes were found. Videos whose median distance deviates
+strongly from that of the other videos are flagged as outliers.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from paws_tools.constants import DEFAULT_CHUNK_SIZE, DEFAULT_OUTLIER_THRESHOLD, InstancePolicy
+from paws_tools.slp_reader import FrameSelection, SlpReader
+
+# Columns of the calibration report, see `compute_calibration()`
+REPORT_COLUMNS = ["frames", "valid_frames", "median_px_dist", "mad_px_dist", "conv_factor", "robust_z", "outlier"]
+
+
+def calibration_distances(cal_coords: np.ndarray) -> np.ndarray:
+    """Compute the Euclidean distance between the two calibration nodes in each frame.
+
+    Args:
+        cal_coords: array of shape (frames, 2, 2) holding the (x, y) coordinates of the two calibration nodes
+
+    Returns:
+        array of shape (frames,), NaN where either node is missing
+    """
+    delta = cal_coords[:, 1, :] - cal_coords[:, 0, :]
+    return np.hypot(delta[:, 0], delta[:, 1])
+
+
+def grouped_median(codes: np.ndarray, values: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the median of `values` within each group, ignoring NaNs, with a single sort.
+
+    Args:
+        codes: integer array assigning each value to a group in [0, n_groups)
+        values: array of values, same shape as `codes`
+        n_groups: number of groups
+
+    Returns:
+        tuple of (counts, medians), each of shape (n_groups,), holding the number of non-NaN values and their
+        median (NaN for groups without any values) for each group
+    """
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    order = np.lexsort((values, codes))
+    values = values[order]
+
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    medians = np.full(n_groups, np.nan)
+    found = counts > 0
+    lo = starts[found] + (counts[found] - 1) // 2
+    hi = starts[found] + counts[found] // 2
+    medians[found] = (values[lo] + values[hi]) / 2
+    return counts, medians
+
+
+def compute_calibration(
+    videos: List[str],
+    video_codes: np.ndarray,
+    distances: np.ndarray,
+    true_dist: float,
+    outlier_threshold: float = DEFAULT_OUTLIER_THRESHOLD,
+) -> pd.DataFrame:
+    """Compute calibration statistics and conversion factors for all videos at once.
+
+    The conversion factor of a video is `true_dist` divided by the median distance between the calibration
+    nodes. A video is flagged as an outlier when the robust z-score of its median distance, relative to all
+    videos, exceeds `outlier_threshold`. The MAD used for the z-score is floored at 1% of the median, so that
+    negligible deviations between otherwise identical videos are not flagged.
+
+    Args:
+        videos: video filenames
+        video_codes: integer array of shape (frames,) indexing into `videos`
+        distances: array of shape (frames,) holding the distance between calibration nodes, see
+            `calibration_distances()`
+        true_dist: true physical distance between the calibration nodes
+        outlier_threshold: robust z-score above which a video is flagged as an outlier
+
+    Returns:
+        calibration report indexed by video, with columns `REPORT_COLUMNS`. `conv_factor` is NaN for videos
+        which could not be calibrated, i.e. where the calibration nodes were never both found
+    """
+    n_videos = len(videos)
+    frames = np.bincount(video_codes, minlength=n_videos)
+    valid_frames, medians = grouped_median(video_codes, distances, n_videos)
+    _, mads = grouped_median(video_codes, np.abs(distances - medians[video_codes]), n_videos)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factors = np.where(medians > 0, true_dist / medians, np.nan)
+
+    # robust z-score of each video's median distance, relative to all calibrated videos
+    robust_z = np.full(n_videos, np.nan)
+    calibrated = np.isfinite(factors)
+    if calibrated.any():
+        center = np.median(medians[calibrated])
+        scale = max(float(np.median(np.abs(medians[calibrated] - center))), 0.01 * center)
+        robust_z[calibrated] = 0.6745 * (medians[calibrated] - center) / scale
+
+    report = pd.DataFrame(
+        {
+            "frames": frames,
+            "valid_frames": valid_frames,
+            "median_px_dist": medians,
+            "mad_px_dist": mads,
+            "conv_factor": factors,
+            "robust_z": robust_z,
+            "outlier": np.abs(robust_z) > outlier_threshold,
+        },
+        index=pd.Index(videos, name="video"),
+    )
+    return report[REPORT_COLUMNS]
+
+
+def calibrate_dataframe(
+    df: pd.DataFrame, top_node: str, bot_node: str, true_dist: float, outlier_threshold: float = DEFAULT_OUTLIER_THRESHOLD
+) -> pd.DataFrame:
+    """Calibrate each video in a coordinate dataframe, see `compute_calibration()`.
+
+    Args:
+        df: dataframe of node coordinates, as produced by `node_positions_to_dataframe()`, which must
+            include the calibration nodes
+        top_node: node name of first calibration point
+        bot_node: node name of second calibration point
+        true_dist: true physical distance between `top_node` and `bot_node`
+        outlier_threshold: robust z-score above which a video is flagged as an outlier
+
+    Returns:
+        calibration report indexed by video, see `compute_calibration()`
+    """
+    video_level = df.index.names.index("video")
+    cal_coords = df[[(name, c) for name in (top_node, bot_node) for c in ("x", "y")]].to_numpy(dtype=np.float64).reshape(-1, 2, 2)
+    videos = list(df.index.levels[video_level])
+    report = compute_calibration(
+        videos, np.asarray(df.index.codes[video_level]), calibration_distances(cal_coords), true_dist, outlier_threshold
+    )
+    # only report videos which are present in the dataframe, levels may include unused values
+    return report[report["frames"] > 0]
+
+
+def calibrate_slp(
+    reader: SlpReader,
+    top_node: str,
+    bot_node: str,
+    true_dist: float,
+    outlier_threshold: float = DEFAULT_OUTLIER_THRESHOLD,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    instance_policy: InstancePolicy = "first",
+    videos: Optional[List[str]] = None,
+    frames: Optional[FrameSelection] = None,
+) -> pd.DataFrame:
+    """Calibrate each video of a *.slp file, reading only the calibration nodes, see `compute_calibration()`.
+
+    Args:
+        reader: reader of the *.slp file
+        top_node: node name of first calibration point
+        bot_node: node name of second calibration point
+        true_dist: true physical distance between `top_node` and `bot_node`
+        outlier_threshold: robust z-score above which a video is flagged as an outlier
+        chunk_size: maximum number of frames read at once
+        instance_policy: which predicted instances of each frame to calibrate from, see `SlpReader.read_instances()`
+        videos: filenames of the videos to calibrate, as listed in `SlpReader.videos`, or None for all videos.
+            Outliers are judged relative to these videos only
+        frames: if provided, videos are calibrated from the selected frames only
+
+    Returns:
+        calibration report indexed by video, see `compute_calibration()`
+    """
+    videos = reader.videos if videos is None else videos
+    video_codes = []
+    distances = []
+    for code, video in enumerate(videos):
+        for positions in reader.iter_instances(video, [top_node, bot_node], instance_policy, chunk_size, scores=False, frames=frames):
+            video_codes.append(np.full(len(positions.coords), code, dtype=np.int64))
+            distances.append(calibration_distances(positions.coords))
+
+    codes = np.concatenate(video_codes) if len(video_codes) > 0 else np.zeros(0, dtype=np.int64)
+    dists = np.concatenate(distances) if len(distances) > 0 else np.zeros(0)
+    report = compute_calibration(videos, codes, dists, true_dist, outlier_threshold)
+    # only report videos which have labeled frames, consistent with `calibrate_dataframe()`
+    return report[report["frames"] > 0]
+
+
+def conversion_factors(report: pd.DataFrame, warn: bool = True) -> Dict[str, Optional[float]]:
+    """Get the conversion factor of each video from a calibration report.
+
+    Args:
+        report: calibration report, see `compute_calibration()`
+        warn: if True, warn about videos which could not be calibrated, or were flagged as outliers
+
+    Returns:
+        dict mapping video filename to conversion factor, or None if it could not be determined for that video
+    """
+    factors: Dict[str, Optional[float]] = {}
+    for video, row in report.iterrows():
+        factors[video] = float(row["conv_factor"]) if np.isfinite(row["conv_factor"]) else None
+        if warn and factors[video] is None:
+            tqdm.write(f'WARNING: Unable to find coordinates for calibration nodes! Skipping calibration for video "{video}"')
+        elif warn and row["outlier"]:
+            tqdm.write(
+                f'WARNING: Calibration of video "{video}" is an outlier (median distance {row["median_px_dist"]:.2f}px, '
+                f'robust z-score {row["robust_z"]:.1f}), please check the calibration nodes'
+            )
+    return factors
+
+
+def get_calibration_report_filename(slp_file: str, dest_dir: str) -> str:
+    """Get the path of the calibration report for `slp_file`.
+
+    Args:
+        slp_file: path to the *.slp file
+        dest_dir: destination directory for the produced files
+
+    Returns:
+        path of the form `{dest_dir}/{basename of slp_file}.calibration.tsv`
+    """
+    return os.path.join(dest_dir, f"{os.path.splitext(os.path.basename(slp_file))[0]}.calibration.tsv")
+
+
+def write_calibration_report(report: pd.DataFrame, dest: str) -> None:
+    """Write a calibration report as a tab-separated values file.
+
+    Args:
+        report: calibration report, see `compute_calibration()`
+        dest: path of the file to write
+    """
+    report.to_csv(dest, sep="\t")
@@ -1,128 +1,789 @@
-"""CLI entry-point for paws-tools."""
+"""CLI entry-point for paws-tools.
 
+Only lightweight modules are imported here; the heavy dependencies (pandas, sleap_io, matplotlib, etc) are
+imported by each command when it runs, so that `--help` and `--version` respond quickly.
+"""
 
-import copy
 import os
-from typing import List
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple, cast
 
 import click
-import sleap_io
-from tqdm import tqdm
-from typing_extensions import Literal
-
-from paws_tools.slp_to_csv import (
-    convert_physical_units,
-    get_nodes_for_bodyparts,
-    invert_y_axis,
-    node_positions_to_dataframe,
-    plot_bodyparts_y_pos_over_time,
-    save_dataframe_to_grouped_csv,
+
+from paws_tools.constants import (
+    COMPRESSIONS,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_OUTLIER_THRESHOLD,
+    DEFAULT_PIPELINE_DEPTH,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_SETTLE_TIME,
+    FORMATS,
+    INSTANCE_POLICIES,
+    INTERPOLATIONS,
+    OVERVIEW_LAYOUTS,
+    PER_FRAME_POLICIES,
+    TEXT_FORMATS,
+    Compression,
+    DataFrameFormat,
+    InstancePolicy,
+    Interpolation,
+    OverviewLayout,
 )
-from paws_tools.util import click_monkey_patch_option_show_defaults
 
-# Show click option defaults
-click_monkey_patch_option_show_defaults()
+if TYPE_CHECKING:
+    from paws_tools.profiling import Metrics
+    from paws_tools.slp_reader import FrameSelection
+    from paws_tools.transforms import PostProcessing
 
 
-@click.group()
+# Show click option defaults
+@click.group(context_settings={"show_default": True})
 @click.version_option()
 def cli():
     """Toolbox for working with PAWS."""
     pass  # pylint: disable=unnecessary-pass
 
 
+def _parse_smooth(ctx: click.Context, param: click.Parameter, value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Parse the --smooth option, of the form `savgol:WINDOW,ORDER`, into a `(window, order)` tuple."""
+    if value is None or value == "none":
+        return None
+    method, _, args = value.partition(":")
+    try:
+        if method != "savgol":
+            raise ValueError(f"unknown smoothing method '{method}'")
+        window, order = (int(arg) for arg in args.split(","))
+    except ValueError as e:
+        raise click.BadParameter(f"expected 'savgol:WINDOW,ORDER', i.e. 'savgol:7,2', got '{value}' ({e})") from e
+    if window % 2 != 1 or not 0 <= order < window:
+        raise click.BadParameter(f"the window must be odd and greater than the polynomial order, got '{value}'")
+    return window, order
+
+
+def _parse_frame_range(ctx: click.Context, param: click.Parameter, value: Optional[str]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """Parse the --frame-range option, of the form `START:END`, either of which may be omitted, into a `(start, stop)` tuple."""
+    if value is None:
+        return None
+    start, sep, stop = value.partition(":")
+    try:
+        if sep != ":":
+            raise ValueError("missing ':'")
+        frame_range = (int(start) if start.strip() else None, int(stop) if stop.strip() else None)
+    except ValueError as e:
+        raise click.BadParameter(f"expected 'START:END', i.e. '1000:5000', '1000:' or ':5000', got '{value}' ({e})") from e
+    if any(bound is not None and bound < 0 for bound in frame_range):
+        raise click.BadParameter(f"frame indices must not be negative, got '{value}'")
+    if frame_range[1] is not None and frame_range[1] <= (frame_range[0] or 0):
+        raise click.BadParameter(f"the frame range must not be empty, got '{value}'")
+    return frame_range
+
+
+def _frame_selection_options(func):
+    """Decorator adding the --videos, --frame-range and --stride options selecting the data to read."""
+    options = [
+        click.option(
+            "--videos",
+            multiple=True,
+            help="Only read these videos, given by filename, basename or glob pattern (i.e. 'mouse_1*'). Defaults to all videos",
+        ),
+        click.option(
+            "--frame-range",
+            default=None,
+            callback=_parse_frame_range,
+            metavar="START:END",
+            help="Only read frames with an index from START up to, but excluding, END. Either may be omitted, i.e. '1000:'",
+        ),
+        click.option(
+            "--stride",
+            default=1,
+            type=click.IntRange(min=1),
+            help="Only read every K-th frame index, counting from the start of --frame-range, i.e. for a quick-look preview",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def _conversion_options(func):
+    """Decorator adding the options shared by the `slp-to-csv` and `batch` commands."""
+    options = [
+        click.option(
+            "-bp",
+            "--body-part",
+            default=["Toe"],
+            multiple=True,
+            help="Name of the body part(s) to extract. Also accepts glob patterns (i.e. 'Toe*'), regular expressions prefixed by "
+            "'re:' (i.e. 're:(Toe|Heel)'), and the special value 'all', which will select all bodyparts.",
+        ),
+        click.option(
+            "-ibp",
+            "--ignore-body-part",
+            multiple=True,
+            help="Name or pattern of body part(s) to ignore. These will be subtracted from the set specified by --body-part.",
+        ),
+        click.option(
+            "--instance-policy",
+            type=click.Choice(INSTANCE_POLICIES),
+            default="first",
+            help="Which predicted instances of each frame to extract: the 'first', the highest scoring ('best'), the highest "
+            "scoring of each 'track', or 'all'. Policies other than 'first' add point and instance score columns",
+        ),
+        click.option("--calibrate/--no-calibrate", default=True, help="Perform calibration to physical units"),
+        click.option("--cal-node1", default="Top_Box", help="Name of calibration point one"),
+        click.option("--cal-node2", default="Bot_Box", help="Name of calibration point two"),
+        click.option("--cal-dist", default=1.0, type=float, help="Physical distance between --cal-node1 and --cal-node2"),
+        click.option(
+            "--cal-outlier-threshold",
+            default=DEFAULT_OUTLIER_THRESHOLD,
+            type=float,
+            help="Robust z-score of a video's calibration distance, relative to the other videos, above which it is flagged as an outlier",
+        ),
+        click.option("--frame-height", default=512, type=int, help="Pixel height of video frames, used to invert the y-axis"),
+        click.option(
+            "--interpolate",
+            type=click.Choice(["none"] + INTERPOLATIONS),
+            default="none",
+            help="Fill missing points by 'linear' or cubic 'spline' interpolation over frames, before saving and plotting",
+        ),
+        click.option(
+            "--max-gap",
+            default=None,
+            type=click.IntRange(min=1),
+            help="Longest gap, in frames, filled by --interpolate; longer gaps are left missing. Defaults to filling every gap",
+        ),
+        click.option(
+            "--smooth",
+            default=None,
+            callback=_parse_smooth,
+            metavar="savgol:WINDOW,ORDER",
+            help="Smooth traces with a Savitzky-Golay filter of an odd WINDOW of frames and polynomial ORDER, after --interpolate",
+        ),
+        click.option(
+            "--format",
+            type=click.Choice(FORMATS),
+            default="tsv",
+            help="Format of the resulting files: 'tsv' gives tab-separated values, 'csv' gives comma-separated values, "
+            "'parquet', 'feather' and 'npz' give binary columnar files which are smaller and faster to read back",
+        ),
+        click.option(
+            "--compression",
+            type=click.Choice(["none"] + COMPRESSIONS),
+            default="none",
+            help="Compression of 'tsv' and 'csv' files, i.e. 'gzip' gives *.tsv.gz files. 'zstd' requires zstandard",
+        ),
+        click.option(
+            "--dest-dir",
+            default=os.getcwd(),
+            type=click.Path(file_okay=False),
+            help="Directory where resulting files should be saved",
+        ),
+        click.option(
+            "--store/--no-store",
+            default=False,
+            help="Also save all videos to memory-mapped coordinate stores (*.px.coords, *.mm.coords) for fast random access",
+        ),
+        click.option("--plot/--no-plot", default=True, help="Plot traces of the bodyparts"),
+        click.option(
+            "--overview",
+            type=click.Choice(["none"] + OVERVIEW_LAYOUTS),
+            default="none",
+            help="Also plot the traces of every video of a file to a single overview: a multi-page 'pdf' with a page per video, "
+            "or a single 'grid' image (png) with a panel per video",
+        ),
+        click.option(
+            "--skip-unchanged-plots/--always-plot",
+            default=True,
+            help="Skip re-rendering (png) plots which already exist and were made from identical data",
+        ),
+        click.option(
+            "--chunk-size", default=DEFAULT_CHUNK_SIZE, type=click.IntRange(min=1), help="Number of frames per chunk when using --streaming"
+        ),
+        click.option(
+            "--pipeline",
+            is_flag=True,
+            help="Overlap reading, transforming, writing and plotting of videos (or chunks, with --streaming) in background threads",
+        ),
+        click.option(
+            "--pipeline-depth",
+            default=DEFAULT_PIPELINE_DEPTH,
+            type=click.IntRange(min=1),
+            help="Number of chunks which may wait between stages of --pipeline, bounding the memory used",
+        ),
+        click.option(
+            "--force",
+            is_flag=True,
+            help="Convert every video, even those whose data and parameters are unchanged since the last conversion into --dest-dir",
+        ),
+        click.option("--profile", is_flag=True, help="Print the time, throughput and peak memory of each stage of the conversion"),
+        click.option(
+            "--metrics-file",
+            default=None,
+            type=click.Path(dir_okay=False),
+            help="Path of a JSON file to save the per-stage, per-video metrics of the conversion to",
+        ),
+        click.option(
+            "--cprofile-dir",
+            default=None,
+            type=click.Path(file_okay=False),
+            help="Directory to save cProfile statistics of each stage to, one *.prof file per stage and video",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def _check_compression(compression: str, format: DataFrameFormat) -> Optional[Compression]:
+    """Validate the --compression option against --format, returning the compression or None if uncompressed."""
+    if compression == "none":
+        return None
+    if format not in TEXT_FORMATS:
+        raise click.BadParameter(f"only [{', '.join(TEXT_FORMATS)}] files may be compressed, not '{format}'", param_hint="--compression")
+    return cast(Compression, compression)
+
+
+def _check_store(store: bool, instance_policy: InstancePolicy) -> bool:
+    """Validate the --store option against --instance-policy, as coordinate stores hold one row per frame."""
+    if store and instance_policy not in PER_FRAME_POLICIES:
+        raise click.BadParameter(
+            f"coordinate stores hold one row per frame, use an --instance-policy of [{', '.join(PER_FRAME_POLICIES)}]", param_hint="--store"
+        )
+    return store
+
+
+def _overview_layout(overview: str) -> Optional[OverviewLayout]:
+    """Get the layout requested by the --overview option, or None if no overview is requested."""
+    return None if overview == "none" else cast(OverviewLayout, overview)
+
+
+def _make_frame_selection(frame_range: Optional[Tuple[Optional[int], Optional[int]]], stride: int) -> Optional["FrameSelection"]:
+    """Make the `FrameSelection` requested by the --frame-range and --stride options, or None to read every frame."""
+    if frame_range is None and stride == 1:
+        return None
+    from paws_tools.slp_reader import FrameSelection  # pylint: disable=import-outside-toplevel
+
+    start, stop = frame_range if frame_range is not None else (None, None)
+    return FrameSelection(start=start, stop=stop, stride=stride)
+
+
+def _select_videos(available: Iterable[str], patterns: Tuple[str, ...]) -> Optional[List[str]]:
+    """Select the videos requested by the --videos option from `available`, or None if every video is requested."""
+    if len(patterns) == 0:
+        return None
+    from paws_tools.slp_reader import select_videos  # pylint: disable=import-outside-toplevel
+
+    try:
+        return select_videos(available, patterns)
+    except KeyError as e:
+        raise click.BadParameter(str(e.args[0]), param_hint="--videos") from e
+
+
+def _check_not_empty(n_rows: int, filename: str) -> None:
+    """Check the --videos, --frame-range and --stride options selected any rows of `filename`."""
+    if n_rows == 0:
+        raise click.UsageError(f'No frames of "{filename}" match the selected --videos, --frame-range and --stride')
+
+
+def _make_post_processing(interpolate: str, max_gap: Optional[int], smooth: Optional[Tuple[int, int]]) -> Optional["PostProcessing"]:
+    """Make the `PostProcessing` requested by the --interpolate, --max-gap and --smooth options, or None."""
+    if max_gap is not None and interpolate == "none":
+        raise click.BadParameter("--max-gap requires --interpolate", param_hint="--max-gap")
+    if interpolate == "none" and smooth is None:
+        return None
+    from paws_tools.transforms import PostProcessing  # pylint: disable=import-outside-toplevel
+
+    return PostProcessing(interpolate=None if interpolate == "none" else cast(Interpolation, interpolate), max_gap=max_gap, smooth=smooth)
+
+
+def _make_metrics(profile: bool, metrics_file: Optional[str], cprofile_dir: Optional[str]) -> Optional["Metrics"]:
+    """Make the `Metrics` requested by the --profile, --metrics-file and --cprofile-dir options, or None."""
+    if not (profile or metrics_file or cprofile_dir):
+        return None
+    from paws_tools.profiling import Metrics  # pylint: disable=import-outside-toplevel
+
+    return Metrics(cprofile_dir)
+
+
+def _finish_metrics(metrics: Optional["Metrics"], profile: bool, metrics_file: Optional[str]) -> None:
+    """Report and save the metrics made by `_make_metrics()`, if any."""
+    if metrics is None:
+        return
+    metrics.dump_profiles()
+    if metrics_file is not None:
+        metrics.write(metrics_file)
+    if profile:
+        print()
+        print(metrics.report())
+
+
 @cli.command(name="slp-to-csv", short_help="Convert SLEAP .slp file to PAWS importable csv files")
 @click.argument("slp_file", type=click.Path(exists=True, dir_okay=False))
+@_conversion_options
+@_frame_selection_options
 @click.option(
-    "-bp",
-    "--body-part",
-    default=["Toe"],
-    multiple=True,
-    help="Name of the body part(s) to extract. Also accepts special value 'all', which will select all bodyparts.",
+    "--streaming/--no-streaming",
+    default=False,
+    help="Read the *.slp file in chunks of frames rather than loading it entirely, keeping memory usage bounded",
 )
 @click.option(
-    "-ibp",
-    "--ignore-body-part",
-    multiple=True,
-    help="Name of body part(s) to ignore. These will be subtracted from the set specified by --body-part.",
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes; videos are converted (and plotted) in parallel when greater than 1",
 )
-@click.option("--calibrate/--no-calibrate", default=True, help="Perform calibration to physical units")
-@click.option("--cal-node1", default="Top_Box", help="Name of calibration point one")
-@click.option("--cal-node2", default="Bot_Box", help="Name of calibration point two")
-@click.option("--cal-dist", default=1.0, type=float, help="Physical distance between --cal-node1 and --cal-node2")
-@click.option("--frame-height", default=512, type=int, help="Pixel height of video frames, used to invert the y-axis")
-@click.option(
-    "--format",
-    type=click.Choice(["tsv", "csv"]),
-    default="tsv",
-    help="Format of the resulting files: 'tsv' gives tab-separated values, 'csv' gives comma-separated values",
-)
-@click.option(
-    "--dest-dir",
-    default=os.getcwd(),
-    type=click.Path(file_okay=False),
-    help="Directory where resulting files should be saved",
-)
-@click.option("--plot/--no-plot", default=True, help="Plot traces of the bodyparts")
 def slp_to_csv(
     slp_file: str,
     body_part: List[str],
     ignore_body_part: List[str],
+    instance_policy: InstancePolicy,
     calibrate: bool,
     cal_node1: str,
     cal_node2: str,
     cal_dist: float,
+    cal_outlier_threshold: float,
     frame_height: int,
-    format: Literal["tsv", "csv"],
+    interpolate: str,
+    max_gap: Optional[int],
+    smooth: Optional[Tuple[int, int]],
+    format: DataFrameFormat,
+    compression: str,
     dest_dir: str,
+    store: bool,
     plot: bool,
+    overview: str,
+    skip_unchanged_plots: bool,
+    chunk_size: int,
+    pipeline: bool,
+    pipeline_depth: int,
+    force: bool,
+    profile: bool,
+    metrics_file: Optional[str],
+    cprofile_dir: Optional[str],
+    videos: Tuple[str, ...],
+    frame_range: Optional[Tuple[Optional[int], Optional[int]]],
+    stride: int,
+    streaming: bool,
+    jobs: int,
 ):
     """Given a SLEAP *.slp file, extract the coordinates for the body-part(s) specified by \
 --body-part and then, for each video in the dataset, save a delimiter-separated-values (TSV/CSV) file, and generate trace plot.
 
     Add body-parts to be extracted through the -bp or --body-part options. This also accepts a special
     value, 'all', which will use all body-parts found in the slp file. Body-parts can be removed from the
-    final set through the use of -ibp or --ignore-body-part.
+    final set through the use of -ibp or --ignore-body-part. Both options also accept glob patterns, i.e. -bp 'Toe*',
+    and regular expressions prefixed by 're:', i.e. -ibp 're:.*_Box', matched against the nodes of every skeleton.
+
+    By default only the first predicted instance of each frame is extracted. For recordings with many animals
+    (or paws), use --instance-policy to extract the highest scoring instance of each frame ('best'), of each
+    track ('track'), or every instance ('all'). The latter two add a 'track' or 'instance' index column, and all
+    three add the score of each point and instance. Plots then show one trace per instance.
 
     Additionally, this command will convert from pixel units to physical units given proper
     calibration information. See options --cal-*. Use --calibrate (default) to turn on calibration
     or --no-calibrate to turn off calibration. If calibration is turned on, both pixel-unit and physical-unit
     variants of the data will be saved, otherwise only pixel-unit data will be saved.
 
+    Each video is calibrated from the median Euclidean distance between the calibration points. A calibration
+    report (*.calibration.tsv) listing the distance statistics, valid frame counts and conversion factor of each
+    video is saved alongside the data, and videos whose distance is an outlier relative to the other videos
+    are flagged (see --cal-outlier-threshold).
+
     Use --format to specify the format of the resulting data. 'tsv' for tab-separated values,
-    or 'csv' for comma-separated values.
+    or 'csv' for comma-separated values. Binary 'parquet', 'feather' (both require pyarrow) or 'npz' files
+    preserve the same index and columns, and are much smaller and faster to load. Text files may be compressed
+    with --compression, which is done in background threads while the next rows are formatted.
 
     The y-axis may also be inverted given --frame-height.
+
+    Missing points may be filled with --interpolate, up to gaps of --max-gap frames, and traces smoothed with
+    --smooth (i.e. --smooth savgol:7,2), before the data is converted to physical units, saved and plotted. Both need whole
+    traces, so with --streaming each video is read at once rather than in chunks of --chunk-size frames.
+
+    Use --store to also save the coordinates of every video to a single memory-mapped coordinate store per unit
+    (i.e. *.px.coords), from which any range of frames of a video and node can be read without parsing, see
+    `paws_tools.coord_store.CoordinateStore`. Stores may be given to plot-trace and features in place of TSV files.
+
+    For very large *.slp files, use --streaming to read and convert the data in chunks of --chunk-size
+    frames, rather than loading the entire dataset into memory. Use --jobs to convert videos in parallel
+    across multiple processes, each reading only the data for the videos it has been assigned.
+
+    Use --videos, --frame-range and --stride to only extract some videos (i.e. --videos 'mouse_1*'), a range of
+    their frames (i.e. --frame-range 1000:5000), or every K-th frame of them (i.e. --stride 10), for a quick-look
+    preview of a long recording. Unselected frames are never read from SLP_FILE, and calibration uses only the
+    selected frames.
+
+    On slow (i.e. network) storage, use --pipeline so that reading the next video overlaps with transforming
+    this one and writing and plotting the previous ones. At most --pipeline-depth videos (or chunks, with
+    --streaming) wait between each stage, bounding memory. Combined with --jobs, each process runs its own pipeline.
+
+    Plots are rendered from the data in memory, in parallel when using --jobs, and long traces are reduced
+    to their visual envelope. Existing plots made from identical data are not re-rendered, unless
+    --always-plot is given. Use --overview to also plot every video of the file to a single multi-page PDF
+    (*.px.overview.pdf) or grid image (*.px.overview.png), for reviewing a whole experiment at a glance.
+
+    A manifest of each conversion is kept in --dest-dir, and videos whose data and parameters are unchanged
+    since a previous conversion are skipped entirely. Use --force to convert every video regardless.
+
+    To find where time is spent, use --profile to print the wall time, CPU time, throughput and peak memory of
+    each stage (reading, extraction, calibration, writing, plotting, etc), and --metrics-file to save them, per
+    video, as JSON. Use --cprofile-dir to also save cProfile statistics of each stage, viewable with snakeviz.
     """
+    from paws_tools.cache import ConversionCache  # pylint: disable=import-outside-toplevel
+    from paws_tools.slp_to_csv import convert_slp_file  # pylint: disable=import-outside-toplevel
+
     print()  # give some breathing room in the console
 
-    # parse the provided *.slp file
-    print("Loading SLEAP data (this may take a few minutes)....")
-    labels = sleap_io.load_slp(slp_file)
-    print(" -> Done!\n")
+    metrics = _make_metrics(profile, metrics_file, cprofile_dir)
+    cache = ConversionCache(dest_dir, force=force)
+    convert_slp_file(
+        slp_file,
+        dest_dir,
+        body_part,
+        ignore_body_part,
+        frame_height,
+        calibration=(cal_node1, cal_node2, cal_dist) if calibrate else None,
+        outlier_threshold=cal_outlier_threshold,
+        instance_policy=instance_policy,
+        format=format,
+        compression=_check_compression(compression, format),
+        store=_check_store(store, instance_policy),
+        post_processing=_make_post_processing(interpolate, max_gap, smooth),
+        plot=plot,
+        overview=_overview_layout(overview),
+        skip_unchanged_plots=skip_unchanged_plots,
+        streaming=streaming,
+        chunk_size=chunk_size,
+        pipeline_depth=pipeline_depth if pipeline else None,
+        videos=list(videos) if len(videos) > 0 else None,
+        frames=_make_frame_selection(frame_range, stride),
+        jobs=jobs,
+        cache=cache,
+        verbose=True,
+        metrics=metrics,
+    )
+    cache.save()
+    print(cache.report())
+    _finish_metrics(metrics, profile, metrics_file)
+
+
+@cli.command(name="batch", short_help="Convert many SLEAP .slp files to PAWS importable csv files")
+@click.argument("slp_files", nargs=-1, required=True)
+@_conversion_options
+@_frame_selection_options
+@click.option(
+    "--streaming/--no-streaming",
+    default=True,
+    help="Read each *.slp file in chunks of frames rather than loading it entirely, keeping memory usage bounded",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes; files are converted in parallel when greater than 1",
+)
+@click.option(
+    "--max-tasks-per-worker",
+    default=10,
+    type=click.IntRange(min=1),
+    help="Number of files a worker process converts before it is replaced, releasing any memory it holds",
+)
+@click.option(
+    "--summary-file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Path of the TSV summary table of the batch. Defaults to batch_summary.tsv in --dest-dir",
+)
+def batch(
+    slp_files: List[str],
+    body_part: List[str],
+    ignore_body_part: List[str],
+    instance_policy: InstancePolicy,
+    calibrate: bool,
+    cal_node1: str,
+    cal_node2: str,
+    cal_dist: float,
+    cal_outlier_threshold: float,
+    frame_height: int,
+    interpolate: str,
+    max_gap: Optional[int],
+    smooth: Optional[Tuple[int, int]],
+    format: DataFrameFormat,
+    compression: str,
+    dest_dir: str,
+    store: bool,
+    plot: bool,
+    overview: str,
+    skip_unchanged_plots: bool,
+    chunk_size: int,
+    pipeline: bool,
+    pipeline_depth: int,
+    force: bool,
+    profile: bool,
+    metrics_file: Optional[str],
+    cprofile_dir: Optional[str],
+    videos: Tuple[str, ...],
+    frame_range: Optional[Tuple[Optional[int], Optional[int]]],
+    stride: int,
+    streaming: bool,
+    jobs: int,
+    max_tasks_per_worker: int,
+    summary_file: Optional[str],
+):
+    """Convert many SLEAP *.slp files in one invocation, equivalent to running slp-to-csv on each file.
+
+    SLP_FILES may be any number of *.slp files, directories (searched recursively for *.slp files) or glob
+    patterns, such as "experiments/**/*.slp". All results are saved to --dest-dir.
+
+    Files are converted in parallel by --jobs worker processes, each of which converts many files, avoiding the
+    start-up cost of a new process per file. By default files are read in chunks (see --streaming), which keeps
+    the memory used by each worker bounded. A file which fails to convert is reported, and the batch continues.
+
+    At the end, a summary table with the timing, number of frames and videos, and any failure of each file
+    is printed and saved to --summary-file.
+
+    Use --profile, --metrics-file and --cprofile-dir to measure each stage of the conversions, as for slp-to-csv.
+    cProfile statistics are saved to a sub-directory of --cprofile-dir per file.
+    """
+    from paws_tools.batch import batch_convert, find_slp_files  # pylint: disable=import-outside-toplevel
+
+    try:
+        files = find_slp_files(slp_files)
+    except (FileNotFoundError, ValueError) as e:
+        raise click.BadParameter(str(e), param_hint="SLP_FILES") from e
+
+    metrics = _make_metrics(profile, metrics_file, cprofile_dir)
+    summary = batch_convert(
+        files,
+        dest_dir,
+        jobs=jobs,
+        max_tasks_per_worker=max_tasks_per_worker,
+        force=force,
+        metrics=metrics,
+        body_parts=body_part,
+        ignore_body_parts=ignore_body_part,
+        frame_height=frame_height,
+        calibration=(cal_node1, cal_node2, cal_dist) if calibrate else None,
+        outlier_threshold=cal_outlier_threshold,
+        instance_policy=instance_policy,
+        format=format,
+        compression=_check_compression(compression, format),
+        store=_check_store(store, instance_policy),
+        post_processing=_make_post_processing(interpolate, max_gap, smooth),
+        plot=plot,
+        overview=_overview_layout(overview),
+        skip_unchanged_plots=skip_unchanged_plots,
+        streaming=streaming,
+        chunk_size=chunk_size,
+        pipeline_depth=pipeline_depth if pipeline else None,
+        videos=list(videos) if len(videos) > 0 else None,
+        frames=_make_frame_selection(frame_range, stride),
+    )
+
+    summary_file = summary_file or os.path.join(dest_dir, "batch_summary.tsv")
+    summary.to_csv(summary_file, sep="\t", index=False)
+
+    print()
+    print(summary.drop(columns="error").to_string(index=False))
+    n_failed = int((summary["status"] != "ok").sum())
+    print(
+        f"\nConverted {len(summary) - n_failed} of {len(summary)} file(s) in {summary['seconds'].sum():.1f}s; summary saved to {summary_file}"
+    )
+    _finish_metrics(metrics, profile, metrics_file)
+    if n_failed > 0:
+        raise click.ClickException(f"{n_failed} file(s) failed to convert, see {summary_file}")
+
+
+@cli.command(name="watch", short_help="Convert SLEAP .slp files as they are written to a directory")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@_conversion_options
+@_frame_selection_options
+@click.option(
+    "--streaming/--no-streaming",
+    default=True,
+    help="Read each *.slp file in chunks of frames rather than loading it entirely, keeping memory usage bounded",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes; files are converted in parallel when greater than 1",
+)
+@click.option(
+    "--max-tasks-per-worker",
+    default=10,
+    type=click.IntRange(min=1),
+    help="Number of files a worker process converts before it is replaced, releasing any memory it holds",
+)
+@click.option("--poll-interval", default=DEFAULT_POLL_INTERVAL, type=click.FloatRange(min=0.1), help="Seconds between scans of DIRECTORY")
+@click.option(
+    "--settle-time",
+    default=DEFAULT_SETTLE_TIME,
+    type=click.FloatRange(min=0),
+    help="Seconds a *.slp file must be left unchanged, i.e. finished being written, before it is converted",
+)
+@click.option(
+    "--state-file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Path of the file recording which files have been converted. Defaults to .paws-tools-watch.json in --dest-dir",
+)
+@click.option("--once", is_flag=True, help="Exit once every *.slp file found has been converted, rather than watching indefinitely")
+def watch(
+    directory: str,
+    body_part: List[str],
+    ignore_body_part: List[str],
+    instance_policy: InstancePolicy,
+    calibrate: bool,
+    cal_node1: str,
+    cal_node2: str,
+    cal_dist: float,
+    cal_outlier_threshold: float,
+    frame_height: int,
+    interpolate: str,
+    max_gap: Optional[int],
+    smooth: Optional[Tuple[int, int]],
+    format: DataFrameFormat,
+    compression: str,
+    dest_dir: str,
+    store: bool,
+    plot: bool,
+    overview: str,
+    skip_unchanged_plots: bool,
+    chunk_size: int,
+    pipeline: bool,
+    pipeline_depth: int,
+    force: bool,
+    profile: bool,
+    metrics_file: Optional[str],
+    cprofile_dir: Optional[str],
+    videos: Tuple[str, ...],
+    frame_range: Optional[Tuple[Optional[int], Optional[int]]],
+    stride: int,
+    streaming: bool,
+    jobs: int,
+    max_tasks_per_worker: int,
+    poll_interval: float,
+    settle_time: float,
+    state_file: Optional[str],
+    once: bool,
+):
+    """Watch DIRECTORY, converting *.slp files written to it (or its sub-directories) as for slp-to-csv.
+
+    DIRECTORY is scanned every --poll-interval seconds. New or modified *.slp files are converted once they have
+    been left unchanged for --settle-time seconds, so files still being written by SLEAP are not read. Up to --jobs
+    files are converted at once, by worker processes as for the batch command.
 
-    # get the nodes to operate upon
-    nodes = get_nodes_for_bodyparts(labels, body_part)
-    ignore_nodes = get_nodes_for_bodyparts(labels, ignore_body_part)
-    nodes = sorted(list(set(nodes) - set(ignore_nodes)), key=lambda n: n.name)  # subtract any nodes the user wanted to ignore
+    The files converted, and any which failed, are recorded in --state-file, so that after a restart only files
+    which are new or were modified in the meantime are converted. A failed file is retried once it is modified.
+    Use --force to convert every file again.
 
-    # convert labels coords to physical units
-    labels = invert_y_axis(labels, frame_height)
-    coords = node_positions_to_dataframe(labels, nodes)
-    csv_files = save_dataframe_to_grouped_csv(coords, "video", dest_dir, suffix="px", format=format)
+    Stop watching with Ctrl+C; conversions which were interrupted are redone when next watched. Use --once to
+    exit after converting the files already in DIRECTORY, i.e. when run periodically.
+    """
+    from paws_tools.watch import watch_directory  # pylint: disable=import-outside-toplevel
 
-    if plot:
-        for csv_file in tqdm(csv_files, desc="Generating Plots (non-calibrated)", leave=False):
-            plot_bodyparts_y_pos_over_time(csv_file, dest_dir, nodes, suffix="px")
+    metrics = _make_metrics(profile, metrics_file, cprofile_dir)
+    print(f'Watching "{directory}" for *.slp files' + ("" if once else ", press Ctrl+C to stop"))
+    try:
+        watch_directory(
+            directory,
+            dest_dir,
+            jobs=jobs,
+            max_tasks_per_worker=max_tasks_per_worker,
+            poll_interval=poll_interval,
+            settle_time=settle_time,
+            state_file=state_file,
+            once=once,
+            force=force,
+            metrics=metrics,
+            body_parts=body_part,
+            ignore_body_parts=ignore_body_part,
+            frame_height=frame_height,
+            calibration=(cal_node1, cal_node2, cal_dist) if calibrate else None,
+            outlier_threshold=cal_outlier_threshold,
+            instance_policy=instance_policy,
+            format=format,
+            compression=_check_compression(compression, format),
+            store=_check_store(store, instance_policy),
+            post_processing=_make_post_processing(interpolate, max_gap, smooth),
+            plot=plot,
+            overview=_overview_layout(overview),
+            skip_unchanged_plots=skip_unchanged_plots,
+            streaming=streaming,
+            chunk_size=chunk_size,
+            pipeline_depth=pipeline_depth if pipeline else None,
+            videos=list(videos) if len(videos) > 0 else None,
+            frames=_make_frame_selection(frame_range, stride),
+        )
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    _finish_metrics(metrics, profile, metrics_file)
 
-    if calibrate:
-        labels = convert_physical_units(copy.deepcopy(labels), cal_node1, cal_node2, cal_dist)
-        coords = node_positions_to_dataframe(labels, nodes)
-        csv_files = save_dataframe_to_grouped_csv(coords, "video", dest_dir, suffix="mm", format=format)
 
-        if plot:
-            for csv_file in tqdm(csv_files, desc="Generating Plots (calibrated)", leave=False):
-                plot_bodyparts_y_pos_over_time(csv_file, dest_dir, nodes, suffix="mm")
+@cli.command(name="features", short_help="Extract PAWS behavioral features from paw trajectories")
+@click.argument("input_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("-bp", "--body-part", default="Toe", help="Name of the body part (i.e. the paw) whose trajectory is analysed")
+@click.option("--calibrate/--no-calibrate", default=True, help="Perform calibration to physical units, for *.slp input files")
+@click.option("--cal-node1", default="Top_Box", help="Name of calibration point one")
+@click.option("--cal-node2", default="Bot_Box", help="Name of calibration point two")
+@click.option("--cal-dist", default=1.0, type=float, help="Physical distance between --cal-node1 and --cal-node2")
+@click.option("--frame-height", default=512, type=int, help="Pixel height of video frames, used to invert the y-axis of *.slp input files")
+@click.option("--fps", default=4000.0, type=float, help="Frame rate of the videos, in frames per second")
+@click.option("--window-filter-size", default=0.03, type=float, help="Length of the filter used to smooth trajectories, in seconds")
+@click.option("--window-filter-order", default=2, type=int, help="Polynomial order of the Savitzky-Golay filters")
+@click.option("--velocity-filter-size", default=0.02, type=float, help="Length of the filter used to compute velocities, in seconds")
+@click.option("--shake-filter-size", default=0.05, type=float, help="Length of the filter used to detect shakes, in seconds")
+@click.option(
+    "--dest-file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Path of the resulting TSV file. Defaults to {name of INPUT_FILE}.features.tsv in the current directory",
+)
+def features(
+    input_file: str,
+    body_part: str,
+    calibrate: bool,
+    cal_node1: str,
+    cal_node2: str,
+    cal_dist: float,
+    frame_height: int,
+    fps: float,
+    window_filter_size: float,
+    window_filter_order: int,
+    velocity_filter_size: float,
+    shake_filter_size: float,
+    dest_file: Optional[str],
+):
+    """Extract PAWS behavioral features for each video in INPUT_FILE, and save them as a TSV file.
+
+    INPUT_FILE may be a SLEAP *.slp file, from which coordinates are extracted, y-inverted and calibrated the
+    same as slp-to-csv, or a file previously produced by slp-to-csv (in any --format or --compression).
+
+    Each video is a trial. The trajectory of --body-part is gap-filled with a cubic spline and smoothed, and
+    split at the first peak of the paw height. For the pre-peak and post-peak phases, the maximum height,
+    maximum x and y velocities and distance traveled are computed, along with the number and duration of
+    paw shakes after the peak. Parameters mirror those of the PAWS R package.
+    """
+    from paws_tools.dataframe_io import split_compression  # pylint: disable=import-outside-toplevel
+    from paws_tools.features import FeatureParameters, extract_features, load_coordinates  # pylint: disable=import-outside-toplevel
+
+    params = FeatureParameters(
+        fps=fps,
+        window_filter_size=window_filter_size,
+        window_filter_order=window_filter_order,
+        velocity_filter_size=velocity_filter_size,
+        shake_filter_size=shake_filter_size,
+    )
+    calibration = (cal_node1, cal_node2, cal_dist) if calibrate else None
+    df = load_coordinates(input_file, body_part, frame_height=frame_height, calibration=calibration)
+    result = extract_features(df, body_part, params)
+
+    dest_file = dest_file or f"{os.path.splitext(os.path.basename(split_compression(input_file)[0]))[0]}.features.tsv"
+    result.to_csv(dest_file, sep="\t")
+    print(f"Saved features of {len(result)} video(s) to {dest_file}")
 
 
 @cli.command(name="plot-trace", short_help="Plot slp_csv file to body part trace graph png file")
@@ -134,12 +795,68 @@ def slp_to_csv(
     type=click.Path(file_okay=False),
     help="Directory where resulting plots should be saved",
 )
-def plot_trace(slp_csv: str, dest_dir: str, body_part: List[str]):
-    """Given a str slp_csv file name and destination directionry filename (dest_dir), and spicified by body-part -bp.
+@click.option(
+    "--overview",
+    type=click.Choice(["none"] + OVERVIEW_LAYOUTS),
+    default="none",
+    help="Plot every video to a single overview rather than a file per video: a multi-page 'pdf', or a 'grid' image (png)",
+)
+@_frame_selection_options
+def plot_trace(
+    slp_csv: str,
+    dest_dir: str,
+    body_part: List[str],
+    overview: str,
+    videos: Tuple[str, ...],
+    frame_range: Optional[Tuple[Optional[int], Optional[int]]],
+    stride: int,
+):
+    """Given a str slp_csv file name (in any format written by slp-to-csv) and destination directionry filename (dest_dir), and spicified by body-part -bp.
 
     Save a png file named f"{video_name}_{body_part}_ycord_vs_time.png" trace graph and saved to destination directory.
+
+    SLP_CSV may also be a coordinate store (*.coords) written by slp-to-csv --store, in which case only the
+    selected body-parts are read from the store, and every video in the store is plotted.
+
+    With --overview, every video in SLP_CSV is instead plotted to a single file named after SLP_CSV, i.e.
+    {name of SLP_CSV}.overview.pdf, with a page (or, for 'grid', a panel) per video.
+
+    Use --videos, --frame-range and --stride to only plot some videos, or a range or subsample of their frames,
+    i.e. --frame-range 0:60000 --stride 10 for a quick look at the first minute of a long recording. From a
+    coordinate store, only the selected videos and frame range are read.
     """
-    plot_bodyparts_y_pos_over_time(slp_csv, dest_dir, body_part)
+    from paws_tools.coord_store import STORE_EXTENSION, CoordinateStore  # pylint: disable=import-outside-toplevel
+    from paws_tools.dataframe_io import read_dataframe, split_compression  # pylint: disable=import-outside-toplevel
+    from paws_tools.extraction import select_frames  # pylint: disable=import-outside-toplevel
+    from paws_tools.plotting import (  # pylint: disable=import-outside-toplevel
+        get_overview_filename,
+        plot_bodyparts_y_pos_over_time,
+        plot_grouped_bodyparts_y_pos_over_time,
+        plot_overview,
+    )
+
+    layout = _overview_layout(overview)
+    frames = _make_frame_selection(frame_range, stride)
+    if slp_csv.lower().endswith(f".{STORE_EXTENSION}"):
+        store = CoordinateStore(slp_csv)
+        selected = _select_videos(sorted(store.videos), videos)
+        start, stop = (frames.start, frames.stop) if frames is not None else (None, None)
+        df = select_frames(store.to_dataframe(videos=selected, start_frame=start, stop_frame=stop, nodes=body_part), frames=frames)
+        _check_not_empty(len(df), slp_csv)
+        if layout is not None:
+            dest = get_overview_filename(slp_csv[: -len(STORE_EXTENSION) - 1], dest_dir, store.units, layout)
+            print(f"Saved overview to {plot_overview(df, dest, list(body_part), layout=layout)}")
+        else:
+            plot_grouped_bodyparts_y_pos_over_time(df, dest_dir, list(body_part), suffix=store.units)
+    else:
+        df = read_dataframe(slp_csv)
+        df = select_frames(df, _select_videos(df.index.unique(level="video"), videos), frames)
+        _check_not_empty(len(df), slp_csv)
+        if layout is not None:
+            dest = get_overview_filename(split_compression(slp_csv)[0], dest_dir, layout=layout)
+            print(f"Saved overview to {plot_overview(df, dest, list(body_part), layout=layout)}")
+        else:
+            plot_bodyparts_y_pos_over_time(df, dest_dir, body_part)
 
 
 if __name__ == "__main__":
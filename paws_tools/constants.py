@@ -0,0 +1,52 @@
+"""Constants shared across paws-tools.
+
+This module must remain cheap to import, as it is imported by the CLI before any command runs.
+"""
+
+from typing_extensions import Literal
+
+DataFrameFormat = Literal["tsv", "csv", "parquet", "feather", "npz"]
+
+# Supported formats, which double as file extensions
+TEXT_FORMATS = ["tsv", "csv"]
+BINARY_FORMATS = ["parquet", "feather", "npz"]
+FORMATS = TEXT_FORMATS + BINARY_FORMATS
+
+# Default number of frames to read per chunk
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Default threshold on the robust z-score of a video's median calibration distance, above which it is an outlier
+DEFAULT_OUTLIER_THRESHOLD = 3.5
+
+InstancePolicy = Literal["first", "best", "track", "all"]
+
+# Policies for selecting which predicted instances of each frame are extracted, see `slp_reader.select_instances()`
+INSTANCE_POLICIES = ["first", "best", "track", "all"]
+
+# Policies which produce exactly one row per frame, the others produce one row per selected instance
+PER_FRAME_POLICIES = ["first", "best"]
+
+Compression = Literal["gzip", "zstd"]
+
+# Compression codecs of text formats, and the extension appended to compressed files, i.e. "video.px.tsv.gz"
+COMPRESSIONS = ["gzip", "zstd"]
+COMPRESSION_EXTENSIONS = {"gzip": "gz", "zstd": "zst"}
+
+Interpolation = Literal["linear", "spline"]
+
+# Methods of filling gaps in the coordinates of each trace, see `transforms.fill_and_smooth()`
+INTERPOLATIONS = ["linear", "spline"]
+
+# Default seconds between scans of a watched directory, and that a *.slp file must be left unchanged before it is
+# converted, see `watch.watch_directory()`
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_SETTLE_TIME = 5.0
+
+OverviewLayout = Literal["pdf", "grid"]
+
+# Layouts of the overview of every video of a file: a multi-page 'pdf' with a page per video, or a single 'grid'
+# image with a panel per video, see `plotting.plot_overview()`
+OVERVIEW_LAYOUTS = ["pdf", "grid"]
+
+# Default number of chunks which may wait between two stages of a pipelined conversion, see `pipeline`
+DEFAULT_PIPELINE_DEPTH = 2
@@ -0,0 +1,320 @@
+"""Memory-mapped store of node coordinates, for random access by video, frame range and node.
+
+A store is a single `*.coords` file holding the coordinates of every video of a *.slp file, laid out as:
+
+    coords      float32 array of shape (rows, nodes, 2), rows sorted by video and then by frame index
+    frame_idx   int64 array of shape (rows,), the frame index of each row
+    index       UTF-8 JSON holding the node names, units, and the first and last row of each video
+    trailer     little-endian uint64 length of the index, followed by `STORE_MAGIC`
+
+Both arrays are memory-mapped when a store is opened, so selecting the frames of a video is a binary search
+and a slice, without reading or copying any coordinates.
+"""
+
+import json
+import os
+import struct
+import tempfile
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Extension of coordinate store files
+STORE_EXTENSION = "coords"
+
+# Last bytes of every store, identifying the file and the version of its layout
+STORE_MAGIC = b"PAWSCRD1"
+
+# Layout of the trailer, the length of the index followed by the magic bytes
+_TRAILER = struct.Struct(f"<Q{len(STORE_MAGIC)}s")
+
+COORDS_DTYPE = np.dtype("<f4")
+FRAME_IDX_DTYPE = np.dtype("<i8")
+
+
+def get_store_filename(slp_file: str, dest_dir: str, suffix: Optional[str] = None) -> str:
+    """Get the path of the coordinate store of `slp_file`.
+
+    Args:
+        slp_file: path to the *.slp file
+        dest_dir: destination directory for the produced files
+        suffix: any suffix to add to the filename (i.e. the units), just prior to the file extension
+
+    Returns:
+        path of the form `{dest_dir}/{basename of slp_file}.{suffix}.coords`
+    """
+    base = os.path.splitext(os.path.basename(slp_file))[0]
+    full_suffix = f"{suffix}.{STORE_EXTENSION}" if suffix is not None else STORE_EXTENSION
+    return os.path.join(dest_dir, f"{base}.{full_suffix}")
+
+
+class CoordinateStoreWriter:
+    """Write a coordinate store, appending the coordinates of one video, or chunk of frames, at a time.
+
+    The frames of each video must be appended together, in ascending order of frame index. Coordinates are
+    written as they are appended; only the frame indices are held in memory until `close()`. The store is written
+    to a temporary file in the same directory, which replaces `dest` upon `close()`.
+    """
+
+    def __init__(self, dest: str, node_names: Sequence[str], units: Optional[str] = None):
+        """Create a temporary file to write the store to.
+
+        Args:
+            dest: path of the store to write
+            node_names: names of the nodes, in the order of the coordinates of each row
+            units: units of the coordinates (i.e. 'px' or 'mm'), recorded in the index
+        """
+        self.dest = dest
+        self.node_names = list(node_names)
+        self.units = units
+        self.rows_written = 0
+        self._videos: Dict[str, List[int]] = {}
+        self._frame_idx: List[np.ndarray] = []
+        dest_dir, basename = os.path.split(os.path.abspath(dest))
+        os.makedirs(dest_dir, exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(prefix=f".{basename}.", suffix=".tmp", dir=dest_dir)
+        self._file = os.fdopen(fd, "wb")
+
+    def __enter__(self) -> "CoordinateStoreWriter":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        """Exit the context manager, closing the store, or discarding it if an exception was raised."""
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def append(self, video: str, frame_idx: np.ndarray, coords: np.ndarray) -> None:
+        """Append the coordinates of some frames of `video`.
+
+        Args:
+            video: filename of the video
+            frame_idx: array of shape (rows,) holding the frame index of each row, ascending
+            coords: array of shape (rows, nodes, 2) holding node coordinates
+        """
+        frame_idx = np.asarray(frame_idx, dtype=FRAME_IDX_DTYPE)
+        coords = np.asarray(coords)
+        if coords.shape != (len(frame_idx), len(self.node_names), 2):
+            raise ValueError(f"Expected coordinates of shape {(len(frame_idx), len(self.node_names), 2)}, got {coords.shape}")
+
+        # rows of each video are contiguous, so only the most recently appended video may be appended to again
+        rows = self._videos.get(video)
+        if rows is None:
+            rows = self._videos[video] = [self.rows_written, self.rows_written]
+        elif rows[1] != self.rows_written:
+            raise ValueError(f'Frames of video "{video}" must be appended together')
+        last_frame = self._frame_idx[-1][-1] if rows[1] > rows[0] else None
+        if np.any(np.diff(frame_idx) < 0) or (last_frame is not None and len(frame_idx) > 0 and frame_idx[0] < last_frame):
+            raise ValueError(f'Frames of video "{video}" must be appended in ascending order of frame index')
+
+        self._file.write(np.ascontiguousarray(coords, dtype=COORDS_DTYPE).tobytes())
+        if len(frame_idx) > 0:
+            self._frame_idx.append(frame_idx)
+        self.rows_written += len(frame_idx)
+        rows[1] = self.rows_written
+
+    def append_dataframe(self, df: "pd.DataFrame") -> None:
+        """Append the coordinates of a dataframe, as produced by `paws_tools.extraction.node_positions_to_dataframe()`.
+
+        Args:
+            df: dataframe indexed by (video, frame_idx), sorted by video and then frame index, with (node, x/y) columns
+                including those of every node of the store; any other columns (i.e. scores) are ignored
+        """
+        if df.index.nlevels != 2:
+            raise ValueError("Coordinate stores hold one row per frame, dataframes with extra index levels are not supported")
+        columns = [(node, coord) for node in self.node_names for coord in ("x", "y")]
+        values = df.loc[:, columns].to_numpy(dtype=COORDS_DTYPE).reshape(len(df), len(self.node_names), 2)
+        videos = df.index.get_level_values("video")
+        frame_idx = df.index.get_level_values("frame_idx").to_numpy()
+        # rows of each video are contiguous, as the dataframe is sorted by video
+        starts = np.flatnonzero(np.r_[True, videos[1:] != videos[:-1]]) if len(df) > 0 else np.array([], dtype=int)
+        for start, stop in zip(starts, np.r_[starts[1:], len(df)]):
+            self.append(videos[start], frame_idx[start:stop], values[start:stop])
+
+    def close(self) -> None:
+        """Write the frame indices and the index of the store, and move it to `dest`."""
+        try:
+            frame_idx = np.concatenate(self._frame_idx) if len(self._frame_idx) > 0 else np.zeros(0, dtype=FRAME_IDX_DTYPE)
+            self._file.write(frame_idx.tobytes())
+            index = {
+                "version": 1,
+                "nodes": self.node_names,
+                "units": self.units,
+                "rows": self.rows_written,
+                "videos": [{"video": video, "start": start, "stop": stop} for video, (start, stop) in self._videos.items()],
+            }
+            encoded = json.dumps(index).encode("utf-8")
+            self._file.write(encoded)
+            self._file.write(_TRAILER.pack(len(encoded), STORE_MAGIC))
+            self._file.close()
+        except BaseException:
+            self.abort()
+            raise
+
+        # temporary files are private, give the store the permissions of any other new file
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self._tmp, 0o666 & ~umask)
+        os.replace(self._tmp, self.dest)
+
+    def abort(self) -> None:
+        """Stop writing and remove the temporary file, leaving any existing `dest` untouched."""
+        self._file.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+class CoordinateStore:
+    """Read-only, memory-mapped access to a coordinate store written by `CoordinateStoreWriter`.
+
+    Example:
+        >>> store = CoordinateStore("session.px.coords")
+        >>> frame_idx, coords = store.select("/data/video_0.mp4", 120000, 125000, nodes=["Toe"])
+        >>> toe_y = coords[:, 0, 1]
+    """
+
+    def __init__(self, filename: str):
+        """Open a store and memory-map its coordinates.
+
+        Args:
+            filename: path of the store
+        """
+        self.filename = filename
+        file_size = os.path.getsize(filename)
+        with open(filename, "rb") as f:
+            if file_size < _TRAILER.size:
+                raise ValueError(f'"{filename}" is not a coordinate store')
+            f.seek(file_size - _TRAILER.size)
+            index_size, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+            if magic != STORE_MAGIC:
+                raise ValueError(f'"{filename}" is not a coordinate store')
+            f.seek(file_size - _TRAILER.size - index_size)
+            index: Dict[str, Any] = json.loads(f.read(index_size).decode("utf-8"))
+
+        self.nodes: List[str] = index["nodes"]
+        self.units: Optional[str] = index["units"]
+        self._videos: Dict[str, Tuple[int, int]] = {v["video"]: (v["start"], v["stop"]) for v in index["videos"]}
+        n_rows = index["rows"]
+        coords_shape = (n_rows, len(self.nodes), 2)
+        self._coords: np.ndarray
+        self._frame_idx: np.ndarray
+        if n_rows > 0:
+            self._coords = np.memmap(filename, dtype=COORDS_DTYPE, mode="r", shape=coords_shape)
+            offset = n_rows * len(self.nodes) * 2 * COORDS_DTYPE.itemsize
+            self._frame_idx = np.memmap(filename, dtype=FRAME_IDX_DTYPE, mode="r", offset=offset, shape=(n_rows,))
+        else:
+            # empty files cannot be memory-mapped
+            self._coords = np.zeros(coords_shape, dtype=COORDS_DTYPE)
+            self._frame_idx = np.zeros(0, dtype=FRAME_IDX_DTYPE)
+
+    @property
+    def videos(self) -> List[str]:
+        """Filenames of the videos in the store, in the order they are stored."""
+        return list(self._videos.keys())
+
+    def __len__(self) -> int:
+        """Get the number of rows (labeled frames) in the store."""
+        return len(self._frame_idx)
+
+    def __contains__(self, video: object) -> bool:
+        """Check whether the store holds frames of `video`."""
+        return video in self._videos
+
+    def node_indices(self, nodes: Optional[Sequence[str]] = None) -> Union[slice, List[int]]:
+        """Find the positions of `nodes` along the node axis of the coordinates.
+
+        Args:
+            nodes: names of the nodes, or None for all nodes
+
+        Returns:
+            a slice if the nodes are stored consecutively and in order (so selecting them does not copy),
+            otherwise a list of positions
+        """
+        if nodes is None:
+            return slice(None)
+        missing = [node for node in nodes if node not in self.nodes]
+        if len(missing) > 0:
+            raise KeyError(f"Nodes {missing} are not in the store; available nodes are {self.nodes}")
+        positions = [self.nodes.index(node) for node in nodes]
+        if len(positions) > 0 and positions == list(range(positions[0], positions[0] + len(positions))):
+            return slice(positions[0], positions[0] + len(positions))
+        return positions
+
+    def rows(self, video: str, start_frame: Optional[int] = None, stop_frame: Optional[int] = None) -> slice:
+        """Find the rows of a range of frames of `video`.
+
+        Args:
+            video: filename of the video
+            start_frame: first frame index to include, or None to start from the first frame
+            stop_frame: frame index at which to stop (exclusive), or None to continue to the last frame
+
+        Returns:
+            slice of the rows of the store holding the labeled frames within the range
+        """
+        if video not in self._videos:
+            raise KeyError(f'Video "{video}" is not in the store')
+        start, stop = self._videos[video]
+        frame_idx = self._frame_idx[start:stop]
+        first = int(np.searchsorted(frame_idx, start_frame, side="left")) if start_frame is not None else 0
+        last = int(np.searchsorted(frame_idx, stop_frame, side="left")) if stop_frame is not None else stop - start
+        return slice(start + first, start + max(first, last))
+
+    def select(
+        self, video: str, start_frame: Optional[int] = None, stop_frame: Optional[int] = None, nodes: Optional[Sequence[str]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Select the coordinates of a range of frames of `video`.
+
+        The returned arrays are read-only views of the memory-mapped store, unless `nodes` are not stored
+        consecutively, in which case the coordinates are copied (see `node_indices()`).
+
+        Args:
+            video: filename of the video
+            start_frame: first frame index to include, or None to start from the first frame
+            stop_frame: frame index at which to stop (exclusive), or None to continue to the last frame
+            nodes: names of the nodes to select, or None for all nodes
+
+        Returns:
+            tuple of (frame_idx, coords), arrays of shape (rows,) and (rows, nodes, 2) respectively; frames without
+            labels are not included
+        """
+        rows = self.rows(video, start_frame, stop_frame)
+        return self._frame_idx[rows], self._coords[rows, self.node_indices(nodes)]
+
+    def to_dataframe(
+        self,
+        videos: Optional[Sequence[str]] = None,
+        start_frame: Optional[int] = None,
+        stop_frame: Optional[int] = None,
+        nodes: Optional[Sequence[str]] = None,
+    ) -> "pd.DataFrame":
+        """Copy a selection of the store into a coordinate dataframe.
+
+        The dataframe is laid out the same as those of `paws_tools.extraction.node_positions_to_dataframe()`.
+
+        Args:
+            videos: filenames of the videos to include, or None for all videos
+            start_frame: first frame index to include, or None to start from the first frame
+            stop_frame: frame index at which to stop (exclusive), or None to continue to the last frame
+            nodes: names of the nodes to include, or None for all nodes
+
+        Returns:
+            dataframe indexed by (video, frame_idx) with (node, x/y) columns, holding 64-bit floats
+        """
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        videos = sorted(self.videos) if videos is None else list(videos)
+        node_names = self.nodes if nodes is None else list(nodes)
+        selections = [self.select(video, start_frame, stop_frame, node_names) for video in videos]
+        frame_idx = np.concatenate([s[0] for s in selections]) if len(selections) > 0 else np.zeros(0, dtype=FRAME_IDX_DTYPE)
+        values = np.concatenate([s[1] for s in selections]) if len(selections) > 0 else np.zeros((0, len(node_names), 2))
+        video_codes = np.repeat(np.arange(len(videos)), [len(s[0]) for s in selections])
+
+        frame_levels, frame_codes = np.unique(frame_idx, return_inverse=True)
+        index = pd.MultiIndex(levels=[videos, frame_levels], codes=[video_codes, frame_codes], names=["video", "frame_idx"])
+        columns = pd.MultiIndex.from_product([node_names, ["x", "y"]])
+        return pd.DataFrame(values.reshape(len(frame_idx), len(columns)).astype(np.float64), index=index, columns=columns)
@@ -0,0 +1,492 @@
+"""Read and write coordinate dataframes as text (TSV/CSV) or binary columnar (Parquet/Feather/NPZ) files.
+
+Text files may be compressed with gzip or zstd (i.e. `video.px.tsv.gz`). Compressed files are written as a series
+of independently compressed blocks (gzip members or zstd frames), which are compressed in a pool of threads while
+the next block is formatted; any gzip or zstd reader decompresses them as a single stream.
+
+All files are written to a temporary file alongside the destination, which is renamed over the destination once
+complete, so an interrupted conversion never leaves a truncated file behind.
+"""
+
+import io
+import os
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from paws_tools.constants import (  # noqa: F401
+    BINARY_FORMATS,
+    COMPRESSION_EXTENSIONS,
+    COMPRESSIONS,
+    FORMATS,
+    TEXT_FORMATS,
+    Compression,
+    DataFrameFormat,
+)
+from paws_tools.coord_store import STORE_EXTENSION, CoordinateStore
+from paws_tools.profiling import Metrics, file_size, stage
+
+# Number of rows formatted and compressed as a single block of a text file
+DEFAULT_BLOCK_ROWS = 50_000
+
+# Number of threads compressing blocks of each compressed text file
+DEFAULT_COMPRESSION_THREADS = min(4, os.cpu_count() or 1)
+
+# Compression levels, favouring speed as coordinate files compress well even at low levels
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def _import_pyarrow():
+    """Import pyarrow, which is an optional dependency needed for the parquet and feather formats."""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ImportError("The parquet and feather formats require pyarrow, install with `pip install paws-tools[arrow]`") from e
+    return pyarrow
+
+
+def _import_zstandard():
+    """Import zstandard, which is an optional dependency needed for zstd compression."""
+    try:
+        import zstandard  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ImportError("zstd compression requires zstandard, install with `pip install paws-tools[zstd]`") from e
+    return zstandard
+
+
+def split_compression(filename: str) -> Tuple[str, Optional[str]]:
+    """Split the compression extension, if any, from a filename.
+
+    Args:
+        filename: path to the file
+
+    Returns:
+        tuple of (filename without the compression extension, compression or None if uncompressed)
+    """
+    base, ext = os.path.splitext(filename)
+    for compression, compression_ext in COMPRESSION_EXTENSIONS.items():
+        if ext.lstrip(".").lower() == compression_ext:
+            return base, compression
+    return filename, None
+
+
+def detect_format(filename: str) -> str:
+    """Determine the format of a file from its extension, ignoring any compression extension (i.e. `.tsv.gz`).
+
+    Args:
+        filename: path to the file
+
+    Returns:
+        one of `FORMATS`
+    """
+    base, compression = split_compression(filename)
+    ext = os.path.splitext(base)[1].lstrip(".").lower()
+    if compression is not None and ext not in TEXT_FORMATS:
+        raise ValueError(f"Unable to determine format of file \"{filename}\"; only [{', '.join(TEXT_FORMATS)}] files may be compressed")
+    if ext not in FORMATS:
+        raise ValueError(f"Unable to determine format of file \"{filename}\"; expected one of extensions: [{', '.join(FORMATS)}]")
+    return ext
+
+
+def _to_csv_kwargs(format: str) -> Dict[str, str]:
+    """Get any kwargs to be passed to `DataFrame.to_csv()` for `format`."""
+    to_csv_kwargs = {}
+    if format == "tsv":
+        to_csv_kwargs["sep"] = "\t"
+    return to_csv_kwargs
+
+
+def open_text(filename: str) -> IO[str]:
+    """Open a text file for reading, decompressing it if it has a compression extension (i.e. `.tsv.gz`).
+
+    Args:
+        filename: path to the file
+
+    Returns:
+        file object yielding the decompressed text
+    """
+    compression = split_compression(filename)[1]
+    if compression is None:
+        return open(filename)
+
+    elif compression == "gzip":
+        import gzip  # pylint: disable=import-outside-toplevel
+
+        return gzip.open(filename, "rt", encoding="utf-8")
+
+    else:
+        zstandard = _import_zstandard()
+        # the file is a series of frames, one per block, see `DataFrameWriter`
+        reader = zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+
+
+def _count_index_columns(filename: str, sep: str) -> int:
+    """Count the index columns of a csv file written by pandas, whose cells in the first header row are blank."""
+    with open_text(filename) as f:
+        header = f.readline().rstrip("\r\n").split(sep)
+    n_index = 0
+    while n_index < len(header) - 1 and header[n_index] == "":
+        n_index += 1
+    return max(n_index, 1)
+
+
+def read_dataframe_from_csv(filename: str) -> pd.DataFrame:
+    """Read a csv file and convert to a dataframe.
+
+    Handles automatically detecting the delimiter type (tab for TSV files or comma for CSV)
+    Handles correctly constructing the multi-index, including any extra index levels (i.e. `instance` or `track`)
+    Handles decompressing gzip (`.gz`) or zstd (`.zst`) compressed files
+
+    Args:
+        filename: path to the file to read
+
+    Returns:
+        `pandas.DataFrame` containing data read from the csv file
+    """
+    sep = "\t" if split_compression(filename)[0].lower().endswith("tsv") else ","
+    n_index = _count_index_columns(filename, sep)
+    with open_text(filename) as f:
+        return pd.read_csv(f, sep=sep, index_col=list(range(n_index)), header=[0, 1])
+
+
+def _read_npz(filename: str) -> pd.DataFrame:
+    """Read a dataframe saved by `DataFrameWriter` in the npz format."""
+    with np.load(filename, allow_pickle=False) as data:
+        index_names = data["index_names"].tolist()
+        arrays = [data["videos"][data["video_codes"]].astype(object), data["frame_idx"]]
+        for i in range(2, len(index_names)):
+            level = data[f"index_{i}"]
+            arrays.append(level.astype(object) if level.dtype.kind == "U" else level)
+        index = pd.MultiIndex.from_arrays(arrays, names=index_names)
+        columns = pd.MultiIndex.from_arrays([level.astype(object) for level in data["columns"]])
+        return pd.DataFrame(data["values"], index=index, columns=columns)
+
+
+def read_dataframe(filename: str) -> pd.DataFrame:
+    """Read a dataframe from a file in any of the supported formats, or a coordinate store, determined by the file extension.
+
+    Args:
+        filename: path to the file to read
+
+    Returns:
+        `pandas.DataFrame` with the (video, frame_idx) index and (node, coordinate) columns restored
+    """
+    if filename.lower().endswith(f".{STORE_EXTENSION}"):
+        return CoordinateStore(filename).to_dataframe()
+
+    format = detect_format(filename)
+    if format in TEXT_FORMATS:
+        return read_dataframe_from_csv(filename)
+
+    elif format == "npz":
+        return _read_npz(filename)
+
+    _import_pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+        return pq.read_table(filename).to_pandas()
+
+    else:
+        import pyarrow.feather as pf  # pylint: disable=import-outside-toplevel
+
+        return pf.read_table(filename).to_pandas()
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    """Compress `data` as a complete gzip member or zstd frame, which may be concatenated with others."""
+    if compression == "gzip":
+        # wbits of 31 writes a gzip header, with a zero timestamp so identical data gives identical files
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    else:
+        # compressors are not thread-safe, so one is made per block
+        return _import_zstandard().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+class DataFrameWriter:
+    """Write a dataframe to a file in chunks, appending each chunk as it is written.
+
+    Text formats are appended row-wise, in blocks of at most `block_rows` rows, so that only one block is ever
+    formatted as text at a time. When compressed, each block is compressed by a pool of threads while the next is
+    formatted, and blocks are written in order as they complete. Parquet files gain one row group and feather
+    files one record batch per chunk. The npz format cannot be appended to, so chunks are accumulated and
+    written upon `close()`.
+
+    The file is written to a temporary file in the same directory, which replaces `dest` upon `close()`. If an
+    exception is raised within the context manager, the temporary file is removed and `dest` is left untouched.
+    """
+
+    def __init__(
+        self,
+        dest: str,
+        format: DataFrameFormat,
+        compression: Optional[Compression] = None,
+        block_rows: int = DEFAULT_BLOCK_ROWS,
+        compression_threads: int = DEFAULT_COMPRESSION_THREADS,
+    ):
+        """Prepare to write to `dest` in `format`; the file is created when the first chunk is written.
+
+        Args:
+            dest: path of the file to write
+            format: format of the file to write, one of `FORMATS`
+            compression: compression of text formats, one of `COMPRESSIONS`, or None for uncompressed
+            block_rows: maximum number of rows of text formats formatted (and compressed) at once
+            compression_threads: number of threads compressing blocks, when `compression` is given
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported format \"{format}\"; expected one of [{', '.join(FORMATS)}]")
+        if compression is not None:
+            if compression not in COMPRESSIONS:
+                raise ValueError(f"Unsupported compression \"{compression}\"; expected one of [{', '.join(COMPRESSIONS)}]")
+            if format not in TEXT_FORMATS:
+                raise ValueError(f"Compression is only supported for the [{', '.join(TEXT_FORMATS)}] formats, not \"{format}\"")
+            if compression == "zstd":
+                _import_zstandard()
+        if format not in TEXT_FORMATS + ["npz"]:
+            _import_pyarrow()
+
+        self.dest = dest
+        self.format = format
+        self.compression = compression
+        self.block_rows = block_rows
+        self.compression_threads = compression_threads
+        self.rows_written = 0
+        self._header_written = False
+        self._tmp: Optional[str] = None
+        self._file: Optional[IO[bytes]] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending: Deque[Future] = deque()
+        self._writer: Any = None
+        self._sink: Any = None
+        self._chunks: List[pd.DataFrame] = []
+
+    def __enter__(self) -> "DataFrameWriter":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        """Exit the context manager, closing the file, or discarding it if an exception was raised."""
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def _temp_path(self) -> str:
+        """Create the temporary file which is renamed to `dest` upon `close()`."""
+        if self._tmp is None:
+            dest_dir, basename = os.path.split(os.path.abspath(self.dest))
+            fd, self._tmp = tempfile.mkstemp(prefix=f".{basename}.", suffix=".tmp", dir=dest_dir)
+            os.close(fd)
+            # temporary files are private, give the file the permissions of any other new file
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(self._tmp, 0o666 & ~umask)
+        return self._tmp
+
+    def _write_block(self, data: bytes) -> None:
+        """Write a block of a text file, compressing it in the thread pool if required."""
+        if self._file is None:
+            self._file = open(self._temp_path(), "wb")
+        if self.compression is None:
+            self._file.write(data)
+            return
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.compression_threads)
+        self._pending.append(self._pool.submit(_compress, data, self.compression))
+        # bound the number of blocks held in memory, writing completed blocks in order
+        while len(self._pending) > 2 * self.compression_threads or (len(self._pending) > 0 and self._pending[0].done()):
+            self._file.write(self._pending.popleft().result())
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Append `df` to the file.
+
+        Args:
+            df: dataframe chunk to write; all chunks must share the same columns
+        """
+        if self.format in TEXT_FORMATS:
+            for start in range(0, max(len(df), 1), self.block_rows):
+                text = df.iloc[start : start + self.block_rows].to_csv(header=not self._header_written, **_to_csv_kwargs(self.format))
+                self._header_written = True
+                self._write_block(text.encode("utf-8"))
+
+        elif self.format == "npz":
+            self._chunks.append(df)
+
+        else:
+            pa = _import_pyarrow()
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            if self._writer is None:
+                if self.format == "parquet":
+                    import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+                    self._writer = pq.ParquetWriter(self._temp_path(), table.schema)
+                else:
+                    self._sink = pa.OSFile(self._temp_path(), "wb")
+                    self._writer = pa.ipc.new_file(self._sink, table.schema)
+            self._writer.write_table(table)
+
+        self.rows_written += len(df)
+
+    def _write_npz(self) -> None:
+        """Write the accumulated chunks of an npz file."""
+        df = pd.concat(self._chunks) if len(self._chunks) > 1 else self._chunks[0]
+        self._chunks = []
+        videos, video_codes = np.unique(df.index.get_level_values(0).to_numpy(dtype=str), return_inverse=True)
+        # any extra index levels (i.e. instance or track), strings are stored as unicode as pickling is disallowed
+        extra_levels = {}
+        for i in range(2, df.index.nlevels):
+            level = df.index.get_level_values(i).to_numpy()
+            extra_levels[f"index_{i}"] = level.astype(str) if level.dtype == object else level
+        with open(self._temp_path(), "wb") as f:
+            np.savez(
+                f,
+                values=df.to_numpy(),
+                videos=videos,
+                video_codes=video_codes,
+                frame_idx=df.index.get_level_values(1).to_numpy(),
+                index_names=np.array(df.index.names, dtype=str),
+                columns=np.array([df.columns.get_level_values(i).to_numpy(dtype=str) for i in range(df.columns.nlevels)]),
+                **extra_levels,
+            )
+
+    def _release(self) -> None:
+        """Close any open file, writer and thread pool."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    def close(self) -> None:
+        """Finish writing the file, and move it to `dest`."""
+        try:
+            if self.format == "npz" and len(self._chunks) > 0:
+                self._write_npz()
+            while len(self._pending) > 0:
+                assert self._file is not None
+                self._file.write(self._pending.popleft().result())
+        except BaseException:
+            self.abort()
+            raise
+
+        self._release()
+        if self._tmp is not None:
+            os.replace(self._tmp, self.dest)
+            self._tmp = None
+
+    def abort(self) -> None:
+        """Stop writing and remove the temporary file, leaving any existing `dest` untouched."""
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._chunks = []
+        self._release()
+        if self._tmp is not None:
+            if os.path.exists(self._tmp):
+                os.remove(self._tmp)
+            self._tmp = None
+
+
+def write_dataframe(
+    df: pd.DataFrame, dest: str, format: Optional[DataFrameFormat] = None, compression: Optional[Compression] = None
+) -> None:
+    """Write a dataframe to a file in any of the supported formats.
+
+    Args:
+        df: dataframe to write
+        dest: path of the file to write
+        format: format of the file to write, one of `FORMATS`. If None, determined from the extension of `dest`
+        compression: compression of text formats, one of `COMPRESSIONS`. If None and `format` is None, determined
+            from the extension of `dest`, otherwise uncompressed
+    """
+    if format is None:
+        format = detect_format(dest)  # type: ignore[assignment]
+        compression = compression or split_compression(dest)[1]  # type: ignore[assignment]
+    with DataFrameWriter(dest, format, compression) as writer:  # type: ignore[arg-type]
+        writer.write(df)
+
+
+def get_output_filename(
+    group: str, dest_dir: str, suffix: Optional[str] = None, format: str = "tsv", compression: Optional[Compression] = None
+) -> str:
+    """Get the path of the file which data for `group` (i.e. a video filename) should be saved to.
+
+    Args:
+        group: name of the group, typically a video filename
+        dest_dir: destination directory for the produced files
+        suffix: any suffix to add to the resulting filenames, just prior to the file extension
+        format: file extension of the produced file
+        compression: compression of the produced file, if any, whose extension is appended (i.e. `.tsv.gz`)
+
+    Returns:
+        path of the form `{dest_dir}/{basename of group}.{suffix}.{format}[.{compression extension}]`
+    """
+    # generate the full suffix, including file extension
+    full_suffix = f"{suffix}.{format}" if suffix is not None else format
+    if compression is not None:
+        full_suffix += f".{COMPRESSION_EXTENSIONS[compression]}"
+    base = os.path.splitext(os.path.basename(group))[0]
+    return os.path.join(dest_dir, f"{base}.{full_suffix}")
+
+
+def save_dataframe_to_grouped_csv(
+    df: pd.DataFrame,
+    groupby: str,
+    dest_dir: str,
+    suffix: Optional[str] = None,
+    format: DataFrameFormat = "tsv",
+    metrics: Optional[Metrics] = None,
+    compression: Optional[Compression] = None,
+) -> List[str]:
+    """Split a dataframe into groups, and then save each group as a separate file.
+
+    Each group is written in blocks of `DEFAULT_BLOCK_ROWS` rows, so no more than one
+    block of a group is copied (or formatted as text) at a time. Files are replaced atomically once complete.
+
+    Args:
+        df: dataframe to be saved
+        groupby: how to group the dataframe
+        dest_dir: destination directory for the produced files
+        suffix: any suffix to add to the resulting filenames, just prior to the file extension
+        format: format for the saved files, 'tsv' indicates tab-separated values, 'csv' indicated comma-separated values,
+            'parquet', 'feather' and 'npz' give binary columnar files (see `DataFrameWriter`)
+        metrics: if provided, the time taken to save each group is recorded here, see `paws_tools.profiling`
+        compression: compression of text formats, 'gzip' or 'zstd', or None for uncompressed files
+
+    Returns:
+        A list of strings indicating the filepaths which were saved to
+    """
+    # ensure destination directory exists
+    os.makedirs(dest_dir, exist_ok=True)
+
+    # find the rows of each group of `groupby`, without copying them, then save each group to a separate file
+    group_rows = df.groupby(groupby).indices
+    out_filenames = []
+    for group in tqdm(sorted(group_rows), desc=f"Saving {format.upper()} Files", leave=False):
+        rows = group_rows[group]
+        dest = get_output_filename(group, dest_dir, suffix, format, compression)
+        out_filenames.append(dest)
+        with stage(metrics, "write", group, frames=len(rows)) as counters:
+            with DataFrameWriter(dest, format, compression) as writer:
+                for start in range(0, len(rows), DEFAULT_BLOCK_ROWS):
+                    writer.write(df.iloc[rows[start : start + DEFAULT_BLOCK_ROWS]])
+            counters["bytes_written"] = file_size(dest)
+
+    return out_filenames
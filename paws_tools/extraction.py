@@ -0,0 +1,487 @@
+"""Extraction of node coordinates from SLEAP predictions into arrays and coordinate dataframes.
+
+Coordinates are gathered from `sleap_io.Labels` in memory, or straight from the arrays of a *.slp file with a
+`paws_tools.slp_reader.SlpReader`, into preallocated arrays of shape (frames, nodes, 2). These are laid out as
+dataframes indexed by (video, frame_idx), with (node, x/y) columns. Body-parts are resolved to the nodes of every
+skeleton with a `paws_tools.skeleton_index.SkeletonIndex`.
+"""
+
+from typing import Collection, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from sleap_io import Labels, Node, PredictedInstance, Skeleton
+
+from paws_tools.skeleton_index import SkeletonIndex
+from paws_tools.slp_reader import FrameSelection, InstancePolicy, InstancePositions, SlpReader, select_instances
+
+# Column holding the score of each instance, included along with point scores for instance policies other than "first"
+INSTANCE_SCORE_COLUMN = ("instance", "score")
+
+
+def get_skeleton_index(labels: Union[Labels, SlpReader]) -> SkeletonIndex:
+    """Get the index of the skeletons of `labels`, built when the `SlpReader` was opened or anew for `Labels`.
+
+    Build the index once and pass it along when resolving body-parts or extracting data from the same `Labels`
+    more than once.
+
+    Args:
+        labels: labels (or a `SlpReader`) whose skeletons to index
+
+    Returns:
+        index of the nodes of every skeleton of `labels`
+    """
+    if isinstance(labels, SlpReader):
+        return labels.skeleton_index
+    return SkeletonIndex(labels.skeletons)
+
+
+def get_nodes_for_bodyparts(
+    labels: Union[Labels, SlpReader],
+    body_parts: Union[str, Node, List[Union[str, Node]]],
+    skeleton_index: Optional[SkeletonIndex] = None,
+) -> List[Node]:
+    """Given a set of body-part names, return a list of corresponding skeleton nodes.
+
+    Nodes are returned without duplicates, in the order of the first body-part matching each. Body-parts
+    may also be glob patterns (i.e. `Toe*`) or regular expressions (i.e. `re:(Toe|Heel)`), and are matched
+    against the nodes of every skeleton, see `paws_tools.skeleton_index`.
+
+    Supports the following special values:
+    - `all`: return all nodes
+
+    Args:
+        labels: labels (or a `SlpReader`) from which to select bodypart Nodes
+        body_parts: list of bodypart names or patterns for which to select corresponding Nodes
+        skeleton_index: index of the skeletons of `labels`, see `get_skeleton_index()`. Built if not given
+
+    Returns:
+        list of `Node`s corresponding to body_parts
+    """
+    index = skeleton_index if skeleton_index is not None else get_skeleton_index(labels)
+    return index.get_nodes(index.resolve(body_parts))
+
+
+def select_nodes(
+    labels: Union[Labels, SlpReader],
+    body_parts: List[Union[str, Node]],
+    ignore_body_parts: List[Union[str, Node]],
+    skeleton_index: Optional[SkeletonIndex] = None,
+) -> List[Node]:
+    """Get the nodes for `body_parts`, less those for `ignore_body_parts`, sorted by name.
+
+    Args:
+        labels: labels (or a `SlpReader`) from which to select bodypart Nodes
+        body_parts: bodypart names or patterns to select, see `get_nodes_for_bodyparts()`
+        ignore_body_parts: bodypart names or patterns to subtract from the selection
+        skeleton_index: index of the skeletons of `labels`, see `get_skeleton_index()`. Built if not given
+
+    Returns:
+        list of `Node`s sorted by name
+    """
+    index = skeleton_index if skeleton_index is not None else get_skeleton_index(labels)
+    ignored = set(index.resolve(ignore_body_parts))
+    return index.get_nodes(sorted(name for name in index.resolve(body_parts) if name not in ignored))
+
+
+def _instance_nodes(skeleton_index: SkeletonIndex, node_names: List[str]) -> Dict[int, List[Optional[Node]]]:
+    """Get the nodes of each skeleton to read from its instances, keyed by `id()` of the skeleton, see `_nodes_of()`."""
+    return {id(skeleton): skeleton_index.skeleton_nodes(node_names, s) for s, skeleton in enumerate(skeleton_index.skeletons)}
+
+
+def _nodes_of(instance_nodes: Dict[int, List[Optional[Node]]], skeleton: Skeleton, node_names: List[str]) -> List[Optional[Node]]:
+    """Get the nodes of `skeleton` named `node_names`, None where it lacks one, indexing skeletons not seen before."""
+    nodes = instance_nodes.get(id(skeleton))
+    if nodes is None:
+        nodes = instance_nodes[id(skeleton)] = SkeletonIndex([skeleton]).skeleton_nodes(node_names)
+    return nodes
+
+
+def _video_id(filename: str, video_filenames: List[str], videos: Optional[Collection[str]]) -> int:
+    """Get the position of a video within `video_filenames`, adding it if new, or -1 if it is not one of `videos`."""
+    if videos is not None and filename not in videos:
+        return -1
+    if filename not in video_filenames:
+        video_filenames.append(filename)
+    return video_filenames.index(filename)
+
+
+def _read_positions(
+    reader: SlpReader,
+    node_names: List[str],
+    instance_policy: InstancePolicy,
+    videos: Optional[Collection[str]],
+    frames: Optional[FrameSelection],
+) -> Tuple[List[str], np.ndarray, InstancePositions]:
+    """Read the selected instances of each selected video of `reader`, see `SlpReader.read_instances()`.
+
+    Returns:
+        tuple of (video_filenames, video_ids, positions), as `instance_positions_to_array()`
+    """
+    video_filenames = [video for video in reader.videos if videos is None or video in videos]
+    scores = instance_policy != "first"
+    chunks = [reader.read_instances(reader.frame_rows(video, frames), node_names, instance_policy, scores) for video in video_filenames]
+    video_ids = np.repeat(np.arange(len(chunks), dtype=np.int64), [len(chunk.frame_inds) for chunk in chunks])
+    # reading no rows gives arrays of the right shapes and types, returned as-is when no video is selected
+    chunks.append(reader.read_instances(np.zeros(0, dtype=np.int64), node_names, instance_policy, scores))
+    positions = InstancePositions._make(np.concatenate(field) if field[0] is not None else None for field in zip(*chunks))
+    return video_filenames, video_ids, positions
+
+
+def node_positions_to_array(
+    labels: Union[Labels, SlpReader],
+    nodes: List[Union[str, Node]],
+    skeleton_index: Optional[SkeletonIndex] = None,
+    videos: Optional[Collection[str]] = None,
+    frames: Optional[FrameSelection] = None,
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Gather the coordinates of `nodes` from `labels` into a preallocated array.
+
+    Only the first predicted instance in each frame will be used. Frames without a predicted instance,
+    or nodes not present in the predicted instance (or its skeleton), are filled with `numpy.nan`.
+
+    Given a `SlpReader`, the instance and point ids of all selected frames are computed at once, and the coordinates
+    are gathered from the point table of the file into the preallocated array, see `SlpReader.read_instances()`.
+    Rows are then ordered by video and frame index. `Labels` hold the points of each instance in a dict, so
+    their frames are walked in the order in which they are stored in `labels`, instead. Either way, unselected
+    frames are skipped before any of their instances are looked at.
+
+    Args:
+        labels: labels (or a `SlpReader`) from which to extract data
+        nodes: the nodes (or node names) for which to extract data
+        skeleton_index: index of the skeletons of `labels`, see `get_skeleton_index()`. Built if not given
+        videos: filenames of the videos from which to extract data, or None for all videos
+        frames: if provided, only the selected frames of each video are extracted
+
+    Returns:
+        tuple of (video_filenames, video_ids, frame_inds, coords), where `video_filenames` lists the unique
+        video filenames, `video_ids` is an array of shape (frames,) indexing into `video_filenames`,
+        `frame_inds` is an array of shape (frames,) holding the frame index, and `coords` is an array
+        of shape (frames, nodes, 2) holding the x and y coordinates of each node.
+    """
+    node_names = [node.name if isinstance(node, Node) else node for node in nodes]
+    if isinstance(labels, SlpReader):
+        read_videos, read_video_ids, positions = _read_positions(labels, node_names, "first", videos, frames)
+        return read_videos, read_video_ids, positions.frame_inds, positions.coords
+
+    # the nodes of each skeleton are looked up once, rather than by name for every instance
+    instance_nodes = _instance_nodes(skeleton_index if skeleton_index is not None else get_skeleton_index(labels), node_names)
+    # nodes of the skeleton of the previous instance, as consecutive instances nearly always share one
+    skeleton: Optional[Skeleton] = None
+    skeleton_nodes: List[Optional[Node]] = []
+    video_filenames: List[str] = []
+    video_lookup: Dict[int, int] = {}
+    missing = (np.nan, np.nan) * len(nodes)
+
+    # collect values into flat lists and convert to arrays once, which is much cheaper
+    # than assigning into an array (or building a dict) element by element
+    video_ids: List[int] = []
+    frame_inds: List[int] = []
+    flat: List[float] = []
+    # no progress bar here, at these speeds its per-item overhead is a large share of the loop
+    for frame in labels.labeled_frames:
+        video_id = video_lookup.get(id(frame.video))
+        if video_id is None:
+            video_id = video_lookup[id(frame.video)] = _video_id(frame.video.filename, video_filenames, videos)
+        if video_id < 0 or (frames is not None and not frames.contains(frame.frame_idx)):
+            continue
+        video_ids.append(video_id)
+        frame_inds.append(frame.frame_idx)
+
+        for instance in frame.instances:
+            if type(instance) is PredictedInstance:
+                if instance.skeleton is not skeleton:
+                    skeleton = instance.skeleton
+                    skeleton_nodes = _nodes_of(instance_nodes, skeleton, node_names)
+                points = instance.points
+                for node in skeleton_nodes:
+                    point = points.get(node)
+                    if point is None:
+                        flat.extend((np.nan, np.nan))
+                    else:
+                        flat.append(point.x)
+                        flat.append(point.y)
+                break
+        else:
+            # no predicted instances in this frame
+            flat.extend(missing)
+
+    coords = np.array(flat, dtype=np.float64).reshape(len(frame_inds), len(nodes), 2)
+    return video_filenames, np.array(video_ids, dtype=np.int64), np.array(frame_inds, dtype=np.int64), coords
+
+
+def instance_positions_to_array(
+    labels: Union[Labels, SlpReader],
+    nodes: List[Union[str, Node]],
+    instance_policy: InstancePolicy,
+    skeleton_index: Optional[SkeletonIndex] = None,
+    videos: Optional[Collection[str]] = None,
+    frames: Optional[FrameSelection] = None,
+) -> Tuple[List[str], np.ndarray, InstancePositions, List[str]]:
+    """Gather the coordinates and scores of `nodes` in the predicted instances selected from `labels`.
+
+    All predicted instances are gathered into flat arrays in a single pass, then selected at once with
+    `paws_tools.slp_reader.select_instances()`. Nodes not present in an instance, and frames without a
+    selected instance, are filled with `numpy.nan`. Given a `SlpReader`, only the points of the selected
+    instances are gathered from the file, see `node_positions_to_array()`.
+
+    Args:
+        labels: labels (or a `SlpReader`) from which to extract data
+        nodes: the nodes (or node names) for which to extract data
+        instance_policy: which predicted instances of each frame to extract, one of `INSTANCE_POLICIES`
+        skeleton_index: index of the skeletons of `labels`, see `get_skeleton_index()`. Built if not given
+        videos: filenames of the videos from which to extract data, or None for all videos
+        frames: if provided, only the selected frames of each video are extracted
+
+    Returns:
+        tuple of (video_filenames, video_ids, positions, track_names), where `video_filenames` lists the unique
+        video filenames, `video_ids` is an array of shape (rows,) indexing into `video_filenames`, `positions` holds
+        the frame index, coordinates and scores of each row, and `track_names` lists the names of the tracks indexed
+        by `positions.instances` for the `track` policy
+    """
+    node_names = [node.name if isinstance(node, Node) else node for node in nodes]
+    if isinstance(labels, SlpReader):
+        read_videos, read_video_ids, positions = _read_positions(labels, node_names, instance_policy, videos, frames)
+        return read_videos, read_video_ids, positions, list(labels.tracks)
+
+    instance_nodes = _instance_nodes(skeleton_index if skeleton_index is not None else get_skeleton_index(labels), node_names)
+    # nodes of the skeleton of the previous instance, as consecutive instances nearly always share one
+    skeleton: Optional[Skeleton] = None
+    skeleton_nodes: List[Optional[Node]] = []
+    video_filenames: List[str] = []
+    video_lookup: Dict[int, int] = {}
+    track_names = [track.name for track in labels.tracks]
+    track_lookup = {id(track): i for i, track in enumerate(labels.tracks)}
+    missing = (np.nan, np.nan, np.nan)
+
+    frame_videos: List[int] = []
+    frame_inds: List[int] = []
+    inst_frame: List[int] = []
+    inst_score: List[float] = []
+    inst_track: List[int] = []
+    flat: List[float] = []
+    for frame in labels.labeled_frames:
+        video_id = video_lookup.get(id(frame.video))
+        if video_id is None:
+            video_id = video_lookup[id(frame.video)] = _video_id(frame.video.filename, video_filenames, videos)
+        if video_id < 0 or (frames is not None and not frames.contains(frame.frame_idx)):
+            continue
+        f = len(frame_videos)
+        frame_videos.append(video_id)
+        frame_inds.append(frame.frame_idx)
+
+        for instance in frame.instances:
+            if type(instance) is not PredictedInstance:
+                continue
+            inst_frame.append(f)
+            inst_score.append(instance.score)
+            track = instance.track
+            if track is None:
+                inst_track.append(-1)
+            else:
+                if id(track) not in track_lookup:
+                    track_lookup[id(track)] = len(track_names)
+                    track_names.append(track.name)
+                inst_track.append(track_lookup[id(track)])
+
+            if instance.skeleton is not skeleton:
+                skeleton = instance.skeleton
+                skeleton_nodes = _nodes_of(instance_nodes, skeleton, node_names)
+            points = instance.points
+            for node in skeleton_nodes:
+                point = points.get(node)
+                if point is None:
+                    flat.extend(missing)
+                else:
+                    flat.append(point.x)
+                    flat.append(point.y)
+                    flat.append(point.score)
+
+    inst_values = np.array(flat, dtype=np.float64).reshape(len(inst_frame), len(nodes), 3)
+    inst_scores = np.array(inst_score, dtype=np.float64)
+    row_frames, row_instances, row_keys = select_instances(
+        np.array(inst_frame, dtype=np.int64), inst_scores, np.array(inst_track, dtype=np.int64), len(frame_inds), instance_policy
+    )
+
+    found = row_instances >= 0
+    values = np.full((len(row_frames), len(nodes), 3), np.nan, dtype=np.float64)
+    values[found] = inst_values[row_instances[found]]
+    instance_scores = np.full(len(row_frames), np.nan, dtype=np.float64)
+    instance_scores[found] = inst_scores[row_instances[found]]
+
+    positions = InstancePositions(
+        np.array(frame_inds, dtype=np.int64)[row_frames], row_keys, values[:, :, :2], values[:, :, 2], instance_scores
+    )
+    return video_filenames, np.array(frame_videos, dtype=np.int64)[row_frames], positions, track_names
+
+
+def coords_to_dataframe(
+    video_filenames: List[str],
+    video_ids: np.ndarray,
+    frame_inds: np.ndarray,
+    coords: np.ndarray,
+    node_names: List[str],
+    instances: Optional[np.ndarray] = None,
+    instance_level: str = "instance",
+    point_scores: Optional[np.ndarray] = None,
+    instance_scores: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """Build a coordinate dataframe from the arrays produced by `node_positions_to_array()`.
+
+    Args:
+        video_filenames: unique video filenames
+        video_ids: array of shape (frames,) indexing into `video_filenames`
+        frame_inds: array of shape (frames,) holding the frame index of each row
+        coords: array of shape (frames, nodes, 2) holding node coordinates
+        node_names: names of the nodes, in the same order as the second axis of `coords`
+        instances: if provided, array of shape (frames,) identifying the instance of each row within its frame,
+            which is added as a third index level named `instance_level`
+        instance_level: name of the index level holding `instances`
+        point_scores: if provided, array of shape (frames, nodes) holding point scores, added as (node, score) columns
+        instance_scores: if provided, array of shape (frames,) holding instance scores, added as the
+            `INSTANCE_SCORE_COLUMN` column
+
+    Returns:
+       pandas DataFrame indexed by (video, frame_idx), plus `instance_level` if `instances` is given, with (node, x/y)
+       columns, sorted by video filename, then by frame index and instance, each in ascending order.
+    """
+    # rank the videos by filename, so a single lexsort orders rows by video name, then by frame_idx
+    filenames = np.array(video_filenames, dtype=object)
+    video_order = np.argsort(filenames, kind="stable")
+    video_rank = np.empty_like(video_order)
+    video_rank[video_order] = np.arange(len(video_order))
+    video_codes = video_rank[video_ids]
+    if instances is None:
+        order = np.lexsort((frame_inds, video_codes))
+    else:
+        instance_levels, instance_codes = np.unique(instances, return_inverse=True)
+        order = np.lexsort((instance_codes, frame_inds, video_codes))
+
+    # build the index directly from levels and codes, avoiding re-factorizing the filename strings
+    frame_levels, frame_codes = np.unique(frame_inds[order], return_inverse=True)
+    levels = [filenames[video_order], frame_levels]
+    codes = [video_codes[order], frame_codes]
+    names = ["video", "frame_idx"]
+    if instances is not None:
+        levels.append(instance_levels)
+        codes.append(instance_codes[order])
+        names.append(instance_level)
+    index = pd.MultiIndex(levels=levels, codes=codes, names=names)
+
+    values = coords if point_scores is None else np.concatenate([coords, point_scores[:, :, None]], axis=2)
+    columns = pd.MultiIndex.from_product([list(node_names), ["x", "y"] if point_scores is None else ["x", "y", "score"]])
+    df = pd.DataFrame(values[order].reshape(len(order), len(columns)), index=index, columns=columns)
+    if instance_scores is not None:
+        df[INSTANCE_SCORE_COLUMN] = instance_scores[order]
+    return df
+
+
+def instances_to_dataframe(
+    video_filenames: List[str],
+    video_ids: np.ndarray,
+    positions: InstancePositions,
+    node_names: List[str],
+    instance_policy: InstancePolicy,
+    track_names: List[str],
+) -> pd.DataFrame:
+    """Build a coordinate dataframe from the instances selected with `instance_policy`, see `coords_to_dataframe()`.
+
+    For the `all` policy the index gains an `instance` level, holding the ordinal of the instance within its frame, and
+    for the `track` policy a `track` level, holding the track name. Scores are included when present in `positions`.
+
+    Args:
+        video_filenames: unique video filenames
+        video_ids: array of shape (rows,) indexing into `video_filenames`
+        positions: frame index, coordinates and scores of each row, see `SlpReader.read_instances()`
+        node_names: names of the nodes, in the same order as the second axis of `positions.coords`
+        instance_policy: the policy with which the instances were selected, one of `INSTANCE_POLICIES`
+        track_names: names of the tracks, indexed by `positions.instances` for the `track` policy
+
+    Returns:
+        pandas DataFrame of node coordinates, sorted by video filename, frame index and instance
+    """
+    instances = None
+    instance_level = "instance"
+    if instance_policy == "all":
+        instances = positions.instances
+    elif instance_policy == "track":
+        instances = np.array(track_names, dtype=object)[positions.instances]
+        instance_level = "track"
+
+    return coords_to_dataframe(
+        video_filenames,
+        video_ids,
+        positions.frame_inds,
+        positions.coords,
+        node_names,
+        instances=instances,
+        instance_level=instance_level,
+        point_scores=positions.point_scores,
+        instance_scores=positions.instance_scores,
+    )
+
+
+def node_positions_to_dataframe(
+    labels: Union[Labels, SlpReader],
+    nodes: List[Union[str, Node]],
+    instance_policy: InstancePolicy = "first",
+    skeleton_index: Optional[SkeletonIndex] = None,
+    videos: Optional[Collection[str]] = None,
+    frames: Optional[FrameSelection] = None,
+) -> pd.DataFrame:
+    """Extracts a single node from `labels` and returns its coordinates as a pandas DataFrame.
+
+    By default only the first predicted instance in each frame will be used. Other instance policies select
+    the highest scoring instance of each frame (`best`), of each track (`track`), or every instance (`all`),
+    and add point and instance score columns, see `instances_to_dataframe()`.
+
+    If a given frame does not have any predicted instances or the predicted instance does not contain
+    a node in `nodes`, then the coordinates for that node and frame will be set to `numpy.nan` in the
+    resulting dataframe.
+
+    Given a `SlpReader`, coordinates are gathered from the arrays of the file without building `Labels`, which is
+    much faster than `sleap_io.load_slp()`, see `node_positions_to_array()`.
+
+    Args:
+        labels: labels (or a `SlpReader`) from which to extract data
+        nodes: the nodes (or node names) for which to extract data
+        instance_policy: which predicted instances of each frame to extract, one of `INSTANCE_POLICIES`
+        skeleton_index: index of the skeletons of `labels`, see `get_skeleton_index()`. Built if not given
+        videos: filenames of the videos from which to extract data, or None for all videos, see
+            `paws_tools.slp_reader.select_videos()`
+        frames: if provided, only the selected range and stride of frames of each video are extracted
+
+    Returns:
+       pandas DataFrame containing node coordinates, frame index, and video data. The returned dataframe
+       is sorted by video filename and then by frame index, each in ascending order.
+    """
+    node_names = [node.name if isinstance(node, Node) else node for node in nodes]
+    if instance_policy == "first":
+        video_filenames, video_ids, frame_inds, coords = node_positions_to_array(labels, node_names, skeleton_index, videos, frames)
+        return coords_to_dataframe(video_filenames, video_ids, frame_inds, coords, node_names)
+
+    video_filenames, video_ids, positions, track_names = instance_positions_to_array(
+        labels, node_names, instance_policy, skeleton_index, videos, frames
+    )
+    return instances_to_dataframe(video_filenames, video_ids, positions, node_names, instance_policy, track_names)
+
+
+def select_frames(df: pd.DataFrame, videos: Optional[Collection[str]] = None, frames: Optional[FrameSelection] = None) -> pd.DataFrame:
+    """Select rows of a coordinate dataframe by video and frame index, i.e. of data read back from a saved file.
+
+    Selects the same rows as passing `videos` and `frames` to `node_positions_to_dataframe()`.
+
+    Args:
+        df: a `pandas.DataFrame` created by `node_positions_to_dataframe()`, indexed by video and frame index
+        videos: filenames of the videos to keep, or None for all videos, see `paws_tools.slp_reader.select_videos()`
+        frames: if provided, only the selected range and stride of frames of each video are kept
+
+    Returns:
+        the selected rows of `df`, or `df` itself if nothing is unselected
+    """
+    keep = np.ones(len(df), dtype=bool)
+    if videos is not None:
+        keep &= df.index.get_level_values("video").isin(list(videos))
+    if frames is not None and frames.enabled:
+        keep &= frames.mask(df.index.get_level_values("frame_idx").to_numpy())
+    return df if keep.all() else df[keep]
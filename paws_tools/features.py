@@ -0,0 +1,262 @@
+"""Extraction of PAWS behavioral features from paw trajectories.
+
+A Python implementation of the feature extraction performed by the PAWS R package (see `r-scripts/`), operating
+directly on the coordinate dataframes produced by `node_positions_to_dataframe()`. Each video is one trial.
+Trials of equal length are stacked into 2D arrays, so that filtering, velocity and peak detection run as
+vectorized operations over all trials at once.
+
+For each trial the paw trajectory is gap-filled with a cubic spline and smoothed with a Savitzky-Golay filter.
+The trial is split at the first peak of the paw height (the reflexive withdrawal), and features are computed for
+the pre-peak and post-peak phases: maximum height, maximum x and y velocities and distance traveled, plus the
+number and duration of paw shakes after the peak.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import CubicSpline
+from scipy.signal import savgol_filter
+
+from paws_tools.calibration import calibrate_dataframe, conversion_factors
+from paws_tools.dataframe_io import read_dataframe
+from paws_tools.extraction import coords_to_dataframe, get_nodes_for_bodyparts
+from paws_tools.slp_reader import SlpReader
+from paws_tools.transforms import convert_physical_units, invert_y_axis
+
+# Features computed for each phase of a trial, and the additional features computed after the peak
+PHASE_FEATURES = ["max_height", "max_x_velocity", "max_y_velocity", "distance_traveled"]
+SHAKE_FEATURES = ["number_of_shakes", "shaking_duration"]
+
+
+@dataclass
+class FeatureParameters:
+    """Parameters of the feature extraction, mirroring `set_parameters()` of the PAWS R package.
+
+    Attributes:
+        fps: frame rate of the videos, in frames per second
+        window_filter_size: length of the Savitzky-Golay filter used to smooth the trajectory, in seconds
+        window_filter_order: polynomial order of the Savitzky-Golay filters
+        velocity_filter_size: length of the Savitzky-Golay filter used to compute velocities, in seconds
+        shake_filter_size: length of the Savitzky-Golay filter whose residual reveals shakes, in seconds
+        peak_threshold: the peak is the first local maximum of the height reaching this fraction of the maximum height
+        shake_threshold: minimum height of a shake, as a fraction of the maximum height of the trial
+    """
+
+    fps: float = 4000.0
+    window_filter_size: float = 0.03
+    window_filter_order: int = 2
+    velocity_filter_size: float = 0.02
+    shake_filter_size: float = 0.05
+    peak_threshold: float = 0.5
+    shake_threshold: float = 0.05
+
+
+def fill_gaps(values: np.ndarray) -> np.ndarray:
+    """Fill missing values by cubic spline interpolation, equivalent to `zoo::na.spline()`.
+
+    Missing values before the first, or after the last, valid value are filled with the nearest valid value
+    rather than extrapolated.
+
+    Args:
+        values: 1D array possibly containing NaNs
+
+    Returns:
+        gap-filled copy of `values`; all NaN if `values` has no valid values
+    """
+    filled = np.array(values, dtype=np.float64)
+    valid = np.flatnonzero(np.isfinite(filled))
+    if len(valid) == 0 or len(valid) == len(filled):
+        return filled
+
+    first, last = valid[0], valid[-1]
+    missing = np.flatnonzero(~np.isfinite(filled[first : last + 1])) + first
+    if len(missing) > 0:
+        filled[missing] = CubicSpline(valid, filled[valid])(missing)
+    filled[:first] = filled[first]
+    filled[last + 1 :] = filled[last]
+    return filled
+
+
+def _filter_window(seconds: float, fps: float, order: int, n_frames: int) -> Optional[int]:
+    """Convert a filter length in seconds to an odd number of frames, or None if the trial is too short to filter."""
+    window = max(int(round(seconds * fps)), order + 1)
+    window = min(window, n_frames)
+    window -= 1 - window % 2  # windows must be odd
+    return window if window > order else None
+
+
+def _first_true(mask: np.ndarray, default: np.ndarray) -> np.ndarray:
+    """Index of the first True value along each row of `mask`, or `default` for rows without any."""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), default)
+
+
+def _masked_max(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Maximum along each row of `values`, considering only elements where `mask` is True."""
+    return np.where(mask, values, -np.inf).max(axis=1)
+
+
+def extract_trial_features(x: np.ndarray, y: np.ndarray, params: FeatureParameters) -> Dict[str, np.ndarray]:
+    """Compute the features of many trials of equal length at once.
+
+    Args:
+        x: array of shape (trials, frames) holding gap-filled x-coordinates of the paw
+        y: array of shape (trials, frames) holding gap-filled y-coordinates of the paw, increasing upwards
+        params: parameters of the feature extraction
+
+    Returns:
+        dict mapping feature name to an array of shape (trials,)
+    """
+    n_frames = x.shape[1]
+    order = params.window_filter_order
+    delta = 1.0 / params.fps
+
+    window = _filter_window(params.window_filter_size, params.fps, order, n_frames)
+    if window is not None:
+        x = savgol_filter(x, window, order, axis=1)
+        y = savgol_filter(y, window, order, axis=1)
+
+    # velocities are the derivative of a local polynomial fit, which also smooths them
+    window = _filter_window(params.velocity_filter_size, params.fps, order, n_frames)
+    if window is not None:
+        vx = savgol_filter(x, window, order, deriv=1, delta=delta, axis=1)
+        vy = savgol_filter(y, window, order, deriv=1, delta=delta, axis=1)
+    else:
+        vx = np.gradient(x, delta, axis=1) if n_frames > 1 else np.zeros_like(x)
+        vy = np.gradient(y, delta, axis=1) if n_frames > 1 else np.zeros_like(y)
+
+    # height of the paw relative to its starting position, the peak is the first high enough local maximum
+    height = y - y[:, :1]
+    max_height = height.max(axis=1)
+    local_max = np.zeros_like(height, dtype=bool)
+    local_max[:, 1:-1] = (height[:, 1:-1] > height[:, :-2]) & (height[:, 1:-1] >= height[:, 2:])
+    peak = _first_true(local_max & (height >= params.peak_threshold * max_height[:, None]), height.argmax(axis=1))
+
+    frames = np.arange(n_frames)[None, :]
+    phases = {"pre_peak": frames <= peak[:, None], "post_peak": frames >= peak[:, None]}
+    steps = np.hypot(np.diff(x, axis=1), np.diff(y, axis=1))
+
+    features = {"peak_time": peak * delta}
+    for phase, mask in phases.items():
+        features[f"{phase}_max_height"] = _masked_max(height, mask)
+        features[f"{phase}_max_x_velocity"] = _masked_max(np.abs(vx), mask)
+        features[f"{phase}_max_y_velocity"] = _masked_max(np.abs(vy), mask)
+        # a step belongs to a phase when both of its frames do
+        features[f"{phase}_distance_traveled"] = np.where(mask[:, :-1] & mask[:, 1:], steps, 0).sum(axis=1)
+
+    # shakes are peaks of the high frequency residual, remaining after removing the slow paw movement
+    window = _filter_window(params.shake_filter_size, params.fps, order, n_frames)
+    residual = y - savgol_filter(y, window, order, axis=1) if window is not None else np.zeros_like(y)
+    shakes = np.zeros_like(residual, dtype=bool)
+    shakes[:, 1:-1] = (residual[:, 1:-1] > residual[:, :-2]) & (residual[:, 1:-1] >= residual[:, 2:])
+    shakes &= (residual > params.shake_threshold * max_height[:, None]) & phases["post_peak"]
+
+    n_shakes = shakes.sum(axis=1)
+    first_shake = _first_true(shakes, np.zeros(len(shakes), dtype=np.int64))
+    last_shake = n_frames - 1 - _first_true(shakes[:, ::-1], np.full(len(shakes), n_frames - 1))
+    features["post_peak_number_of_shakes"] = n_shakes
+    features["post_peak_shaking_duration"] = np.where(n_shakes > 1, (last_shake - first_shake) * delta, 0.0)
+    return features
+
+
+def trajectories_from_dataframe(df: pd.DataFrame, node: str) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Get the trajectory of `node` in each video of a coordinate dataframe.
+
+    Frames missing from the dataframe, between the first and last frame of a video, are included as NaNs.
+
+    Args:
+        df: dataframe of node coordinates, as produced by `node_positions_to_dataframe()`
+        node: name of the node
+
+    Returns:
+        dict mapping video filename to a tuple of (x, y) arrays, over consecutive frames
+    """
+    if df.index.nlevels > 2:
+        raise ValueError(
+            f"Expected a single instance per frame, but the dataframe is indexed by {df.index.names}; "
+            "extract coordinates with the 'first' or 'best' instance policy"
+        )
+    trajectories = {}
+    for video, video_df in df[node].groupby(level="video", sort=True):
+        frame_inds = video_df.index.get_level_values("frame_idx").to_numpy()
+        offsets = frame_inds - frame_inds.min()
+        xy = np.full((offsets.max() + 1, 2), np.nan)
+        xy[offsets] = video_df[["x", "y"]].to_numpy(dtype=np.float64)
+        trajectories[video] = (xy[:, 0], xy[:, 1])
+    return trajectories
+
+
+def extract_features(df: pd.DataFrame, node: str, params: Optional[FeatureParameters] = None) -> pd.DataFrame:
+    """Extract PAWS features for the trajectory of `node` in each video of a coordinate dataframe.
+
+    Coordinates are used as given, so the y-axis should already be inverted (see `invert_y_axis()`), and
+    should be converted to physical units (see `convert_physical_units()`) for features to be comparable
+    between videos.
+
+    Args:
+        df: dataframe of node coordinates, as produced by `node_positions_to_dataframe()`
+        node: name of the node, typically the paw (i.e. "Toe")
+        params: parameters of the feature extraction, defaults are used if None
+
+    Returns:
+        dataframe indexed by video, with the number of `frames`, `peak_time` in seconds, and the features of each
+        phase, prefixed by `pre_peak_` or `post_peak_`. Features are NaN for videos where `node` was never found
+    """
+    params = params or FeatureParameters()
+    trajectories = trajectories_from_dataframe(df, node)
+    videos = list(trajectories.keys())
+    filled = {video: (fill_gaps(x), fill_gaps(y)) for video, (x, y) in trajectories.items()}
+
+    columns = (
+        ["frames", "peak_time"] + [f"pre_peak_{f}" for f in PHASE_FEATURES] + [f"post_peak_{f}" for f in PHASE_FEATURES + SHAKE_FEATURES]
+    )
+    result = pd.DataFrame(np.nan, index=pd.Index(videos, name="video"), columns=columns)
+
+    # stack trials of equal length, so each group is processed in one vectorized pass
+    by_length: Dict[int, List[str]] = {}
+    for video in videos:
+        if np.isfinite(filled[video][1]).any():
+            by_length.setdefault(len(filled[video][1]), []).append(video)
+    for group in by_length.values():
+        x = np.stack([filled[video][0] for video in group])
+        y = np.stack([filled[video][1] for video in group])
+        for name, values in extract_trial_features(x, y, params).items():
+            result.loc[group, name] = values
+
+    result["frames"] = [len(trajectories[video][0]) for video in videos]
+    return result
+
+
+def load_coordinates(
+    filename: str, node: str, frame_height: int = 512, calibration: Optional[Tuple[str, str, float]] = None
+) -> pd.DataFrame:
+    """Load the coordinates of `node` from a *.slp file, or from a file written by `slp-to-csv`.
+
+    Coordinates read from a *.slp file have their y-axis inverted, and are converted to physical units when
+    `calibration` is given, the same as the files produced by `slp-to-csv`. Other files are returned as stored.
+
+    Args:
+        filename: path to a *.slp file, or to a file in any format supported by `read_dataframe()`
+        node: name of the node to load
+        frame_height: height of the video frames, used to invert the y-axis of *.slp files
+        calibration: tuple of (top_node, bot_node, true_dist), see `compute_conversion_factors()`. Only used for
+            *.slp files
+
+    Returns:
+        dataframe of node coordinates, as produced by `node_positions_to_dataframe()`
+    """
+    if not filename.lower().endswith(".slp"):
+        return read_dataframe(filename)
+
+    # read with `SlpReader` rather than `sleap_io.load_slp()`, which fails on files holding more than one skeleton
+    with SlpReader(filename) as reader:
+        node_names = [n.name for n in get_nodes_for_bodyparts(reader, [node] + (list(calibration[:2]) if calibration is not None else []))]
+        positions = [reader.read_positions(reader.frame_rows(video), node_names) for video in reader.videos]
+        videos = reader.videos
+    video_ids = np.repeat(np.arange(len(videos)), [len(frame_inds) for frame_inds, _ in positions])
+    frame_inds, coords = (np.concatenate(arrays) for arrays in zip(*positions))
+    df = invert_y_axis(coords_to_dataframe(videos, video_ids, frame_inds, coords, node_names), frame_height)
+    if calibration is not None:
+        df = convert_physical_units(df, conversion_factors(calibrate_dataframe(df, *calibration)))
+    return df
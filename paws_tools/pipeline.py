@@ -0,0 +1,185 @@
+"""Threads connected by bounded queues, for overlapping the reading, transformation and writing of data.
+
+A pipeline is built from a `Prefetcher`, which reads items in a background thread ahead of the thread consuming
+them, and any number of `BackgroundConsumer`s, which process items in a background thread while the thread
+producing them moves on to the next. Each queue holds at most `depth` items, and a full queue blocks whichever
+stage feeds it, so the memory held by a pipeline is bounded however fast or slow each stage is.
+
+Reading HDF5 datasets, writing and compressing files, and much of numpy release the GIL, so I/O bound stages
+overlap well with each other and with computation. CPU bound stages holding the GIL (i.e. building dataframes
+and plotting) do not overlap with each other; they are spread over worker processes instead, each running its
+own pipeline, see `streaming.stream_slp_to_csv()`.
+
+An exception raised by any stage stops the whole pipeline, and is re-raised in the thread which built it.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Generic, Iterable, Iterator, Optional, TypeVar
+
+from paws_tools.constants import DEFAULT_PIPELINE_DEPTH
+
+T = TypeVar("T")
+
+# Marks the end of the items of a queue
+_DONE = object()
+
+# Seconds between checks of whether the other end of a queue has stopped, while blocked on it
+_POLL_SECONDS = 0.1
+
+
+def _put(items: "queue.Queue[Any]", item: Any, stopped: threading.Event) -> bool:
+    """Put `item` on `items`, blocking while the queue is full, unless `stopped` is set.
+
+    Returns:
+        True if the item was queued, False if `stopped` was set first
+    """
+    while not stopped.is_set():
+        try:
+            items.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class Prefetcher(Generic[T]):
+    """Iterate over an iterable in a background thread, reading up to `depth` items ahead of the consumer.
+
+    Use as a context manager, so that the thread is stopped if the consumer stops early:
+
+        with Prefetcher(read_chunks()) as chunks:
+            for chunk in chunks:
+                ...
+    """
+
+    def __init__(self, iterable: Iterable[T], depth: int = DEFAULT_PIPELINE_DEPTH, name: str = "paws-tools-prefetch"):
+        """Start iterating over `iterable` in a background thread.
+
+        Args:
+            iterable: items to read; it is only iterated by the background thread
+            depth: maximum number of items read ahead of the consumer
+            name: name of the background thread
+        """
+        self._items: "queue.Queue[Any]" = queue.Queue(maxsize=max(depth, 1))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(iterable,), name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self, iterable: Iterable[T]) -> None:
+        """Background thread, queueing each item of `iterable`, then `_DONE` or the exception raised."""
+        try:
+            for item in iterable:
+                if not _put(self._items, (item, None), self._stopped):
+                    return
+            _put(self._items, (_DONE, None), self._stopped)
+        except BaseException as e:  # pylint: disable=broad-except
+            _put(self._items, (_DONE, e), self._stopped)
+
+    def __iter__(self) -> Iterator[T]:
+        """Iterate over the items, in order, re-raising any exception raised while reading them."""
+        while True:
+            item, error = self._items.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+
+    def close(self) -> None:
+        """Stop reading, waiting for the item being read, if any."""
+        self._stopped.set()
+        self._thread.join()
+
+    def __enter__(self) -> "Prefetcher[T]":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, *args) -> None:
+        """Exit the context manager, stopping the background thread."""
+        self.close()
+
+
+class BackgroundConsumer(Generic[T]):
+    """Call a function on items in a background thread, with at most `depth` items waiting.
+
+    Use as a context manager, which waits for every item put to be processed, unless an exception is raised
+    within it, in which case items still waiting are dropped:
+
+        with BackgroundConsumer(write_chunk) as writer:
+            for chunk in chunks:
+                writer.put(chunk)
+    """
+
+    def __init__(self, func: Callable[[T], None], depth: int = DEFAULT_PIPELINE_DEPTH, name: str = "paws-tools-consumer"):
+        """Start the background thread.
+
+        Args:
+            func: function called on each item, in the order they were put
+            depth: maximum number of items waiting to be processed, beyond which `put()` blocks
+            name: name of the background thread
+        """
+        self._func = func
+        self._items: "queue.Queue[Any]" = queue.Queue(maxsize=max(depth, 1))
+        self._stopped = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """Background thread, processing items until `_DONE`, or until an item fails or the consumer is stopped."""
+        while not self._stopped.is_set():
+            try:
+                item = self._items.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            try:
+                self._func(item)
+            except BaseException as e:  # pylint: disable=broad-except
+                self._error = e
+                self._stopped.set()
+                return
+
+    def _raise_error(self) -> None:
+        """Re-raise the exception raised by the background thread, if any."""
+        if self._error is not None:
+            raise self._error
+
+    def put(self, item: T) -> None:
+        """Queue `item` to be processed, blocking while `depth` items are already waiting.
+
+        Raises:
+            BaseException: the exception raised by the function on a previous item, if any
+        """
+        self._raise_error()
+        if not _put(self._items, item, self._stopped):
+            self._raise_error()
+            raise RuntimeError("Cannot put items to a stopped consumer")
+
+    def close(self) -> None:
+        """Wait for every item put to be processed.
+
+        Raises:
+            BaseException: the exception raised by the function on any item, if any
+        """
+        _put(self._items, _DONE, self._stopped)
+        self._thread.join()
+        self._raise_error()
+
+    def abort(self) -> None:
+        """Stop processing, dropping any items still waiting, and wait for the item being processed, if any."""
+        self._stopped.set()
+        self._thread.join()
+
+    def __enter__(self) -> "BackgroundConsumer[T]":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        """Exit the context manager, waiting for every item to be processed, or aborting if an exception was raised."""
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
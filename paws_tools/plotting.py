@@ -0,0 +1,411 @@
+"""Plots of the y-coordinate traces of body-parts over time, one per video, or an overview of every video.
+
+Traces are reduced to about two points per pixel column before drawing (see `decimate_trace()`), so the cost of
+a plot is bound by its size rather than by the number of frames. Single trace plots are drawn on one reused figure
+per process, and embed a digest of the plotted data so that unchanged plots can be skipped.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union, cast
+
+import numpy as np
+import pandas as pd
+from sleap_io import Node
+from tqdm import tqdm
+
+from paws_tools.constants import OverviewLayout
+from paws_tools.dataframe_io import read_dataframe
+from paws_tools.profiling import Metrics, file_size, stage
+
+if TYPE_CHECKING:
+    # plotting libraries are slow to import, so they are only imported when plotting
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+
+# Default maximum number of points drawn per trace, about two per pixel column of the default figure
+DEFAULT_MAX_PLOT_POINTS = 4000
+
+# Key of the PNG text chunk holding the digest of the data a plot was rendered from
+PLOT_DIGEST_KEY = "paws-tools:data-digest"
+
+# Version of the look of trace plots, part of their digest so that plots made in an older style are re-rendered
+PLOT_STYLE_VERSION = 2
+
+# Size in inches of single trace plots, and of each panel of an overview grid, see `plot_overview()`
+TRACE_FIGSIZE = (20.0, 10.0)
+OVERVIEW_PANEL_SIZE = (6.0, 3.5)
+
+# Largest width or height, in pixels, of an overview grid; the resolution is reduced to fit
+OVERVIEW_MAX_PIXELS = 12_000
+
+# Reusable figures of this process, keyed by size, see `_get_trace_figure()`
+_TRACE_FIGURES: Dict[Tuple[float, float], "Figure"] = {}
+
+
+def get_plot_filename(group: str, dest_dir: str, nodes: List[Union[Node, str]], suffix: Optional[str] = None, format: str = "png") -> str:
+    """Get the path of the file which the trace plot for `group` (i.e. a video filename) should be saved to.
+
+    Args:
+        group: name of the group, typically a video filename
+        dest_dir: destination directory for the produced plots
+        nodes: bodyparts which are plotted
+        suffix: any suffix to add to the resulting filenames, just prior to the file extension
+        format: format for the saved plots
+
+    Returns:
+        path of the form `{dest_dir}/{basename of group}_[{nodes}]_ycord_vs_time.{suffix}.{format}`
+    """
+    node_names = "_".join([node.name if isinstance(node, Node) else node for node in nodes])
+    full_suffix = f"{suffix}.{format}" if suffix is not None else format
+    return os.path.join(dest_dir, f"{os.path.basename(group)}_[{node_names}]_ycord_vs_time.{full_suffix}")
+
+
+def get_overview_filename(slp_file: str, dest_dir: str, suffix: Optional[str] = None, layout: OverviewLayout = "pdf") -> str:
+    """Get the path of the overview plot of every video of `slp_file`, see `plot_overview()`.
+
+    Args:
+        slp_file: path to the *.slp file
+        dest_dir: destination directory for the produced plots
+        suffix: any suffix to add to the filename (i.e. the units), just prior to the file extension
+        layout: layout of the overview, a 'pdf' is saved as *.pdf and a 'grid' as *.png
+
+    Returns:
+        path of the form `{dest_dir}/{basename of slp_file}.{suffix}.overview.{pdf|png}`
+    """
+    base = os.path.splitext(os.path.basename(slp_file))[0]
+    extension = "pdf" if layout == "pdf" else "png"
+    full_suffix = f"{suffix}.overview.{extension}" if suffix is not None else f"overview.{extension}"
+    return os.path.join(dest_dir, f"{base}.{full_suffix}")
+
+
+def decimate_trace(x: np.ndarray, y: np.ndarray, max_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduce a trace to at most `max_points` points, while preserving its visual envelope.
+
+    The trace is split into `max_points // 2` bins (i.e. roughly one per pixel column of the plot), and
+    only the minimum and maximum of each bin are kept, in their original order. Bins containing only
+    NaNs are kept as NaNs so that gaps remain visible.
+
+    Args:
+        x: x-values of the trace, i.e. frame indices
+        y: y-values of the trace
+        max_points: maximum number of points to return
+
+    Returns:
+        tuple of (x, y) decimated arrays; the original arrays if they are already short enough
+    """
+    n_bins = max(max_points // 2, 1)
+    if len(y) <= 2 * n_bins:
+        return x, y
+
+    bin_size = int(np.ceil(len(y) / n_bins))
+    binned = np.pad(y.astype(np.float64), (0, n_bins * bin_size - len(y)), constant_values=np.nan).reshape(n_bins, bin_size)
+    missing = np.isnan(binned)
+    arg_min = np.argmin(np.where(missing, np.inf, binned), axis=1)
+    arg_max = np.argmax(np.where(missing, -np.inf, binned), axis=1)
+
+    bin_starts = (np.arange(n_bins) * bin_size)[:, None]
+    pos = np.minimum(np.sort(np.stack([arg_min, arg_max], axis=1), axis=1) + bin_starts, len(y) - 1).ravel()
+    y_out = y[pos].astype(np.float64)
+    y_out[np.repeat(missing.all(axis=1), 2)] = np.nan
+    return x[pos], y_out
+
+
+def _plot_digest(df: pd.DataFrame, *params) -> str:
+    """Compute a digest of the data and parameters that determine a plot."""
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(repr((df.columns.tolist(),) + params).encode())
+    return digest.hexdigest()
+
+
+def _read_plot_digest(filename: str) -> Optional[str]:
+    """Read the digest stored in a previously saved PNG plot, if any.
+
+    Only the chunks preceding the image data are parsed, where matplotlib saves text metadata, without decoding
+    the image itself.
+    """
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+
+    try:
+        with Image.open(filename) as img:
+            return img.info.get(PLOT_DIGEST_KEY)
+    except OSError:
+        return None
+
+
+def _lod_points(max_points: Optional[int], width_px: float) -> Optional[int]:
+    """Get the number of points to draw per trace on axes `width_px` pixels wide, see `decimate_trace()`.
+
+    About two points per pixel column are enough to draw the envelope of a trace, so the cost of drawing is
+    proportional to the size of the image rather than to the number of frames.
+    """
+    if max_points is None:
+        return None
+    return max(min(max_points, 2 * int(np.ceil(width_px))), 2)
+
+
+def _get_trace_figure(figsize: Tuple[float, float]) -> Tuple["Figure", "Axes"]:
+    """Get the reusable figure of this process for single trace plots of size `figsize`, with its axes cleared.
+
+    Creating and tearing down a figure for every plot costs about as much as drawing a decimated trace, so
+    plots are drawn on one figure per process. Figures are not managed by pyplot, so they are never shown.
+    """
+    from matplotlib.figure import Figure  # pylint: disable=import-outside-toplevel
+
+    fig = _TRACE_FIGURES.get(figsize)
+    if fig is None:
+        fig = _TRACE_FIGURES[figsize] = Figure(figsize=figsize)
+        fig.subplots()
+    ax = fig.axes[0]
+    ax.clear()
+    return fig, ax
+
+
+def _draw_traces(ax: "Axes", df: pd.DataFrame, nodes: List[str], title: str, max_points: Optional[int], panel: bool = False) -> None:
+    """Draw the y-coordinate traces of `nodes` in `df`, holding a single video, on `ax`.
+
+    Args:
+        ax: axes to draw on
+        df: a `pandas.DataFrame` created by `paws_tools.extraction.node_positions_to_dataframe()`, of a single video
+        nodes: bodyparts for which to plot
+        title: title of the axes
+        max_points: maximum number of points to draw per trace, see `decimate_trace()`. If None, all points are drawn
+        panel: if True, the axes are a panel of an overview, with a compact legend inside the axes
+    """
+    import seaborn as sns  # pylint: disable=import-outside-toplevel
+    from matplotlib.ticker import MaxNLocator  # pylint: disable=import-outside-toplevel
+
+    # dataframes holding many instances per frame get one trace per instance, see `paws_tools.extraction.instances_to_dataframe()`
+    instance_level = next((name for name in df.index.names if name not in ("video", "frame_idx")), None)
+    if instance_level is not None:
+        instances = [(f" ({key})", inst_df) for key, inst_df in df.groupby(level=instance_level, sort=True)]
+    else:
+        instances = [("", df)]
+    palette = sns.color_palette("Paired", len(nodes) * len(instances))
+
+    legend = []
+    for i, node in enumerate(nodes):
+        for j, (label, inst_df) in enumerate(instances):
+            x, y = inst_df.index.get_level_values("frame_idx").to_numpy(), inst_df[(node, "y")].to_numpy()
+            if max_points is not None:
+                x, y = decimate_trace(x, y, max_points)
+            ax.plot(x, y, c=palette[i * len(instances) + j])
+            legend.append(f"{node}{label}")
+
+    if panel:
+        ax.legend(legend, loc="upper right", fontsize="small")
+    else:
+        ax.set_ylabel("Bodypart Y Position")
+        ax.set_xlabel("Frame Index")
+        ax.legend(legend)
+        sns.move_legend(ax, "upper left", bbox_to_anchor=(1, 1))
+    ax.set_title(title)
+
+    # the number of ticks follows the length of the axis, rather than the number of frames
+    max_x = int(df.index.get_level_values("frame_idx").max()) if len(df) > 0 else 0
+    ax.xaxis.set_major_locator(MaxNLocator(nbins="auto", integer=True))
+    ax.tick_params(axis="x", labelrotation=90)
+    ax.set_xlim(-10, max_x + 10)
+
+
+def plot_bodyparts_y_pos_over_time(
+    df: Union[pd.DataFrame, str],
+    dest_dir: str,
+    nodes: List[Union[Node, str]],
+    ax: Optional["Axes"] = None,
+    suffix: Optional[str] = None,
+    format: str = "png",
+    max_points: Optional[int] = DEFAULT_MAX_PLOT_POINTS,
+    skip_unchanged: bool = False,
+) -> str:
+    """Plot the y-coordinate of each of `nodes` over time, for a single video, and save the plot to `dest_dir`.
+
+    Unless `ax` is given, plots are drawn on a figure which is reused by every plot made in this process, see
+    `_get_trace_figure()`. With `skip_unchanged`, a digest of the plotted data is embedded in the saved png, and
+    the plot is not drawn again while the existing png holds the same digest.
+
+    Args:
+        df: a `pandas.DataFrame` created by `paws_tools.extraction.node_positions_to_dataframe()`, or a path to a file
+            containing equivelent data
+        dest_dir: file path for the destination directory
+        nodes: bodyparts for which to plot
+        ax: Axes to plot on, if not provided, the reused figure is drawn on
+        suffix: any suffix to add to the resulting filenames, just prior to the file extension
+        format: format for the saved plots, 'png' is the default
+        max_points: maximum number of points to draw per trace, longer traces are reduced with `decimate_trace()`.
+            At most two points per pixel column of the figure are drawn. If None, all points are drawn
+        skip_unchanged: if True, and a png plot made from identical data already exists, do not plot again
+
+    Returns:
+        path of the saved plot
+    """
+    if isinstance(df, str):
+        df = read_dataframe(df)
+
+    # convert nodes to strings
+    str_nodes = [node.name if isinstance(node, Node) else node for node in nodes]
+
+    video_name = os.path.basename(df.index.get_level_values("video")[0])
+    node_names = "_".join([node for node in str_nodes])
+
+    # ensure destination directory exists
+    os.makedirs(dest_dir, exist_ok=True)
+    dest = get_plot_filename(video_name, dest_dir, str_nodes, suffix, format)
+
+    # the digest of the plotted data is embedded in the png, so unchanged plots can be skipped next time
+    metadata = None
+    if skip_unchanged and format == "png" and ax is None:
+        metadata = {PLOT_DIGEST_KEY: _plot_digest(df[[(node, "y") for node in str_nodes]], max_points, PLOT_STYLE_VERSION)}
+        if os.path.exists(dest) and _read_plot_digest(dest) == metadata[PLOT_DIGEST_KEY]:
+            return dest
+
+    if ax is None:
+        fig, ax = _get_trace_figure(TRACE_FIGSIZE)
+    else:
+        fig = cast("Figure", ax.get_figure())
+
+    _draw_traces(ax, df, str_nodes, f"{video_name}_[{node_names}]_ycord_vs_time", _lod_points(max_points, fig.get_figwidth() * fig.dpi))
+    fig.tight_layout()
+    fig.savefig(dest, metadata=metadata)
+
+    return dest
+
+
+def init_plot_worker() -> None:
+    """Process pool initializer, forcing the non-interactive Agg backend for rendering plots."""
+    import matplotlib  # pylint: disable=import-outside-toplevel
+
+    matplotlib.use("Agg", force=True)
+
+
+def plot_grouped_bodyparts_y_pos_over_time(
+    df: pd.DataFrame,
+    dest_dir: str,
+    nodes: List[Union[Node, str]],
+    suffix: Optional[str] = None,
+    format: str = "png",
+    max_points: Optional[int] = DEFAULT_MAX_PLOT_POINTS,
+    skip_unchanged: bool = True,
+    jobs: int = 1,
+    metrics: Optional[Metrics] = None,
+) -> List[str]:
+    """Plot the traces of each video in `df` to a separate file, see `plot_bodyparts_y_pos_over_time()`.
+
+    Plots are rendered directly from the in-memory dataframe. With `jobs` > 1, plots are rendered in a pool
+    of processes using the non-interactive Agg backend.
+
+    Args:
+        df: a `pandas.DataFrame` created by `paws_tools.extraction.node_positions_to_dataframe()`, possibly containing
+            many videos
+        dest_dir: file path for the destination directory
+        nodes: bodyparts for which to plot
+        suffix: any suffix to add to the resulting filenames, just prior to the file extension
+        format: format for the saved plots, 'png' is the default
+        max_points: maximum number of points to draw per trace, see `plot_bodyparts_y_pos_over_time()`
+        skip_unchanged: if True, do not re-render png plots whose data is unchanged
+        jobs: number of worker processes to use
+        metrics: if provided, the time taken to plot each video is recorded here, or the time taken to plot all
+            videos when `jobs` > 1, see `paws_tools.profiling`
+
+    Returns:
+        list of paths of the saved plots
+    """
+    str_nodes = [node.name if isinstance(node, Node) else node for node in nodes]
+    kwargs: Dict[str, Any] = dict(suffix=suffix, format=format, max_points=max_points, skip_unchanged=skip_unchanged)
+
+    # only the plotted columns are needed, which also keeps the data sent to worker processes small
+    plot_df = df[[(node, "y") for node in str_nodes]]
+    groups = [group_df for _, group_df in plot_df.groupby(level="video", sort=True)]
+
+    if jobs > 1:
+        with stage(metrics, "plot", frames=len(plot_df)) as counters, ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_plot_worker
+        ) as pool:
+            futures = [pool.submit(plot_bodyparts_y_pos_over_time, group_df, dest_dir, str_nodes, **kwargs) for group_df in groups]
+            for _ in tqdm(as_completed(futures), total=len(futures), desc=f"Generating Plots ({suffix})", leave=False):
+                pass
+            plot_files = [future.result() for future in futures]
+            counters["bytes_written"] = sum(file_size(fn) for fn in plot_files)
+            return plot_files
+
+    plot_files = []
+    for group_df in tqdm(groups, desc=f"Generating Plots ({suffix})", leave=False):
+        video = group_df.index.get_level_values("video")[0]
+        with stage(metrics, "plot", video, frames=len(group_df)) as counters:
+            plot_files.append(plot_bodyparts_y_pos_over_time(group_df, dest_dir, str_nodes, **kwargs))
+            counters["bytes_written"] = file_size(plot_files[-1])
+    return plot_files
+
+
+def plot_overview(
+    sources: Union[pd.DataFrame, Dict[str, Union[pd.DataFrame, str]]],
+    dest: str,
+    nodes: List[Union[Node, str]],
+    layout: OverviewLayout = "pdf",
+    max_points: Optional[int] = DEFAULT_MAX_PLOT_POINTS,
+) -> str:
+    """Plot the traces of every video to a single file, in one pass over the videos.
+
+    With the 'pdf' layout, each video is drawn on a page of a multi-page PDF, sized as the plots of
+    `plot_bodyparts_y_pos_over_time()`, reusing a single figure for every page. With the 'grid' layout, each video
+    is drawn on a panel of a single png image, whose resolution is reduced to keep the image at most
+    `OVERVIEW_MAX_PIXELS` wide and high. Either way, traces are reduced to two points per pixel column, so the cost
+    of plotting is bound by the size of the pages or panels rather than by the number of frames.
+
+    Args:
+        sources: a `pandas.DataFrame` created by `paws_tools.extraction.node_positions_to_dataframe()` holding many
+            videos, or a dict mapping the name of each video to such a dataframe, or to the path of a file holding the
+            video's data (i.e. as saved by `paws_tools.dataframe_io.save_dataframe_to_grouped_csv()`). Files are read
+            one at a time
+        dest: path of the saved overview, see `get_overview_filename()`
+        nodes: bodyparts for which to plot
+        layout: 'pdf' for a page per video, or 'grid' for a panel per video
+        max_points: maximum number of points to draw per trace, see `decimate_trace()`. If None, all points are drawn
+
+    Returns:
+        path of the saved overview
+    """
+    if isinstance(sources, pd.DataFrame):
+        sources = {str(video): video_df for video, video_df in sources.groupby(level="video", sort=True)}
+    str_nodes = [node.name if isinstance(node, Node) else node for node in nodes]
+    node_names = "_".join(str_nodes)
+
+    def load(video: str, source: Union[pd.DataFrame, str]) -> pd.DataFrame:
+        if isinstance(source, str):
+            source = read_dataframe(source)
+        return source[source.index.get_level_values("video") == video]
+
+    dest_dir = os.path.dirname(dest)
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+    videos = sorted(sources)
+
+    if layout == "pdf":
+        from matplotlib.backends.backend_pdf import PdfPages  # pylint: disable=import-outside-toplevel
+
+        with PdfPages(dest) as pdf:
+            for video in tqdm(videos, desc="Generating Overview", leave=False):
+                fig, ax = _get_trace_figure(TRACE_FIGSIZE)
+                title = f"{os.path.basename(video)}_[{node_names}]_ycord_vs_time"
+                _draw_traces(ax, load(video, sources[video]), str_nodes, title, _lod_points(max_points, fig.get_figwidth() * fig.dpi))
+                fig.tight_layout()
+                pdf.savefig(fig)
+        return dest
+
+    from matplotlib.figure import Figure  # pylint: disable=import-outside-toplevel
+
+    ncols = max(int(np.ceil(np.sqrt(len(videos)))), 1)
+    nrows = max(int(np.ceil(len(videos) / ncols)), 1)
+    figsize = (OVERVIEW_PANEL_SIZE[0] * ncols, OVERVIEW_PANEL_SIZE[1] * nrows)
+    fig = Figure(figsize=figsize, dpi=min(100.0, OVERVIEW_MAX_PIXELS / max(figsize)))
+    axes = np.atleast_1d(fig.subplots(nrows, ncols, squeeze=False)).ravel()
+    panel_points = _lod_points(max_points, OVERVIEW_PANEL_SIZE[0] * fig.dpi)
+    for ax, video in zip(axes, tqdm(videos, desc="Generating Overview", leave=False)):
+        _draw_traces(ax, load(video, sources[video]), str_nodes, os.path.basename(video), panel_points, panel=True)
+    for ax in axes[len(videos) :]:
+        ax.set_axis_off()
+    fig.suptitle(f"[{node_names}] ycord vs time")
+    fig.tight_layout()
+    fig.savefig(dest)
+    return dest
@@ -0,0 +1,252 @@
+"""Per-stage timing, memory and throughput metrics of conversions.
+
+Each stage of a conversion (loading, extraction, y-inversion, calibration, writing, plotting, etc) is wrapped in
+`stage()`, which records its wall time, CPU time, the number of frames processed and bytes written, per stage and
+per video. Repeated calls for the same stage and video (i.e. once per chunk of frames) are accumulated. Stages
+may optionally be run under `cProfile`, with the statistics of each stage and video dumped to a separate file.
+
+Peak resident set size (RSS) is the high-water mark of the process at the end of a stage, so it is only ever
+increasing; the first stage at which it jumps is the one which needed the memory.
+
+Stages may be measured from many threads at once (i.e. by a pipelined conversion, see `paws_tools.pipeline`),
+in which case their wall times overlap, and CPU time, which is that of the whole process, is shared between the
+stages running at the same time. Only stages run in the main thread are profiled with `cProfile`.
+"""
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from paws_tools import __version__
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore[assignment]
+
+# Counters which may be set within a stage, see `Metrics.stage()`
+COUNTERS = ["frames", "bytes_written"]
+
+# Fields of a record which are summed when records are combined
+SUMMED_FIELDS = ["calls", "wall_seconds", "cpu_seconds"] + COUNTERS
+
+
+def peak_rss_bytes(children: bool = False) -> Optional[int]:
+    """Get the peak resident set size of this process, or of its terminated child processes.
+
+    Args:
+        children: if True, get the largest peak of any terminated child process rather than of this process
+
+    Returns:
+        peak resident set size in bytes, or None if it cannot be determined on this platform
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS, and in kilobytes elsewhere
+    return int(maxrss) if sys.platform == "darwin" else int(maxrss) * 1024
+
+
+def _empty_record() -> Dict[str, Any]:
+    """Get a record of a stage which has not run yet."""
+    return {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "frames": 0, "bytes_written": 0}
+
+
+def _with_rates(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Add throughput rates to a record."""
+    wall = record["wall_seconds"]
+    return {
+        **record,
+        "frames_per_second": record["frames"] / wall if wall > 0 else None,
+        "bytes_per_second": record["bytes_written"] / wall if wall > 0 else None,
+    }
+
+
+def file_size(filename: str) -> int:
+    """Get the size of a file in bytes, or 0 if it does not exist."""
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+class Metrics:
+    """Collect per-stage, per-video metrics of a conversion.
+
+    Metrics collected in worker processes are returned to the parent and combined with `merge()`; `Metrics` are
+    picklable once `dump_profiles()` has been called.
+    """
+
+    def __init__(self, cprofile_dir: Optional[str] = None):
+        """Start collecting metrics.
+
+        Args:
+            cprofile_dir: if provided, run every stage under `cProfile` and dump the statistics of each stage
+                and video to `{cprofile_dir}/{stage}[.{video basename}].prof`
+        """
+        self.cprofile_dir = cprofile_dir
+        self.records: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+        self._profilers: Dict[Tuple[str, Optional[str]], cProfile.Profile] = {}
+        self._lock = threading.Lock()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = self._cpu_time()
+
+    @staticmethod
+    def _cpu_time() -> float:
+        """Get the CPU time used by this process and its terminated child processes, in seconds."""
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Get the state for pickling, without any profilers or lock which cannot be pickled."""
+        state = self.__dict__.copy()
+        state["_profilers"] = {}
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restore the state after unpickling, with a new lock."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, video: Optional[str] = None, frames: int = 0) -> Iterator[Dict[str, int]]:
+        """Measure a stage of the conversion.
+
+        Stages must not be nested, as only one profiler may be active at a time. Stages may be measured from
+        any thread, but are only profiled in the main thread.
+
+        Args:
+            name: name of the stage
+            video: video the stage is processing, if any
+            frames: number of frames processed by the stage, if known in advance
+
+        Yields:
+            dict of counters (`COUNTERS`) which may be updated within the stage, i.e. `counters["bytes_written"] = n`
+        """
+        key = (name, video)
+        counters = {"frames": frames, "bytes_written": 0}
+        profiler = None
+        if self.cprofile_dir is not None and threading.current_thread() is threading.main_thread():
+            profiler = self._profilers.setdefault(key, cProfile.Profile())
+            profiler.enable()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield counters
+        finally:
+            wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            if profiler is not None:
+                profiler.disable()
+            with self._lock:
+                record = self.records.setdefault(key, _empty_record())
+                record["calls"] += 1
+                record["wall_seconds"] += wall
+                record["cpu_seconds"] += cpu
+                for counter in COUNTERS:
+                    record[counter] += counters[counter]
+                record["peak_rss_bytes"] = peak_rss_bytes()
+
+    def merge(self, other: "Metrics") -> None:
+        """Add the records of `other`, i.e. collected in a worker process, to these metrics.
+
+        Args:
+            other: metrics to merge into these
+        """
+        for key, other_record in other.records.items():
+            record = self.records.setdefault(key, _empty_record())
+            for field in SUMMED_FIELDS:
+                record[field] += other_record[field]
+            peaks = [rss for rss in (record.get("peak_rss_bytes"), other_record.get("peak_rss_bytes")) if rss is not None]
+            record["peak_rss_bytes"] = max(peaks) if len(peaks) > 0 else None
+
+    def dump_profiles(self) -> List[str]:
+        """Dump the `cProfile` statistics of each stage and video, see `Metrics.__init__()`.
+
+        Returns:
+            list of paths of the dumped statistics
+        """
+        if self.cprofile_dir is None:
+            return []
+
+        os.makedirs(self.cprofile_dir, exist_ok=True)
+        dumped = []
+        for (name, video), profiler in self._profilers.items():
+            basename = f"{name}.{os.path.splitext(os.path.basename(video))[0]}" if video is not None else name
+            dest = os.path.join(self.cprofile_dir, f"{basename}.prof")
+            profiler.dump_stats(dest)
+            dumped.append(dest)
+        self._profilers = {}
+        return dumped
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summarize the metrics collected so far.
+
+        Returns:
+            JSON serializable dict holding the overall wall time, CPU time and peak RSS, the metrics of each
+            stage and video (`stages`), and the metrics of each stage summed over all videos (`totals`)
+        """
+        totals: Dict[str, Dict[str, Any]] = {}
+        for (name, _), record in self.records.items():
+            total = totals.setdefault(name, _empty_record())
+            for field in SUMMED_FIELDS:
+                total[field] += record[field]
+
+        return {
+            "version": __version__,
+            "wall_seconds": time.perf_counter() - self._start_wall,
+            "cpu_seconds": self._cpu_time() - self._start_cpu,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "children_peak_rss_bytes": peak_rss_bytes(children=True),
+            "stages": [_with_rates({"stage": name, "video": video, **record}) for (name, video), record in self.records.items()],
+            "totals": {name: _with_rates(total) for name, total in totals.items()},
+        }
+
+    def write(self, dest: str) -> None:
+        """Write the summary of the metrics, see `Metrics.to_dict()`, as a JSON file.
+
+        Args:
+            dest: path of the file to write
+        """
+        with open(dest, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def report(self) -> str:
+        """Format the metrics of each stage, summed over all videos, as a table for printing.
+
+        Returns:
+            multi-line string with one row per stage, in the order stages first ran
+        """
+        summary = self.to_dict()
+        lines = [f"{'stage':<16}{'calls':>8}{'wall (s)':>12}{'cpu (s)':>12}{'frames/s':>14}{'MB written':>12}"]
+        for name, total in summary["totals"].items():
+            fps = f"{total['frames_per_second']:,.0f}" if total["frames"] > 0 and total["frames_per_second"] is not None else ""
+            written = f"{total['bytes_written'] / 1e6:.1f}" if total["bytes_written"] > 0 else ""
+            lines.append(f"{name:<16}{total['calls']:>8}{total['wall_seconds']:>12.3f}{total['cpu_seconds']:>12.3f}{fps:>14}{written:>12}")
+
+        peak = summary["peak_rss_bytes"]
+        lines.append(f"Total: {summary['wall_seconds']:.3f}s wall, {summary['cpu_seconds']:.3f}s cpu")
+        if peak is not None:
+            lines[-1] += f", peak RSS {peak / 1e6:.0f} MB"
+        return "\n".join(lines)
+
+
+def stage(metrics: Optional[Metrics], name: str, video: Optional[str] = None, frames: int = 0) -> ContextManager[Dict[str, int]]:
+    """Measure a stage of the conversion with `metrics`, or do nothing if `metrics` is None.
+
+    Args:
+        metrics: metrics to record the stage in, or None
+        name: name of the stage
+        video: video the stage is processing, if any
+        frames: number of frames processed by the stage, if known in advance
+
+    Returns:
+        context manager yielding a dict of counters, see `Metrics.stage()`
+    """
+    if metrics is None:
+        return nullcontext({"frames": frames, "bytes_written": 0})
+    return metrics.stage(name, video, frames)
@@ -0,0 +1,188 @@
+"""Index of the nodes of the skeletons of a SLEAP dataset.
+
+A `SkeletonIndex` is built once per dataset, from `Labels.skeletons` or `SlpReader.skeletons`, and resolves
+body-part names and patterns to node names, and node names to the position of each node within each skeleton.
+Datasets may hold more than one skeleton; the index covers the nodes of all of them, in the order they first
+appear, and nodes missing from a skeleton map to column -1 (or None) of that skeleton.
+
+Body-parts may be given as:
+- a node name, i.e. `Toe`
+- the special value `all`, selecting every node
+- a glob pattern, i.e. `Toe*` or `*_Box`, matched against whole node names
+- a regular expression prefixed by `re:`, i.e. `re:(Toe|Heel)`, matched against whole node names
+"""
+
+import fnmatch
+import re
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from sleap_io import Node, Skeleton
+
+# Prefix marking a body-part as a regular expression rather than a node name or glob pattern
+REGEX_PREFIX = "re:"
+
+# Characters marking a body-part as a glob pattern
+GLOB_CHARS = "*?["
+
+
+class SkeletonIndex:
+    """Resolve body-part names and patterns to nodes, and node names to columns of each skeleton."""
+
+    def __init__(self, skeletons: Iterable[Skeleton]):
+        """Index the nodes of `skeletons`.
+
+        Args:
+            skeletons: skeletons of the dataset, in the order they are stored
+        """
+        self.skeletons: List[Skeleton] = list(skeletons)
+        self.node_names: List[str] = []
+        self._index: Dict[str, int] = {}
+        # position of each node name within each skeleton, -1 where a skeleton lacks the node
+        self._positions: Dict[str, List[int]] = {}
+        self._nodes: Dict[str, List[Optional[Node]]] = {}
+        for s, skeleton in enumerate(self.skeletons):
+            for i, node in enumerate(skeleton.nodes):
+                if node.name not in self._positions:
+                    self._index[node.name] = len(self.node_names)
+                    self.node_names.append(node.name)
+                    self._positions[node.name] = [-1] * len(self.skeletons)
+                    self._nodes[node.name] = [None] * len(self.skeletons)
+                self._positions[node.name][s] = i
+                self._nodes[node.name][s] = node
+        self._columns: Dict[Tuple[str, ...], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        """Get the number of distinct node names over all skeletons."""
+        return len(self.node_names)
+
+    def __contains__(self, name: object) -> bool:
+        """Check whether any skeleton has a node named `name`."""
+        return name in self._index
+
+    def index(self, name: str) -> int:
+        """Get the position of a node name within `SkeletonIndex.node_names`.
+
+        Args:
+            name: name of the node
+
+        Returns:
+            position of the node within `node_names`
+
+        Raises:
+            KeyError: if no skeleton has a node named `name`
+        """
+        if name not in self._index:
+            raise KeyError(self._missing_message(name))
+        return self._index[name]
+
+    def _missing_message(self, body_part: str) -> str:
+        """Format the error message for a body-part which matched no node."""
+        return f"Unable to find bodypart \"{body_part}\" in the skeleton! Available bodyparts: [{', '.join(self.node_names)}]"
+
+    def match(self, body_part: Union[str, Node]) -> List[str]:
+        """Get the names of the nodes matching a single body-part name or pattern, see the module docstring.
+
+        Args:
+            body_part: node name, `all`, glob pattern or `re:` regular expression, or a `Node`
+
+        Returns:
+            names of the matching nodes, in the order of `SkeletonIndex.node_names`
+
+        Raises:
+            KeyError: if no node matches `body_part`
+        """
+        if isinstance(body_part, Node):
+            body_part = body_part.name
+
+        if body_part == "all":
+            return list(self.node_names)
+        if body_part in self._index:
+            return [body_part]
+
+        if body_part.startswith(REGEX_PREFIX):
+            try:
+                pattern = re.compile(body_part[len(REGEX_PREFIX) :])
+            except re.error as e:
+                raise KeyError(f'Invalid bodypart regular expression "{body_part}": {e}') from e
+            matches = [name for name in self.node_names if pattern.fullmatch(name)]
+        elif any(c in body_part for c in GLOB_CHARS):
+            matches = [name for name in self.node_names if fnmatch.fnmatchcase(name, body_part)]
+        else:
+            matches = []
+
+        if len(matches) == 0:
+            raise KeyError(self._missing_message(body_part))
+        return matches
+
+    def resolve(self, body_parts: Union[str, Node, Iterable[Union[str, Node]]]) -> List[str]:
+        """Get the names of the nodes matching any of `body_parts`, see `SkeletonIndex.match()`.
+
+        Args:
+            body_parts: body-part names or patterns, or a single one
+
+        Returns:
+            names of the matching nodes without duplicates, ordered by the first body-part each matched, and then
+            by the order of `SkeletonIndex.node_names`
+        """
+        if isinstance(body_parts, (str, Node)):
+            body_parts = [body_parts]
+
+        # dict keys keep insertion order, deduplicating without losing it
+        names: Dict[str, None] = {}
+        for body_part in body_parts:
+            names.update(dict.fromkeys(self.match(body_part)))
+        return list(names)
+
+    def get_nodes(self, node_names: Iterable[str]) -> List[Node]:
+        """Get a `Node` for each of `node_names`, from the first skeleton having a node of that name.
+
+        Args:
+            node_names: names of the nodes
+
+        Returns:
+            list of `Node`s, in the order of `node_names`
+
+        Raises:
+            KeyError: if no skeleton has a node named as one of `node_names`
+        """
+        nodes = []
+        for name in node_names:
+            if name not in self._nodes:
+                raise KeyError(self._missing_message(name))
+            nodes.append(next(node for node in self._nodes[name] if node is not None))
+        return nodes
+
+    def skeleton_nodes(self, node_names: Iterable[str], skeleton: int = 0) -> List[Optional[Node]]:
+        """Get the `Node` of one skeleton for each of `node_names`.
+
+        Args:
+            node_names: names of the nodes
+            skeleton: position of the skeleton within `SkeletonIndex.skeletons`
+
+        Returns:
+            list holding the `Node` of the skeleton for each name, or None where the skeleton lacks the node
+        """
+        return [self._nodes[name][skeleton] if name in self._nodes else None for name in node_names]
+
+    def columns(self, node_names: Iterable[str]) -> np.ndarray:
+        """Map node names to their position within each skeleton, i.e. point offsets within an instance.
+
+        Results are cached, so repeated calls for the same nodes (i.e. once per chunk of frames) are free.
+
+        Args:
+            node_names: names of the nodes
+
+        Returns:
+            read-only integer array of shape (skeletons, nodes), -1 where a skeleton lacks a node
+        """
+        key = tuple(node_names)
+        columns = self._columns.get(key)
+        if columns is None:
+            columns = np.full((len(self.skeletons), len(key)), -1, dtype=np.int64)
+            for n, name in enumerate(key):
+                if name in self._positions:
+                    columns[:, n] = self._positions[name]
+            columns.setflags(write=False)
+            self._columns[key] = columns
+        return columns
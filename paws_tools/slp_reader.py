@@ -0,0 +1,457 @@
+"""Streaming reader for SLEAP *.slp files.
+
+Reads node coordinates directly from the HDF5 `frames`, `instances` and `pred_points` tables in
+fixed-size chunks, without materializing a `sleap_io.Labels` object graph.
+"""
+
+import fnmatch
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import h5py
+import numpy as np
+from sleap_io import Edge, Node, Skeleton, Symmetry
+from sleap_io.io.slp import InstanceType, read_metadata, read_tracks
+
+from paws_tools.constants import DEFAULT_CHUNK_SIZE, INSTANCE_POLICIES, PER_FRAME_POLICIES, InstancePolicy  # noqa: F401
+from paws_tools.skeleton_index import SkeletonIndex
+
+
+class InstancePositions(NamedTuple):
+    """Coordinates of the predicted instances selected from a set of frames, one row per selected instance.
+
+    Attributes:
+        frame_inds: array of shape (rows,) holding the frame index of each row
+        instances: array of shape (rows,) identifying the instance within its frame, see `select_instances()`
+        coords: array of shape (rows, nodes, 2) holding node coordinates
+        point_scores: array of shape (rows, nodes) holding the score of each point, or None if not read
+        instance_scores: array of shape (rows,) holding the score of each instance, or None if not read
+    """
+
+    frame_inds: np.ndarray
+    instances: np.ndarray
+    coords: np.ndarray
+    point_scores: Optional[np.ndarray]
+    instance_scores: Optional[np.ndarray]
+
+
+@dataclass(frozen=True)
+class FrameSelection:
+    """Selection of the frames of each video to extract, by frame index.
+
+    Frames are selected from the `frames` table before any instance or point is read, so unselected frames cost
+    nothing. The stride counts frame indices rather than labeled frames, so the same frames are selected whatever
+    the chunking, and frames are evenly spaced in time even where some frames are unlabeled.
+
+    Attributes:
+        start: first frame index to select, or None to start from the first frame
+        stop: frame index at which to stop (exclusive), or None to continue to the last frame
+        stride: select every `stride`-th frame index, counting from `start` (or from 0)
+    """
+
+    start: Optional[int] = None
+    stop: Optional[int] = None
+    stride: int = 1
+
+    def __post_init__(self):
+        """Validate the selection."""
+        if self.start is not None and self.start < 0:
+            raise ValueError(f"The first frame index must not be negative, got {self.start}")
+        if self.stop is not None and self.stop <= (self.start or 0):
+            raise ValueError(f"The frame range must not be empty, got {self.start or 0}:{self.stop}")
+        if self.stride < 1:
+            raise ValueError(f"The stride must be at least 1, got {self.stride}")
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any frame is left unselected."""
+        return self.start is not None or self.stop is not None or self.stride != 1
+
+    def contains(self, frame_idx: int) -> bool:
+        """Check whether a single frame index is selected."""
+        start = self.start or 0
+        return frame_idx >= start and (self.stop is None or frame_idx < self.stop) and (frame_idx - start) % self.stride == 0
+
+    def mask(self, frame_inds: np.ndarray) -> np.ndarray:
+        """Check which of an array of frame indices are selected.
+
+        Args:
+            frame_inds: integer array of frame indices
+
+        Returns:
+            boolean array of the same shape as `frame_inds`
+        """
+        start = self.start or 0
+        selected = frame_inds >= start
+        if self.stop is not None:
+            selected &= frame_inds < self.stop
+        if self.stride != 1:
+            selected &= (frame_inds - start) % self.stride == 0
+        return selected
+
+
+def select_videos(videos: Iterable[str], patterns: Iterable[str]) -> List[str]:
+    """Select videos by filename, basename or glob pattern, i.e. `/data/video_1.mp4`, `video_1.mp4` or `video_*`.
+
+    Patterns are matched against whole filenames, basenames, and basenames without extension.
+
+    Args:
+        videos: filenames of the available videos
+        patterns: filenames, basenames or glob patterns of the videos to select
+
+    Returns:
+        filenames of the selected videos, in the order of `videos`
+
+    Raises:
+        KeyError: if a pattern does not match any video
+    """
+    videos = list(videos)
+    names = [(video, os.path.basename(video), os.path.splitext(os.path.basename(video))[0]) for video in videos]
+    selected = set()
+    for pattern in patterns:
+        matches = [video for video, *aliases in names if any(fnmatch.fnmatchcase(name, pattern) for name in (video, *aliases))]
+        if len(matches) == 0:
+            raise KeyError(f"Unable to find video \"{pattern}\"! Available videos: [{', '.join(videos)}]")
+        selected.update(matches)
+    return [video for video in videos if video in selected]
+
+
+def select_instances(
+    inst_frame: np.ndarray, inst_score: np.ndarray, inst_track: np.ndarray, n_frames: int, instance_policy: InstancePolicy
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Select which predicted instances of each frame to extract, using array operations over all instances.
+
+    The supported policies are:
+    - `first`: the first predicted instance of each frame
+    - `best`: the highest scoring predicted instance of each frame
+    - `track`: the highest scoring predicted instance of each track in each frame, untracked instances are dropped
+    - `all`: every predicted instance
+
+    Policies `first` and `best` produce one row for every frame, including frames without any predicted instance.
+    The other policies produce one row per selected instance, so frames without any are omitted.
+
+    Args:
+        inst_frame: integer array of shape (instances,) giving the frame each instance belongs to, in [0, n_frames).
+            Must be non-decreasing, with the instances of each frame in the order they are stored
+        inst_score: array of shape (instances,) holding the score of each instance
+        inst_track: integer array of shape (instances,) holding the track of each instance, -1 if untracked
+        n_frames: number of frames
+        instance_policy: one of `INSTANCE_POLICIES`
+
+    Returns:
+        tuple of (row_frames, row_instances, row_keys), arrays of shape (rows,) holding for each output row the
+        frame, the instance (-1 if the frame has none) and a key identifying the instance within its frame: the
+        ordinal of the instance within its frame for `all`, the track for `track` and 0 otherwise
+    """
+    if instance_policy == "all":
+        rows = np.arange(len(inst_frame))
+        return inst_frame, rows, rows - np.searchsorted(inst_frame, inst_frame, side="left")
+
+    if instance_policy == "first":
+        frames, selected = np.unique(inst_frame, return_index=True)
+
+    elif instance_policy in ("best", "track"):
+        # rank instances by descending score within each group, NaN scores last and ties in storage order
+        score = np.where(np.isnan(inst_score), -np.inf, inst_score)
+        group = inst_track if instance_policy == "track" else np.zeros_like(inst_track)
+        order = np.lexsort((-score, group, inst_frame))
+        if instance_policy == "track":
+            order = order[group[order] >= 0]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (np.diff(inst_frame[order]) != 0) | (np.diff(group[order]) != 0)
+        selected = order[first]
+        frames = inst_frame[selected]
+        if instance_policy == "track":
+            return frames, selected, inst_track[selected]
+
+    else:
+        raise ValueError(f"Unsupported instance policy \"{instance_policy}\"; expected one of [{', '.join(INSTANCE_POLICIES)}]")
+
+    row_instances = np.full(n_frames, -1, dtype=np.int64)
+    row_instances[frames] = selected
+    return np.arange(n_frames), row_instances, np.zeros(n_frames, dtype=np.int64)
+
+
+def read_video_filenames(slp_file: str) -> List[str]:
+    """Read the filenames of the videos referenced by a *.slp file.
+
+    Filenames are resolved the same way as `sleap_io.load_slp()`, but without opening any video backends.
+
+    Args:
+        slp_file: path to the *.slp file
+
+    Returns:
+        list of video filenames, in the order they are stored in the file
+    """
+    with h5py.File(slp_file, "r") as f:
+        videos_json = f["videos_json"][()]
+
+    filenames = []
+    for video_json in videos_json:
+        video_path = json.loads(video_json)["backend"]["filename"]
+        if video_path == ".":
+            # marker for videos embedded in the labels file
+            video_path = slp_file
+
+        path = Path(video_path)
+        if not path.exists() and (Path(slp_file).parent / path.name).exists():
+            path = Path(slp_file).parent / path.name
+        filenames.append(path.as_posix())
+
+    return filenames
+
+
+def read_skeletons(slp_file: str) -> List[Skeleton]:
+    """Read the skeletons of a *.slp file.
+
+    Equivalent to `sleap_io.io.slp.read_skeletons()`, which (as of sleap-io 0.0.11) mislabels the nodes of every
+    skeleton after the first when a file holds more than one.
+
+    Args:
+        slp_file: path to the *.slp file
+
+    Returns:
+        list of skeletons, in the order they are stored in the file
+    """
+    metadata = read_metadata(slp_file)
+    # names of the nodes of all skeletons, indexed by the node ids of each skeleton
+    all_node_names = [node["name"] for node in metadata["nodes"]]
+
+    skeletons = []
+    for skeleton in metadata["skeletons"]:
+        node_ids = [node["id"] for node in skeleton["nodes"]]
+        nodes = [Node(name=all_node_names[i]) for i in node_ids]
+        edges, symmetries = [], []
+        for link in skeleton["links"]:
+            # 1 for a real edge, 2 for a symmetry
+            edge_type = link["type"]["py/reduce"][1]["py/tuple"][0] if "py/reduce" in link["type"] else link["type"]["py/id"]
+            source, target = nodes[node_ids.index(link["source"])], nodes[node_ids.index(link["target"])]
+            if edge_type == 1:
+                edges.append(Edge(source=source, destination=target))
+            elif edge_type == 2:
+                symmetries.append(Symmetry([source, target]))
+        skeletons.append(Skeleton(nodes=nodes, edges=edges, symmetries=symmetries, name=skeleton["graph"]["name"]))
+    return skeletons
+
+
+def _read_rows(dataset: h5py.Dataset, rows: np.ndarray, fields=None) -> np.ndarray:
+    """Read arbitrary rows from a HDF5 dataset, in the order given by `rows`.
+
+    Dense row selections are read as one contiguous slice, sparse ones with a sorted point selection.
+
+    Args:
+        dataset: dataset to read from
+        rows: integer array of row indices to read
+        fields: optional field name, or list of field names, to read from a compound dataset
+
+    Returns:
+        array with one entry per element of `rows`
+    """
+    source = dataset.fields(fields) if fields is not None else dataset
+    if len(rows) == 0:
+        return source[0:0]
+
+    lo, hi = int(rows.min()), int(rows.max()) + 1
+    if hi - lo <= 2 * len(rows) + 1024:
+        return source[lo:hi][rows - lo]
+
+    # h5py requires point selections to be strictly increasing
+    unique_rows, inverse = np.unique(rows, return_inverse=True)
+    return source[unique_rows][inverse]
+
+
+class SlpReader:
+    """Read node coordinates from a *.slp file one video, and one chunk of frames, at a time.
+
+    Only the small per-frame `video` and `frame_idx` columns are held in memory; instances and points
+    are read on demand for each chunk. Use as a context manager to ensure the file is closed.
+    """
+
+    def __init__(self, slp_file: str):
+        """Open `slp_file` for reading.
+
+        Args:
+            slp_file: path to the *.slp file
+        """
+        self.filename = slp_file
+        self.skeletons: List[Skeleton] = read_skeletons(slp_file)
+        self.skeleton_index = SkeletonIndex(self.skeletons)
+        self.tracks: List[str] = [track.name for track in read_tracks(slp_file)]
+
+        # videos sharing a filename are treated as one video, consistent with `node_positions_to_dataframe()`
+        all_filenames = read_video_filenames(slp_file)
+        self.videos: List[str] = sorted(set(all_filenames))
+        self._video_codes = np.array([self.videos.index(fn) for fn in all_filenames], dtype=np.int64)
+
+        self._file = h5py.File(slp_file, "r")
+        frames = self._file["frames"]
+        self._frame_video = self._video_codes[frames.fields("video")[()].astype(np.int64)]
+        self._frame_idx = frames.fields("frame_idx")[()].astype(np.int64)
+
+    def __enter__(self) -> "SlpReader":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, *args) -> None:
+        """Exit the context manager, closing the underlying file."""
+        self.close()
+
+    def __len__(self) -> int:
+        """Get the number of labeled frames in the file."""
+        return len(self._frame_idx)
+
+    def close(self) -> None:
+        """Close the underlying HDF5 file."""
+        self._file.close()
+
+    def frame_rows(self, video: str, frames: Optional[FrameSelection] = None) -> np.ndarray:
+        """Get the rows of the `frames` table belonging to `video`, ordered by frame index.
+
+        Args:
+            video: filename of the video, as listed in `SlpReader.videos`
+            frames: if provided, only the rows of the selected frames are returned
+
+        Returns:
+            integer array of row indices into the `frames` table
+        """
+        rows = np.flatnonzero(self._frame_video == self.videos.index(video))
+        if frames is not None and frames.enabled:
+            rows = rows[frames.mask(self._frame_idx[rows])]
+        return rows[np.argsort(self._frame_idx[rows], kind="stable")]
+
+    def read_instances(
+        self, rows: np.ndarray, node_names: List[str], instance_policy: InstancePolicy = "first", scores: bool = True
+    ) -> InstancePositions:
+        """Read the coordinates of `node_names` in the predicted instances selected from the given rows of the `frames` table.
+
+        Instances are selected with `select_instances()`, over all instances of all frames at once. Nodes not present
+        in an instance's skeleton, and frames without a selected instance, are filled with `numpy.nan`.
+
+        Args:
+            rows: integer array of row indices into the `frames` table
+            node_names: names of the nodes for which to read coordinates
+            instance_policy: which predicted instances of each frame to read, one of `INSTANCE_POLICIES`
+            scores: if True, also read point and instance scores
+
+        Returns:
+            coordinates of the selected instances, ordered as `rows`. For the `track` policy `instances` indexes
+            into `SlpReader.tracks`
+        """
+        frames = _read_rows(self._file["frames"], rows, ["instance_id_start", "instance_id_end"])
+        inst_start = frames["instance_id_start"].astype(np.int64)
+        counts = frames["instance_id_end"].astype(np.int64) - inst_start
+
+        # concatenate the instance id ranges of all frames, remembering which frame each came from
+        offsets = np.cumsum(counts) - counts
+        inst_rows = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(inst_start, counts)
+        inst_frame = np.repeat(np.arange(len(rows)), counts)
+        # only read the scores and tracks of instances when they are needed
+        read_score = scores or instance_policy in ("best", "track")
+        read_track = instance_policy == "track"
+        fields = ["instance_type", "skeleton", "point_id_start", "point_id_end"]
+        if read_score:
+            fields.append("score")
+        if read_track:
+            fields.append("track")
+        instances = _read_rows(self._file["instances"], inst_rows, fields)
+
+        predicted = np.flatnonzero(instances["instance_type"] == InstanceType.PREDICTED)
+        no_values = np.zeros(len(predicted), dtype=np.int64)
+        row_frames, row_instances, row_keys = select_instances(
+            inst_frame[predicted],
+            instances["score"][predicted].astype(np.float64) if read_score else no_values,
+            instances["track"][predicted].astype(np.int64) if read_track else no_values,
+            len(rows),
+            instance_policy,
+        )
+        found = row_instances >= 0
+        selected = instances[predicted[row_instances[found]]]
+
+        # compute point ids for each (instance, node), masking nodes missing from the instance's skeleton
+        columns = self.skeleton_index.columns(node_names)[selected["skeleton"].astype(np.int64)]
+        point_ids = selected["point_id_start"].astype(np.int64)[:, None] + columns
+        valid = (columns >= 0) & (point_ids < selected["point_id_end"].astype(np.int64)[:, None])
+
+        points = _read_rows(self._file["pred_points"], point_ids[valid], ["x", "y", "score"] if scores else ["x", "y"])
+        coords = np.full((len(row_frames), len(node_names), 2), np.nan, dtype=np.float64)
+        found_coords = coords[found]
+        found_coords[valid, 0] = points["x"]
+        found_coords[valid, 1] = points["y"]
+        coords[found] = found_coords
+
+        point_scores = instance_scores = None
+        if scores:
+            point_scores = np.full((len(row_frames), len(node_names)), np.nan, dtype=np.float64)
+            found_scores = point_scores[found]
+            found_scores[valid] = points["score"]
+            point_scores[found] = found_scores
+            instance_scores = np.full(len(row_frames), np.nan, dtype=np.float64)
+            instance_scores[found] = selected["score"]
+
+        return InstancePositions(self._frame_idx[rows][row_frames], row_keys, coords, point_scores, instance_scores)
+
+    def read_positions(self, rows: np.ndarray, node_names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Read the coordinates of `node_names` for the given rows of the `frames` table.
+
+        Only the first predicted instance in each frame will be used. Frames without a predicted instance,
+        or nodes not present in the instance's skeleton, are filled with `numpy.nan`.
+
+        Args:
+            rows: integer array of row indices into the `frames` table
+            node_names: names of the nodes for which to read coordinates
+
+        Returns:
+            tuple of (frame_inds, coords), where `frame_inds` has shape (frames,) and `coords` has shape
+            (frames, nodes, 2)
+        """
+        positions = self.read_instances(rows, node_names, "first", scores=False)
+        return positions.frame_inds, positions.coords
+
+    def iter_positions(
+        self, video: str, node_names: List[str], chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE, frames: Optional[FrameSelection] = None
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Iterate over the coordinates of `node_names` in `video`, in chunks of frames ordered by frame index.
+
+        Args:
+            video: filename of the video, as listed in `SlpReader.videos`
+            node_names: names of the nodes for which to read coordinates
+            chunk_size: maximum number of frames per chunk, or None to read the whole video at once
+            frames: if provided, only the selected frames are read
+
+        Yields:
+            tuples of (frame_inds, coords), see `SlpReader.read_positions()`
+        """
+        rows = self.frame_rows(video, frames)
+        step = chunk_size if chunk_size else max(len(rows), 1)
+        for start in range(0, len(rows), step):
+            yield self.read_positions(rows[start : start + step], node_names)
+
+    def iter_instances(
+        self,
+        video: str,
+        node_names: List[str],
+        instance_policy: InstancePolicy = "first",
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+        scores: bool = True,
+        frames: Optional[FrameSelection] = None,
+    ) -> Iterator[InstancePositions]:
+        """Iterate over the coordinates of the predicted instances selected from `video`, in chunks of frames.
+
+        Args:
+            video: filename of the video, as listed in `SlpReader.videos`
+            node_names: names of the nodes for which to read coordinates
+            instance_policy: which predicted instances of each frame to read, one of `INSTANCE_POLICIES`
+            chunk_size: maximum number of frames per chunk, or None to read the whole video at once
+            scores: if True, also read point and instance scores
+            frames: if provided, only the selected frames are read
+
+        Yields:
+            coordinates of the selected instances, ordered by frame index, see `SlpReader.read_instances()`
+        """
+        rows = self.frame_rows(video, frames)
+        step = chunk_size if chunk_size else max(len(rows), 1)
+        for start in range(0, len(rows), step):
+            yield self.read_instances(rows[start : start + step], node_names, instance_policy, scores)
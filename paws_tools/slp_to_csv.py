@@ -1,276 +1,319 @@
-"""Please add doc string for this module."""
+"""Conversion of SLEAP predictions (*.slp files) to per-video coordinate files, plots and stores.
 
-import os
-from typing import Any, Dict, List, Optional, Tuple, Union
-
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import seaborn as sns
-from matplotlib.axes import Axes
-from sleap_io import Labels, Node
-from tqdm import tqdm
-from typing_extensions import Literal
-
-
-def get_nodes_for_bodyparts(labels: Labels, body_parts: Union[str, Node, List[Union[str, Node]]]) -> List[Node]:
-    """Given a set of body-part names, return a list of corresponding skeleton nodes.
-
-    Order of returned nodes is not guarenteed!
-
-    Supports the following special values:
-    - `all`: return all nodes
-
-    Args:
-        labels: labels from which to select bodypart Nodes
-        body_parts: list of bodypart names for which to select corresponding Nodes
-
-    Returns:
-        list of `Node`s corresponding to body_parts
-    """
-    # for convience, allow a single string or Node to be passed
-    if isinstance(body_parts, str):
-        body_parts = [body_parts]
-
-    elif isinstance(body_parts, Node):
-        body_parts = [body_parts.name]
-
-    nodes = []
-    for bp in body_parts:
-        if isinstance(bp, Node):
-            bp = bp.name
-
-        if bp == "all":
-            nodes.extend(labels.skeletons[0].nodes)
-            continue
-
-        if bp not in labels.skeletons[0].node_names:
-            raise KeyError(
-                f"Unable to find bodypart \"{bp}\" in the skeleton! Available bodyparts: [{', '.join(labels.skeletons[0].node_names)}]"
-            )
-
-        nodes.append(labels.skeletons[0][bp])
-
-    return list(set(nodes))
-
-
-def node_positions_to_dataframe(labels: Labels, nodes: List[Node]) -> pd.DataFrame:
-    """Extracts a single node from `labels` and returns its coordinates as a pandas DataFrame.
-
-    Only the first predicted instance in each frame will be used.
+`convert_slp_file()` performs the conversion of the `slp-to-csv` command. The coordinates of the selected
+body-parts are extracted from the *.slp file (see `paws_tools.extraction`), y-inverted, then optionally gap-filled,
+smoothed and converted to physical units (see `paws_tools.transforms` and `paws_tools.calibration`). They are saved
+to one file per video and unit (see `paws_tools.dataframe_io`), and plotted (see `paws_tools.plotting`). Files are
+converted in memory, or streamed one video or chunk of frames at a time (see `paws_tools.streaming`). Coordinate
+stores, overviews and a calibration report may also be saved, and videos unchanged since a previous conversion
+skipped, see `paws_tools.cache`.
 
-    If a given frame does not have any predicted instances or the predicted instance does not contain
-    a node in `nodes`, then the coordinates for that node and frame will be set to `numpy.nan` in the
-    resulting dataframe.
+The functions of these modules were long part of this module, and are re-exported here for backwards compatibility.
+"""
 
-    Args:
-        labels: labels from which to extract data
-        nodes: the nodes for which to extract data
-
-    Returns:
-       pandas DataFrame containing node coordinates, frame index, and video data. The returned dataframe
-       is sorted by video filename and then by frame index, each in ascending order.
-    """
-    data = []
-    for frame in tqdm(labels.labeled_frames, desc="Building Dataframe", leave=False):
-        row: Dict[Union[str, Tuple[str, str]], Any] = {
-            "video": frame.video.filename,
-            "frame_idx": frame.frame_idx,
-        }
-        for node in nodes:
-            if (len(frame.predicted_instances) <= 0) or (node not in frame.predicted_instances[0].points):
-                # we don't have any predicted instances, or this node was not present in this predicted instance
-                # allocate space in the dataframe for this point, but set the values to NaNs.
-                row[(node.name, "x")] = np.nan
-                row[(node.name, "y")] = np.nan
-            else:
-                row[(node.name, "x")] = frame.predicted_instances[0].points[node].x
-                row[(node.name, "y")] = frame.predicted_instances[0].points[node].y
-        data.append(row)
-
-    df = pd.DataFrame(data)  # convert to pandas dataframe
-    df = df.sort_values(["video", "frame_idx"])  # ensure data is sorted by video name, then by frame_idx
-    df = df.set_index(["video", "frame_idx"])  # set the index as a multi-index using video and frame index
-    df.columns = pd.MultiIndex.from_product([[n.name for n in nodes], ["x", "y"]])  # set the columns as a multi-index
-
-    return df
-
-
-def read_dataframe_from_csv(filename: str) -> pd.DataFrame:
-    """Read a csv file and convert to a dataframe.
-
-    Handles automatically detecting the delimiter type (tab for TSV files or comma for CSV)
-    Handles correctly constructing the multi-index
-
-    Args:
-        filename: path to the file to read
-
-    Returns:
-        `pandas.DataFrame` containing data read from the csv file
-    """
-    kwargs = {}
-    if filename.lower().endswith("tsv"):
-        kwargs["sep"] = "\t"
-
-    return pd.read_csv(filename, index_col=[0, 1], header=[0, 1], **kwargs)
-
-
-def save_dataframe_to_grouped_csv(
-    df: pd.DataFrame, groupby: str, dest_dir: str, suffix: Optional[str] = None, format: Literal["tsv", "csv"] = "tsv"
-) -> List[str]:
-    """Split a dataframe into groups, and then save each group as a separate file.
+import os
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple, Union
+
+from sleap_io import Node
+
+from paws_tools.cache import ConversionCache
+from paws_tools.calibration import (
+    DEFAULT_OUTLIER_THRESHOLD,
+    calibrate_dataframe,
+    calibrate_slp,
+    conversion_factors,
+    get_calibration_report_filename,
+    write_calibration_report,
+)
+from paws_tools.constants import OverviewLayout
+from paws_tools.coord_store import get_store_filename
+from paws_tools.dataframe_io import (  # noqa: F401 (re-exported for backwards compatibility)
+    Compression,
+    DataFrameFormat,
+    get_output_filename,
+    read_dataframe,
+    read_dataframe_from_csv,
+    save_dataframe_to_grouped_csv,
+)
+from paws_tools.extraction import (  # noqa: F401 (re-exported for backwards compatibility)
+    INSTANCE_SCORE_COLUMN,
+    coords_to_dataframe,
+    get_nodes_for_bodyparts,
+    get_skeleton_index,
+    instance_positions_to_array,
+    instances_to_dataframe,
+    node_positions_to_array,
+    node_positions_to_dataframe,
+    select_frames,
+    select_nodes,
+)
+from paws_tools.plotting import (  # noqa: F401 (re-exported for backwards compatibility)
+    DEFAULT_MAX_PLOT_POINTS,
+    OVERVIEW_MAX_PIXELS,
+    OVERVIEW_PANEL_SIZE,
+    PLOT_DIGEST_KEY,
+    PLOT_STYLE_VERSION,
+    TRACE_FIGSIZE,
+    decimate_trace,
+    get_overview_filename,
+    get_plot_filename,
+    init_plot_worker,
+    plot_bodyparts_y_pos_over_time,
+    plot_grouped_bodyparts_y_pos_over_time,
+    plot_overview,
+)
+from paws_tools.profiling import Metrics, file_size, stage
+from paws_tools.slp_reader import DEFAULT_CHUNK_SIZE, FrameSelection, InstancePolicy, SlpReader, select_videos
+from paws_tools.streaming import save_coordinate_stores, stream_slp_to_csv
+from paws_tools.transforms import (  # noqa: F401 (re-exported for backwards compatibility)
+    PostProcessing,
+    compute_conversion_factors,
+    convert_physical_units,
+    fill_and_smooth,
+    invert_y_axis,
+)
+
+
+def convert_slp_file(
+    slp_file: str,
+    dest_dir: str,
+    body_parts: List[Union[str, Node]],
+    ignore_body_parts: List[Union[str, Node]],
+    frame_height: int,
+    calibration: Optional[Tuple[str, str, float]] = None,
+    format: DataFrameFormat = "tsv",
+    plot: bool = True,
+    skip_unchanged_plots: bool = True,
+    streaming: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    jobs: int = 1,
+    cache: Optional[ConversionCache] = None,
+    verbose: bool = False,
+    outlier_threshold: float = DEFAULT_OUTLIER_THRESHOLD,
+    instance_policy: InstancePolicy = "first",
+    metrics: Optional[Metrics] = None,
+    compression: Optional[Compression] = None,
+    store: bool = False,
+    post_processing: Optional[PostProcessing] = None,
+    overview: Optional[OverviewLayout] = None,
+    pipeline_depth: Optional[int] = None,
+    videos: Optional[List[str]] = None,
+    frames: Optional[FrameSelection] = None,
+) -> Dict[str, int]:
+    """Convert a *.slp file to per-video files (and plots), as done by the `slp-to-csv` command.
+
+    The whole file is read and converted in memory, unless `streaming` is True, `jobs` > 1, `pipeline_depth` is
+    given, or `videos` or `frames` are selected, in which case `stream_slp_to_csv()` is used, reading only the
+    selected data. When calibrating, a calibration report
+    covering every video of the file is also saved, see `paws_tools.calibration.compute_calibration()`.
 
     Args:
-        df: dataframe to be saved
-        groupby: how to group the dataframe
+        slp_file: path to the *.slp file
         dest_dir: destination directory for the produced files
-        suffix: any suffix to add to the resulting filenames, just prior to the file extension
-        format: format for the saved files, 'tsv' indicates tab-separated values, 'csv' indicated comma-separated values
+        body_parts: bodypart names or patterns to extract, see `get_nodes_for_bodyparts()`
+        ignore_body_parts: bodypart names to subtract from `body_parts`
+        frame_height: height of the video frames, used to invert the y-axis
+        calibration: tuple of (top_node, bot_node, true_dist), see `compute_conversion_factors()`. If None, only
+            pixel-unit files are produced
+        format: format for the saved files, see `save_dataframe_to_grouped_csv()`
+        plot: if True, also plot traces of the nodes, see `plot_bodyparts_y_pos_over_time()`
+        skip_unchanged_plots: if True, do not re-render png plots whose data is unchanged
+        streaming: if True, read the file in chunks of `chunk_size` frames rather than loading it entirely
+        chunk_size: maximum number of frames held in memory at once when `streaming`
+        jobs: number of worker processes to use
+        cache: if provided, videos unchanged since a conversion recorded in `cache` are skipped, and the
+            conversion is recorded in `cache`. Saving the cache is left to the caller
+        verbose: if True, print progress messages
+        outlier_threshold: robust z-score above which a video's calibration is flagged as an outlier
+        instance_policy: which predicted instances of each frame to extract, see `node_positions_to_dataframe()`
+        metrics: if provided, the time taken by each stage of the conversion is recorded here, see `paws_tools.profiling`
+        compression: compression of the saved files, see `save_dataframe_to_grouped_csv()`
+        store: if True, also save memory-mapped coordinate stores of all videos, see `save_coordinate_stores()`.
+            Stores are rebuilt whenever any video is converted, or if missing
+        post_processing: gap filling and smoothing of the coordinates of the saved files, plots and stores,
+            see `fill_and_smooth()`
+        overview: if provided, also plot the traces of all videos to a single file of this layout, see
+            `plot_overview()`. Overviews are read back from the saved files, and rebuilt whenever any video is
+            converted, or if missing
+        pipeline_depth: if provided, overlap reading, transforming, writing and plotting videos, with at most this
+            many chunks (or whole videos, unless `streaming`) waiting between stages, see `stream_slp_to_csv()`
+        videos: filenames, basenames or glob patterns of the videos to convert, see `select_videos()`, or None
+            for all videos. Other videos are never read, and are left out of calibration, stores and overviews
+        frames: if provided, only the selected frames of each video are read, converted, calibrated and saved
 
     Returns:
-        A list of strings indicating the filepaths which were saved to
+        dict with the number of selected `videos` and labeled `frames` in the file, and the number of videos which
+        were `converted` and `skipped`
     """
-    # ensure destination directory exists
-    os.makedirs(dest_dir, exist_ok=True)
-
-    # generate the full suffix, including file extension
-    full_suffix = f"{suffix}.{format}" if suffix is not None else format
-
-    # setup any kwargs to be passed to `DataFrame.to_csv()`
-    to_csv_kwargs = {}
-    if format == "tsv":
-        to_csv_kwargs["sep"] = "\t"
-
-    # group by `groupby`, then save each group to a separate file
-    out_filenames = []
-    for group, group_df in tqdm(df.groupby(groupby), desc=f"Saving {format.upper()} Files", leave=False):
-        base = os.path.splitext(os.path.basename(group))[0]
-        dest = os.path.join(dest_dir, f"{base}.{full_suffix}")
-        out_filenames.append(dest)
-        group_df.to_csv(dest, **to_csv_kwargs)
-
-    return out_filenames
-
-
-def invert_y_axis(labels: Labels, frame_height: int) -> Labels:
-    """Invert the Y-coordinates such that the origin is switched between bottom-left and top-left.
-
-    If the origin is bottom-left, the resulting origin will be top-left.
-    If the origin is top-left, the resulting origin will be bottom-left.
-
-    Args:
-        labels: labels instance to convert
-        frame_height: height of the video frames
-
-    Returns:
-        Labels instance with point units converted to physical distances
-    """
-    for frame in tqdm(labels.labeled_frames, desc="Inverting Y-axis", leave=False):
-        for instance in frame.predicted_instances:
-            for key, val in instance.points.items():
-                instance.points[key].y = frame_height - val.y
-
-    return labels
-
-
-def convert_physical_units(labels: Labels, top_node: Union[str, Node], bot_node: Union[str, Node], true_dist: float) -> Labels:
-    """Converts the coordinates in `labels` from px to physical distance units (i.e. millimeters).
-
-    Args:
-        labels: labels instance to convert
-        top_node: node name of first calibration point
-        bot_node: node name of second calibration point
-        true_distance: true physical distance between `top_node` and `bot_node`
-
-    Returns:
-        Labels instance with point units converted to physical distances
-    """
-    Top_index = labels.skeletons[0].index(top_node)
-    Bot_index = labels.skeletons[0].index(bot_node)
-
-    conv_factors = {}
-    for video in tqdm(labels.videos, desc="Calculating Conversion Factors", leave=False):
-        try:
-            box_cords = labels.numpy(video)[:, 0, (Top_index, Bot_index), 1]
-            box_median = np.nanmedian(box_cords, axis=0)
-            mm2px = true_dist / abs(np.diff(box_median))
-            conv_factors[video.filename] = mm2px[0]
-
-        except:
-            tqdm.write(f'WARNING: Unable to find coordinates for calibration nodes! Skipping calibration for video "{video.filename}"')
-            conv_factors[video.filename] = None
-
-    for frame in tqdm(labels.labeled_frames, desc="Applying Conversion Factors", leave=False):
-        mm2px = conv_factors[frame.video.filename]
-        if mm2px is not None:
-            for instance in frame.predicted_instances:
-                for key, val in instance.points.items():
-                    instance.points[key].x = val.x * mm2px
-                    instance.points[key].y = val.y * mm2px
-
-    return labels
-
-
-def plot_bodyparts_y_pos_over_time(
-    df: Union[pd.DataFrame, str],
-    dest_dir: str,
-    nodes: List[Union[Node, str]],
-    ax: Axes = None,
-    suffix: Optional[str] = None,
-    format: str = "png",
-) -> None:
-    """Extracts a single point from `labels` and returns as a pandas DataFrame.
-
-    Saves plot y-coordinates vs. time line graph as a file png in directory.
-
-    Args:
-        df: a `pandas.DataFrame` created by `node_positions_to_dataframe()` or a path to a file containing equivelent data
-        dest_dir: file path for the destination directory
-        nodes: bodyparts for which to plot
-        ax: Axes to plot on, if not provided, one will be created
-        suffix: any suffix to add to the resulting filenames, just prior to the file extension
-        format: format for the saved plots, 'png' is the default
-    """
-    if isinstance(df, str):
-        df = read_dataframe_from_csv(df)
-
-    # convert nodes to strings
-    str_nodes = [node.name if isinstance(node, Node) else node for node in nodes]
-
-    if ax is None:
-        fig, ax = plt.subplots(figsize=(20, 10))
-        own_fig = True
-    else:
-        fig = ax.get_figure()
-        own_fig = False
-
-    palette = sns.color_palette("Paired", len(str_nodes))
-
-    for i, node in enumerate(str_nodes):
-        ax.plot(df.index.get_level_values("frame_idx"), df[(node, "y")], c=palette[i])
-
-    ax.set_ylabel(f"Bodypart Y Position")
-    ax.set_xlabel("Frame Index")
-    ax.legend([f"{node}" for node in str_nodes])
-    sns.move_legend(ax, "upper left", bbox_to_anchor=(1, 1))
-
-    video_name = os.path.basename(df.index.get_level_values("video")[0])
-    node_names = "_".join([node for node in str_nodes])
-    ax.set_title(f"{video_name}_[{node_names}]_ycord_vs_time")
-
-    max_x = int(df.index.max()[1])
-    ax.set_xticks(np.arange(0, max_x, 50))
-    ax.set_xticklabels(np.arange(0, max_x, 50), rotation=90)
-    ax.axis(xmin=-10, xmax=max_x + 10)
-
-    fig.tight_layout()
+    frames = frames if frames is not None and frames.enabled else None
+    selecting = videos is not None or frames is not None
+    # select nodes and find the videos which need to be converted, without loading the data
+    with stage(metrics, "open"), SlpReader(slp_file) as reader:
+        node_names = [n.name for n in select_nodes(reader, body_parts, ignore_body_parts)]
+        all_videos = reader.videos if videos is None else select_videos(reader.videos, videos)
+        n_frames = sum(len(reader.frame_rows(video, frames)) for video in all_videos) if selecting else len(reader)
+    read_node_names = list(node_names)
+    if calibration is not None:
+        read_node_names += [n for n in calibration[:2] if n not in node_names]
+
+    videos = all_videos
+    if cache is not None:
+        params = {
+            "nodes": node_names,
+            "calibration": calibration,
+            "outlier_threshold": outlier_threshold,
+            "frame_height": frame_height,
+            "format": format,
+            "compression": compression,
+            "post_processing": asdict(post_processing) if post_processing is not None and post_processing.enabled else None,
+            "plot": plot,
+            "instance_policy": instance_policy,
+            "frames": asdict(frames) if frames is not None else None,
+        }
+        output_groups = {video: get_output_filename(video, dest_dir) for video in all_videos}
+        with stage(metrics, "cache_check", frames=n_frames):
+            videos = cache.check(slp_file, params, read_node_names, output_groups, instance_policy=instance_policy, frames=frames)
+
+    calibration_report = None
+    if len(videos) > 0 and (streaming or jobs > 1 or pipeline_depth is not None or selecting):
+        conv_factors = None
+        if calibration is not None:
+            with stage(metrics, "calibrate", frames=n_frames), SlpReader(slp_file) as reader:
+                calibration_report = calibrate_slp(
+                    reader,
+                    *calibration,
+                    outlier_threshold=outlier_threshold,
+                    chunk_size=chunk_size,
+                    instance_policy=instance_policy,
+                    videos=all_videos,
+                    frames=frames,
+                )
+            conv_factors = conversion_factors(calibration_report.loc[calibration_report.index.isin(videos)])
+
+        if verbose:
+            print("Converting SLEAP data....")
+        stream_slp_to_csv(
+            slp_file,
+            node_names,
+            dest_dir,
+            frame_height,
+            calibration=calibration,
+            format=format,
+            chunk_size=chunk_size if streaming else None,
+            plot=plot,
+            skip_unchanged_plots=skip_unchanged_plots,
+            jobs=jobs,
+            videos=videos,
+            conv_factors=conv_factors,
+            instance_policy=instance_policy,
+            metrics=metrics,
+            compression=compression,
+            post_processing=post_processing,
+            pipeline_depth=pipeline_depth,
+            frames=frames,
+        )
+        if verbose:
+            print(" -> Done!\n")
+
+    elif len(videos) > 0:
+        # extract the coordinates of the selected nodes, plus any calibration nodes, straight from the arrays of the
+        # file, rather than building `Labels` with `sleap_io.load_slp()`, which is much slower and fails on files
+        # holding more than one skeleton (as of sleap-io 0.0.11)
+        if verbose:
+            print("Reading SLEAP data....")
+        with stage(metrics, "extract", frames=n_frames), SlpReader(slp_file) as reader:
+            coords = node_positions_to_dataframe(reader, reader.skeleton_index.resolve(read_node_names), instance_policy)
+        if verbose:
+            print(" -> Done!\n")
+        if calibration is not None:
+            # calibrate all videos, including unchanged ones, so outliers are judged against the whole file
+            with stage(metrics, "calibrate", frames=len(coords)):
+                calibration_report = calibrate_dataframe(coords, *calibration, outlier_threshold=outlier_threshold)
+        with stage(metrics, "invert_y") as counters:
+            coords = invert_y_axis(coords[coords.index.get_level_values("video").isin(videos)], frame_height)
+            counters["frames"] = len(coords)
+
+        # keep the instance scores, if any, along with the selected nodes
+        output_columns = node_names + ([INSTANCE_SCORE_COLUMN[0]] if INSTANCE_SCORE_COLUMN in coords.columns else [])
+        px_coords = coords.loc[:, output_columns]
+        if post_processing is not None and post_processing.enabled:
+            with stage(metrics, "post_process", frames=len(px_coords)):
+                px_coords = fill_and_smooth(px_coords, post_processing)
+        save_dataframe_to_grouped_csv(px_coords, "video", dest_dir, suffix="px", format=format, metrics=metrics, compression=compression)
+
+        if plot:
+            plot_grouped_bodyparts_y_pos_over_time(
+                px_coords, dest_dir, node_names, suffix="px", skip_unchanged=skip_unchanged_plots, metrics=metrics
+            )
 
-    # ensure destination directory exists
-    os.makedirs(dest_dir, exist_ok=True)
+        if calibration_report is not None:
+            conv_factors = conversion_factors(calibration_report.loc[calibration_report.index.isin(videos)])
+            with stage(metrics, "convert_units", frames=len(px_coords)):
+                mm_coords = convert_physical_units(px_coords, conv_factors)
+            save_dataframe_to_grouped_csv(
+                mm_coords, "video", dest_dir, suffix="mm", format=format, metrics=metrics, compression=compression
+            )
 
-    # generate the full suffix, including file extension
-    full_suffix = f"{suffix}.{format}" if suffix is not None else format
-    dest = os.path.join(dest_dir, f"{video_name}_[{node_names}]_ycord_vs_time.{full_suffix}")
-    fig.savefig(dest)
-    if own_fig:
-        plt.close(fig)
+            if plot:
+                plot_grouped_bodyparts_y_pos_over_time(
+                    mm_coords, dest_dir, node_names, suffix="mm", skip_unchanged=skip_unchanged_plots, metrics=metrics
+                )
+
+    suffixes = ["px", "mm"] if calibration is not None else ["px"]
+    if store and (len(videos) > 0 or not all(os.path.exists(get_store_filename(slp_file, dest_dir, suffix)) for suffix in suffixes)):
+        if calibration is not None and calibration_report is None:
+            # every video was skipped, so the file has not been calibrated yet
+            with stage(metrics, "calibrate", frames=n_frames), SlpReader(slp_file) as reader:
+                calibration_report = calibrate_slp(
+                    reader,
+                    *calibration,
+                    outlier_threshold=outlier_threshold,
+                    chunk_size=chunk_size,
+                    instance_policy=instance_policy,
+                    videos=all_videos,
+                    frames=frames,
+                )
+        if verbose:
+            print("Saving coordinate stores....")
+        save_coordinate_stores(
+            slp_file,
+            node_names,
+            dest_dir,
+            frame_height,
+            conv_factors=conversion_factors(calibration_report) if calibration_report is not None else None,
+            chunk_size=chunk_size,
+            instance_policy=instance_policy,
+            metrics=metrics,
+            post_processing=post_processing,
+            videos=all_videos,
+            frames=frames,
+        )
+
+    if overview is not None:
+        for suffix in suffixes:
+            overview_file = get_overview_filename(slp_file, dest_dir, suffix, overview)
+            if len(videos) > 0 or not os.path.exists(overview_file):
+                if verbose:
+                    print(f"Plotting overview ({suffix})....")
+                sources = {video: get_output_filename(video, dest_dir, suffix, format, compression) for video in all_videos}
+                sources = {video: fn for video, fn in sources.items() if os.path.exists(fn)}
+                with stage(metrics, "overview") as counters:
+                    plot_overview(sources, overview_file, node_names, layout=overview)
+                    counters["bytes_written"] = file_size(overview_file)
+
+    if calibration_report is not None:
+        with stage(metrics, "write") as counters:
+            report_file = get_calibration_report_filename(slp_file, dest_dir)
+            write_calibration_report(calibration_report, report_file)
+            counters["bytes_written"] = file_size(report_file)
+
+    if cache is not None:
+        outputs = {}
+        for video in videos:
+            outputs[video] = [get_output_filename(video, dest_dir, suffix, format, compression) for suffix in suffixes]
+            if plot:
+                outputs[video] += [get_plot_filename(video, dest_dir, node_names, suffix) for suffix in suffixes]
+        cache.record(slp_file, outputs)
+
+    return {"videos": len(all_videos), "frames": n_frames, "converted": len(videos), "skipped": len(all_videos) - len(videos)}
@@ -0,0 +1,484 @@
+"""Conversion of *.slp files to per-video files, one video (or chunk of frames) at a time.
+
+Coordinates are read straight from the *.slp file with a `paws_tools.slp_reader.SlpReader`, transformed (see
+`paws_tools.transforms`) and appended to the output files chunk by chunk, so the whole dataset is never held in
+memory. Videos are independent, so they may be sharded across worker processes. Within a process, reading,
+transforming, writing and plotting may be overlapped, see `paws_tools.pipeline`. Coordinate stores are built the
+same way, see `save_coordinate_stores()`.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from paws_tools.calibration import calibrate_slp, conversion_factors
+from paws_tools.constants import DEFAULT_PIPELINE_DEPTH
+from paws_tools.coord_store import CoordinateStoreWriter, get_store_filename
+from paws_tools.dataframe_io import Compression, DataFrameFormat, DataFrameWriter, get_output_filename
+from paws_tools.extraction import instances_to_dataframe
+from paws_tools.pipeline import BackgroundConsumer, Prefetcher
+from paws_tools.plotting import init_plot_worker, plot_bodyparts_y_pos_over_time
+from paws_tools.profiling import Metrics, file_size, stage
+from paws_tools.slp_reader import (
+    DEFAULT_CHUNK_SIZE,
+    PER_FRAME_POLICIES,
+    FrameSelection,
+    InstancePolicy,
+    InstancePositions,
+    SlpReader,
+    read_video_filenames,
+)
+from paws_tools.transforms import PostProcessing, convert_physical_units, fill_and_smooth, invert_y_axis
+
+
+def _transform_chunk(
+    positions: InstancePositions,
+    video: str,
+    node_names: List[str],
+    frame_height: int,
+    conv_factors: Optional[Dict[str, Optional[float]]],
+    instance_policy: InstancePolicy,
+    tracks: List[str],
+    post_processing: Optional[PostProcessing] = None,
+    metrics: Optional[Metrics] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Transform a chunk of the instances of a single video into the chunks of each of its output files.
+
+    Returns:
+        dict mapping file suffix ('px' and, if `conv_factors` is not None, 'mm') to the chunk of that file
+    """
+    chunks: Dict[str, pd.DataFrame] = {}
+    with stage(metrics, "extract", video, frames=len(positions.frame_inds)):
+        video_ids = np.zeros(len(positions.frame_inds), dtype=np.int64)
+        df = instances_to_dataframe([video], video_ids, positions, node_names, instance_policy, tracks)
+    with stage(metrics, "invert_y", video, frames=len(df)):
+        chunks["px"] = invert_y_axis(df, frame_height)
+    if post_processing is not None and post_processing.enabled:
+        with stage(metrics, "post_process", video, frames=len(df)):
+            chunks["px"] = fill_and_smooth(chunks["px"], post_processing)
+    if conv_factors is not None:
+        with stage(metrics, "convert_units", video, frames=len(df)):
+            chunks["mm"] = convert_physical_units(chunks["px"], conv_factors)
+    return chunks
+
+
+class _VideoOutput:
+    """The output files of a single video, written chunk by chunk, and plotted once closed."""
+
+    def __init__(self, video: str, dest_dir: str, suffixes: List[str], format: DataFrameFormat, compression: Optional[Compression] = None):
+        """Prepare to write the files of `video`, one per suffix, see `get_output_filename()`."""
+        self.video = video
+        self.writers = {
+            suffix: DataFrameWriter(get_output_filename(video, dest_dir, suffix, format, compression), format, compression)
+            for suffix in suffixes
+        }
+        self.filenames: Dict[str, str] = {}
+        self.last_chunks: Dict[str, pd.DataFrame] = {}
+        self.n_chunks = 0
+
+    def write(self, chunks: Dict[str, pd.DataFrame], metrics: Optional[Metrics] = None) -> None:
+        """Append a chunk to each file, see `_transform_chunk()`."""
+        with stage(metrics, "write", self.video, frames=len(chunks["px"])):
+            for suffix, chunk in chunks.items():
+                self.writers[suffix].write(chunk)
+        self.last_chunks = chunks
+        self.n_chunks += 1
+
+    def close(self, metrics: Optional[Metrics] = None) -> Dict[str, str]:
+        """Finish writing the files.
+
+        Returns:
+            dict mapping file suffix to the filepath which was saved to; empty if the video has no labeled frames
+        """
+        with stage(metrics, "write", self.video) as counters:
+            for suffix, writer in self.writers.items():
+                writer.close()
+                if writer.rows_written > 0:
+                    self.filenames[suffix] = writer.dest
+                    counters["bytes_written"] += file_size(writer.dest)
+        return self.filenames
+
+    def abort(self) -> None:
+        """Stop writing, leaving any previously saved files untouched."""
+        for writer in self.writers.values():
+            writer.abort()
+
+    def plot(self, dest_dir: str, node_names: List[str], skip_unchanged: bool, metrics: Optional[Metrics] = None) -> None:
+        """Plot the traces of each closed file, see `plot_bodyparts_y_pos_over_time()`."""
+        for suffix, dest in self.filenames.items():
+            with stage(metrics, "plot", self.video) as counters:
+                # plot from memory when the whole video fit in one chunk, otherwise read back what was written
+                plot_df: Union[pd.DataFrame, str] = self.last_chunks[suffix] if self.n_chunks == 1 else dest
+                plot_file = plot_bodyparts_y_pos_over_time(
+                    plot_df, dest_dir, list(node_names), suffix=suffix, skip_unchanged=skip_unchanged
+                )
+                counters["bytes_written"] = file_size(plot_file)
+        self.last_chunks = {}
+
+
+def _read_chunks(
+    reader: SlpReader,
+    videos: Iterable[str],
+    node_names: List[str],
+    instance_policy: InstancePolicy,
+    chunk_size: Optional[int],
+    metrics: Optional[Metrics] = None,
+    frames: Optional[FrameSelection] = None,
+) -> Iterator[Tuple[str, Optional[InstancePositions]]]:
+    """Read the instances of each of `videos` in chunks, following the chunks of each video by (video, None)."""
+    for video in videos:
+        chunks = reader.iter_instances(video, node_names, instance_policy, chunk_size, scores=instance_policy != "first", frames=frames)
+        while True:
+            with stage(metrics, "read", video) as counters:
+                positions = next(chunks, None)
+                counters["frames"] = len(positions.frame_inds) if positions is not None else 0
+            if positions is None:
+                break
+            yield video, positions
+        yield video, None
+
+
+def _convert_video(
+    reader: SlpReader,
+    video: str,
+    node_names: List[str],
+    dest_dir: str,
+    frame_height: int,
+    conv_factors: Optional[Dict[str, Optional[float]]],
+    format: DataFrameFormat,
+    chunk_size: Optional[int],
+    plot: bool,
+    skip_unchanged_plots: bool,
+    instance_policy: InstancePolicy = "first",
+    metrics: Optional[Metrics] = None,
+    compression: Optional[Compression] = None,
+    post_processing: Optional[PostProcessing] = None,
+    frames: Optional[FrameSelection] = None,
+) -> Dict[str, str]:
+    """Convert a single video of a *.slp file, see `stream_slp_to_csv()`.
+
+    Physical-unit files are only produced when `conv_factors` is not None. Gap filling and smoothing need the
+    whole trace, so when `post_processing` is enabled the video is read in one chunk regardless of `chunk_size`.
+
+    Returns:
+        dict mapping file suffix to the filepath which was saved to; empty if the video has no labeled frames
+    """
+    if post_processing is not None and post_processing.enabled:
+        chunk_size = None
+    output = _VideoOutput(video, dest_dir, ["px", "mm"] if conv_factors is not None else ["px"], format, compression)
+    try:
+        for _, positions in _read_chunks(reader, [video], node_names, instance_policy, chunk_size, metrics, frames):
+            if positions is not None:
+                chunks = _transform_chunk(
+                    positions, video, node_names, frame_height, conv_factors, instance_policy, reader.tracks, post_processing, metrics
+                )
+                output.write(chunks, metrics)
+        output.close(metrics)
+    except BaseException:
+        output.abort()
+        raise
+
+    if plot:
+        output.plot(dest_dir, node_names, skip_unchanged_plots, metrics)
+    return output.filenames
+
+
+def _convert_videos_pipelined(
+    reader: SlpReader,
+    videos: Iterable[str],
+    node_names: List[str],
+    dest_dir: str,
+    frame_height: int,
+    conv_factors: Optional[Dict[str, Optional[float]]],
+    format: DataFrameFormat,
+    chunk_size: Optional[int],
+    plot: bool,
+    skip_unchanged_plots: bool,
+    instance_policy: InstancePolicy = "first",
+    metrics: Optional[Metrics] = None,
+    compression: Optional[Compression] = None,
+    post_processing: Optional[PostProcessing] = None,
+    frames: Optional[FrameSelection] = None,
+    pipeline_depth: int = DEFAULT_PIPELINE_DEPTH,
+) -> Dict[str, Dict[str, str]]:
+    """Convert `videos` of a *.slp file in order, overlapping reading, transforming, writing and plotting.
+
+    Chunks are read by a background thread, transformed in the calling thread, and written, then plotted, by two
+    more background threads, see `paws_tools.pipeline`. At most `pipeline_depth` chunks wait between each of
+    these stages, so that reading the next video overlaps with transforming this one and writing the previous one,
+    while memory stays bounded. The files produced are identical to those of `_convert_video()`.
+
+    Returns:
+        dict mapping each video to the files saved, see `_convert_video()`
+    """
+    if post_processing is not None and post_processing.enabled:
+        chunk_size = None
+    suffixes = ["px", "mm"] if conv_factors is not None else ["px"]
+    results: Dict[str, Dict[str, str]] = {}
+    outputs: Dict[str, _VideoOutput] = {}
+
+    def plot_video(output: _VideoOutput) -> None:
+        output.plot(dest_dir, node_names, skip_unchanged_plots, metrics)
+
+    def write_chunks(item: Tuple[str, Optional[Dict[str, pd.DataFrame]]]) -> None:
+        video, chunks = item
+        if video not in outputs:
+            outputs[video] = _VideoOutput(video, dest_dir, suffixes, format, compression)
+        if chunks is not None:
+            outputs[video].write(chunks, metrics)
+            return
+        # end of the video
+        output = outputs.pop(video)
+        results[video] = output.close(metrics)
+        if plotter is not None:
+            plotter.put(output)
+
+    plotter: Optional[BackgroundConsumer[_VideoOutput]] = None
+    try:
+        with ExitStack() as pipeline:
+            if plot:
+                plotter = pipeline.enter_context(BackgroundConsumer(plot_video, pipeline_depth, name="paws-tools-plot"))
+            writer = pipeline.enter_context(BackgroundConsumer(write_chunks, pipeline_depth, name="paws-tools-write"))
+            chunks = pipeline.enter_context(
+                Prefetcher(
+                    _read_chunks(reader, videos, node_names, instance_policy, chunk_size, metrics, frames),
+                    pipeline_depth,
+                    name="paws-tools-read",
+                )
+            )
+            for video, positions in chunks:
+                transformed = None
+                if positions is not None:
+                    transformed = _transform_chunk(
+                        positions, video, node_names, frame_height, conv_factors, instance_policy, reader.tracks, post_processing, metrics
+                    )
+                writer.put((video, transformed))
+    finally:
+        # files of videos left unfinished by an error, once every stage has stopped
+        for output in outputs.values():
+            output.abort()
+    return results
+
+
+def _convert_videos(
+    reader: SlpReader, videos: Iterable[str], metrics: Optional[Metrics] = None, pipeline_depth: Optional[int] = None, **kwargs
+) -> Dict[str, Dict[str, str]]:
+    """Convert `videos` in order, one at a time, or pipelined if `pipeline_depth` is given.
+
+    See `_convert_video()` and `_convert_videos_pipelined()`.
+    """
+    if pipeline_depth is not None:
+        return _convert_videos_pipelined(reader, videos, metrics=metrics, pipeline_depth=pipeline_depth, **kwargs)
+    return {video: _convert_video(reader, video, metrics=metrics, **kwargs) for video in videos}
+
+
+def _convert_videos_worker(
+    slp_file: str, videos: List[str], metrics: Optional[Metrics] = None, **kwargs
+) -> Tuple[Dict[str, Dict[str, str]], Optional[Metrics]]:
+    """Process pool entry point, converting `videos` of `slp_file` in order. See `_convert_videos()`.
+
+    Returns:
+        tuple of (results, metrics), where `metrics` holds the metrics collected by this worker, if any
+    """
+    with SlpReader(slp_file) as reader:
+        results = _convert_videos(reader, videos, metrics=metrics, **kwargs)
+    if metrics is not None:
+        metrics.dump_profiles()
+    return results, metrics
+
+
+def stream_slp_to_csv(
+    slp_file: str,
+    node_names: List[str],
+    dest_dir: str,
+    frame_height: int,
+    calibration: Optional[Tuple[str, str, float]] = None,
+    format: DataFrameFormat = "tsv",
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    plot: bool = False,
+    skip_unchanged_plots: bool = True,
+    jobs: int = 1,
+    videos: Optional[List[str]] = None,
+    conv_factors: Optional[Dict[str, Optional[float]]] = None,
+    instance_policy: InstancePolicy = "first",
+    metrics: Optional[Metrics] = None,
+    compression: Optional[Compression] = None,
+    post_processing: Optional[PostProcessing] = None,
+    pipeline_depth: Optional[int] = None,
+    frames: Optional[FrameSelection] = None,
+) -> Dict[str, List[str]]:
+    """Convert a *.slp file to per-video files, reading only one video (or chunk of frames) at a time.
+
+    Equivalent to `paws_tools.extraction.node_positions_to_dataframe()`, `invert_y_axis()`,
+    `convert_physical_units()` and `paws_tools.dataframe_io.save_dataframe_to_grouped_csv()`, but never loads the
+    whole dataset; coordinates are read directly from the *.slp file one chunk of frames at a time and appended to
+    the output files.
+
+    Videos are independent, so with `jobs` > 1 they are sharded across a pool of processes, each reading only
+    the frames of the videos assigned to it. With `pipeline_depth`, each process also overlaps reading, transforming,
+    writing and plotting its videos, see `paws_tools.pipeline`.
+
+    Args:
+        slp_file: path to the *.slp file
+        node_names: names of the nodes for which to extract data
+        dest_dir: destination directory for the produced files
+        frame_height: height of the video frames, used to invert the y-axis
+        calibration: tuple of (top_node, bot_node, true_dist), see `paws_tools.transforms.compute_conversion_factors()`.
+            If None, only pixel-unit files are produced
+        format: format for the saved files, see `paws_tools.dataframe_io.save_dataframe_to_grouped_csv()`
+        chunk_size: maximum number of frames held in memory at once, or None to process whole videos at once
+        plot: if True, also plot traces of the nodes, see `plot_bodyparts_y_pos_over_time()`
+        skip_unchanged_plots: if True, do not re-render png plots whose data is unchanged
+        jobs: number of worker processes to use
+        videos: filenames of the videos to convert, as listed in `SlpReader.videos`. If None, all videos are converted
+        conv_factors: conversion factor of each video, if already known. Otherwise, if `calibration` is given, factors
+            are computed for all videos with `paws_tools.calibration.calibrate_slp()`
+        instance_policy: which predicted instances of each frame to extract, see
+            `paws_tools.extraction.node_positions_to_dataframe()`
+        metrics: if provided, the time taken by each stage of the conversion of each video is recorded here,
+            see `paws_tools.profiling`
+        compression: compression of the saved files, see `paws_tools.dataframe_io.save_dataframe_to_grouped_csv()`
+        post_processing: gap filling and smoothing of the coordinates, see `fill_and_smooth()`. When enabled,
+            each video is read whole rather than in chunks
+        pipeline_depth: if provided, convert videos in a pipeline of threads, with at most this many chunks
+            waiting between stages. If None, each chunk is read, transformed and written before the next is read
+        frames: if provided, only the selected frames of each video are read, converted and saved. Unless given
+            `conv_factors`, videos are also calibrated from the selected frames only
+
+    Returns:
+        dict mapping file suffix ('px' and, if calibrating, 'mm') to the list of filepaths which were saved to,
+        ordered by video filename
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    if videos is None:
+        videos = sorted(set(read_video_filenames(slp_file)))
+    else:
+        videos = sorted(set(videos))
+
+    if calibration is not None and conv_factors is None:
+        with stage(metrics, "calibrate"), SlpReader(slp_file) as reader:
+            conv_factors = conversion_factors(
+                calibrate_slp(reader, *calibration, chunk_size=chunk_size, instance_policy=instance_policy, videos=videos, frames=frames)
+            )
+
+    kwargs: Dict[str, Any] = dict(
+        node_names=node_names,
+        dest_dir=dest_dir,
+        frame_height=frame_height,
+        conv_factors=conv_factors if calibration is not None else None,
+        format=format,
+        chunk_size=chunk_size,
+        plot=plot,
+        skip_unchanged_plots=skip_unchanged_plots,
+        instance_policy=instance_policy,
+        compression=compression,
+        post_processing=post_processing,
+        pipeline_depth=pipeline_depth,
+        frames=frames,
+    )
+
+    results: Dict[str, Dict[str, str]] = {}
+    if jobs > 1:
+        # videos which would be saved to the same file are handled by one worker, in order, so that the
+        # result is deterministic and identical to serial processing
+        groups: Dict[str, List[str]] = {}
+        for video in videos:
+            groups.setdefault(get_output_filename(video, dest_dir), []).append(video)
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_plot_worker) as pool:
+            futures = {}
+            for group in groups.values():
+                # each worker collects into fresh metrics, which are merged back as it finishes
+                worker_metrics = Metrics(metrics.cprofile_dir) if metrics is not None else None
+                futures[pool.submit(_convert_videos_worker, slp_file, group, metrics=worker_metrics, **kwargs)] = group
+            with tqdm(total=len(videos), desc=f"Converting Videos ({jobs} jobs)", leave=False) as pbar:
+                for future in as_completed(futures):
+                    group_results, worker_metrics = future.result()
+                    results.update(group_results)
+                    if metrics is not None and worker_metrics is not None:
+                        metrics.merge(worker_metrics)
+                    pbar.update(len(futures[future]))
+    else:
+        with SlpReader(slp_file) as reader:
+            results = _convert_videos(reader, tqdm(videos, desc="Converting Videos", leave=False), metrics=metrics, **kwargs)
+
+    suffixes = ["px", "mm"] if calibration is not None else ["px"]
+    return {suffix: [results[video][suffix] for video in videos if suffix in results[video]] for suffix in suffixes}
+
+
+def save_coordinate_stores(
+    slp_file: str,
+    node_names: List[str],
+    dest_dir: str,
+    frame_height: int,
+    conv_factors: Optional[Dict[str, Optional[float]]] = None,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    instance_policy: InstancePolicy = "first",
+    metrics: Optional[Metrics] = None,
+    post_processing: Optional[PostProcessing] = None,
+    videos: Optional[List[str]] = None,
+    frames: Optional[FrameSelection] = None,
+) -> Dict[str, str]:
+    """Save the coordinates of every video of a *.slp file to memory-mapped coordinate stores.
+
+    Coordinates are read from the *.slp file one chunk of frames at a time, y-inverted and (if `conv_factors` is
+    given) converted to physical units, the same as the files produced by `stream_slp_to_csv()`. See
+    `paws_tools.coord_store.CoordinateStore` for reading the stores back.
+
+    Args:
+        slp_file: path to the *.slp file
+        node_names: names of the nodes for which to extract data
+        dest_dir: destination directory for the produced stores
+        frame_height: height of the video frames, used to invert the y-axis
+        conv_factors: conversion factor of each video. If None, only a pixel-unit store is produced
+        chunk_size: maximum number of frames held in memory at once, or None to process whole videos at once
+        instance_policy: which predicted instance of each frame to extract, 'first' or 'best'; stores hold
+            one row per frame
+        metrics: if provided, the time taken to build the stores is recorded here, see `paws_tools.profiling`
+        post_processing: gap filling and smoothing of the coordinates, see `fill_and_smooth()`. When enabled,
+            each video is read whole rather than in chunks
+        videos: filenames of the videos to store, as listed in `SlpReader.videos`, or None for all videos
+        frames: if provided, only the selected frames of each video are stored
+
+    Returns:
+        dict mapping file suffix ('px' and, if `conv_factors` is given, 'mm') to the path of the store
+    """
+    if instance_policy not in PER_FRAME_POLICIES:
+        raise ValueError(f"Coordinate stores hold one row per frame, expected an instance policy of [{', '.join(PER_FRAME_POLICIES)}]")
+
+    if post_processing is not None and post_processing.enabled:
+        chunk_size = None
+    suffixes = ["px", "mm"] if conv_factors is not None else ["px"]
+    writers: Dict[str, CoordinateStoreWriter] = {}
+    try:
+        # writers are created within the `try`, so the temporary files of those already created are removed if any fails
+        for suffix in suffixes:
+            writers[suffix] = CoordinateStoreWriter(get_store_filename(slp_file, dest_dir, suffix), node_names, units=suffix)
+        with SlpReader(slp_file) as reader:
+            for video in sorted(set(reader.videos if videos is None else videos)):
+                for positions in reader.iter_instances(video, node_names, instance_policy, chunk_size, scores=False, frames=frames):
+                    with stage(metrics, "store", video, frames=len(positions.frame_inds)):
+                        video_ids = np.zeros(len(positions.frame_inds), dtype=np.int64)
+                        px_df = invert_y_axis(
+                            instances_to_dataframe([video], video_ids, positions, node_names, instance_policy, reader.tracks), frame_height
+                        )
+                        if post_processing is not None:
+                            px_df = fill_and_smooth(px_df, post_processing)
+                        writers["px"].append_dataframe(px_df)
+                        if conv_factors is not None:
+                            writers["mm"].append_dataframe(convert_physical_units(px_df, conv_factors))
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+
+    with stage(metrics, "store") as counters:
+        for writer in writers.values():
+            writer.close()
+            counters["bytes_written"] += file_size(writer.dest)
+    return {suffix: writer.dest for suffix, writer in writers.items()}
@@ -0,0 +1,241 @@
+"""Transformations of coordinate dataframes: y-axis inversion, conversion to physical units, gap filling and smoothing.
+
+Each transformation operates on the coordinates of all rows of a dataframe at once, as produced by
+`paws_tools.extraction.node_positions_to_dataframe()`, and returns a new dataframe with the same index and columns.
+Score columns are left untouched.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import CubicSpline
+from scipy.ndimage import maximum_filter1d
+from scipy.signal import savgol_filter
+from sleap_io import Node
+
+from paws_tools.calibration import calibrate_dataframe, conversion_factors
+from paws_tools.constants import Interpolation
+
+
+def _coordinate_columns(df: pd.DataFrame, coords: Tuple[str, ...] = ("x", "y")) -> np.ndarray:
+    """Get a boolean mask over the columns of `df` selecting the coordinate columns in `coords`."""
+    return df.columns.get_level_values(1).isin(coords)
+
+
+def invert_y_axis(df: pd.DataFrame, frame_height: int) -> pd.DataFrame:
+    """Invert the Y-coordinates such that the origin is switched between bottom-left and top-left.
+
+    If the origin is bottom-left, the resulting origin will be top-left.
+    If the origin is top-left, the resulting origin will be bottom-left.
+
+    Args:
+        df: dataframe of node coordinates, as produced by `paws_tools.extraction.node_positions_to_dataframe()`
+        frame_height: height of the video frames
+
+    Returns:
+        new dataframe with inverted y-coordinates
+    """
+    y_cols = _coordinate_columns(df, ("y",))
+    values = df.to_numpy(copy=True)
+    values[:, y_cols] = frame_height - values[:, y_cols]
+    return pd.DataFrame(values, index=df.index, columns=df.columns)
+
+
+def compute_conversion_factors(
+    df: pd.DataFrame, top_node: Union[str, Node], bot_node: Union[str, Node], true_dist: float
+) -> Dict[str, Optional[float]]:
+    """Compute the px to physical unit conversion factor of each video in `df`.
+
+    Warns about videos which could not be calibrated, or whose calibration is an outlier. Use
+    `paws_tools.calibration.calibrate_dataframe()` to get the full calibration report.
+
+    Args:
+        df: dataframe of node coordinates, as produced by `paws_tools.extraction.node_positions_to_dataframe()`,
+            which must include the calibration nodes
+        top_node: node name of first calibration point
+        bot_node: node name of second calibration point
+        true_dist: true physical distance between `top_node` and `bot_node`
+
+    Returns:
+        dict mapping video filename to conversion factor, or None if it could not be determined for that video
+    """
+    top_name, bot_name = [node.name if isinstance(node, Node) else node for node in (top_node, bot_node)]
+    return conversion_factors(calibrate_dataframe(df, top_name, bot_name, true_dist))
+
+
+def convert_physical_units(df: pd.DataFrame, conv_factors: Dict[str, Optional[float]]) -> pd.DataFrame:
+    """Converts the coordinates in `df` from px to physical distance units (i.e. millimeters).
+
+    Videos without a conversion factor (missing from `conv_factors`, or None) are left in px.
+
+    Args:
+        df: dataframe of node coordinates, as produced by `paws_tools.extraction.node_positions_to_dataframe()`
+        conv_factors: conversion factor for each video, as produced by `compute_conversion_factors()`
+
+    Returns:
+        new dataframe with coordinates converted to physical distances
+    """
+    # look up the factor once per video, then broadcast it to rows through the index codes
+    video_level = df.index.names.index("video")
+    video_factors = np.array([conv_factors.get(video) for video in df.index.levels[video_level]], dtype=np.float64)
+    video_factors[np.isnan(video_factors)] = 1.0  # None -> NaN -> leave in px
+    row_factors = video_factors[df.index.codes[video_level]]
+
+    xy_cols = _coordinate_columns(df)
+    values = df.to_numpy(copy=True)
+    values[:, xy_cols] *= row_factors[:, None]
+    return pd.DataFrame(values, index=df.index, columns=df.columns)
+
+
+@dataclass
+class PostProcessing:
+    """Gap filling and smoothing of the coordinates of each trace, applied after extraction, see `fill_and_smooth()`.
+
+    Attributes:
+        interpolate: method of filling missing coordinates, 'linear' or 'spline' (equivalent to `zoo::na.spline()`),
+            or None to leave gaps unfilled
+        max_gap: longest gap, in frames, which is filled; longer gaps are left missing. If None, all gaps are filled
+        smooth: (window, order) of a Savitzky-Golay filter smoothing each trace, or None for no smoothing. The window
+            is a number of rows, and must be odd and greater than the order
+    """
+
+    interpolate: Optional[Interpolation] = None
+    max_gap: Optional[int] = None
+    smooth: Optional[Tuple[int, int]] = None
+
+    def __post_init__(self):
+        """Validate the parameters."""
+        if self.smooth is not None:
+            window, order = self.smooth
+            if window % 2 == 0 or window <= order:
+                raise ValueError(f"Savitzky-Golay window must be odd and greater than the order, got window {window}, order {order}")
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any gap filling or smoothing is performed."""
+        return self.interpolate is not None or self.smooth is not None
+
+
+def _fill_gaps(frames: np.ndarray, values: np.ndarray, method: Interpolation, max_gap: Optional[int]) -> np.ndarray:
+    """Fill missing values in each column of a trace, see `fill_and_smooth()`.
+
+    Args:
+        frames: array of shape (rows,) holding the ascending frame index of each row
+        values: array of shape (rows, columns) possibly containing NaNs
+        method: 'linear' or 'spline'
+        max_gap: longest gap, in frames, which is filled, or None to fill all gaps
+
+    Returns:
+        gap-filled copy of `values`
+    """
+    n_rows = len(frames)
+    valid = np.isfinite(values)
+    rows = np.arange(n_rows)[:, None]
+    # nearest valid row before and after every row, in every column; -1 or n_rows where there is none
+    prev_row = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    next_row = np.minimum.accumulate(np.where(valid, rows, n_rows)[::-1], axis=0)[::-1]
+    has_prev, has_next = prev_row >= 0, next_row < n_rows
+    prev_frames = frames[np.where(has_prev, prev_row, 0)]
+    next_frames = frames[np.where(has_next, next_row, n_rows - 1)]
+
+    # gaps before the first, or after the last, valid value are filled with the nearest valid value
+    missing = ~valid & (has_prev | has_next)
+    if max_gap is not None:
+        gap = np.where(
+            has_prev & has_next, next_frames - prev_frames - 1, np.where(has_prev, frames[-1] - prev_frames, next_frames - frames[0])
+        )
+        missing &= gap <= max_gap
+    filled = values.copy()
+    nearest = np.where(has_prev, prev_row, next_row)
+    edges = missing & ~(has_prev & has_next)
+    filled[edges] = np.take_along_axis(values, nearest, axis=0)[edges]
+
+    interior = missing & has_prev & has_next
+    if not interior.any():
+        return filled
+    if method == "linear":
+        prev_values = np.take_along_axis(values, np.where(has_prev, prev_row, 0), axis=0)
+        next_values = np.take_along_axis(values, np.where(has_next, next_row, 0), axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = (frames[:, None] - prev_frames) / (next_frames - prev_frames)
+        filled[interior] = (prev_values + weight * (next_values - prev_values))[interior]
+    else:
+        # columns missing the same rows (i.e. the x and y of a node) share a spline fit over all of them at once
+        _, mask_ids = np.unique(valid, axis=1, return_inverse=True)
+        for mask_id in np.unique(mask_ids.reshape(-1)):
+            columns = np.flatnonzero(mask_ids.reshape(-1) == mask_id)
+            fill_rows = np.flatnonzero(interior[:, columns].any(axis=1))
+            if len(fill_rows) == 0:
+                continue
+            valid_rows = np.flatnonzero(valid[:, columns[0]])
+            spline = CubicSpline(frames[valid_rows], values[np.ix_(valid_rows, columns)], axis=0)
+            block = filled[np.ix_(fill_rows, columns)]
+            fill_mask = interior[np.ix_(fill_rows, columns)]
+            block[fill_mask] = spline(frames[fill_rows])[fill_mask]
+            filled[np.ix_(fill_rows, columns)] = block
+    return filled
+
+
+def _smooth(values: np.ndarray, window: int, order: int) -> np.ndarray:
+    """Smooth each column of a trace with a Savitzky-Golay filter, as done by `fill_and_smooth`.
+
+    Rows whose filter window includes a missing value keep their original value, so gaps are not widened.
+
+    Args:
+        values: array of shape (rows, columns) possibly containing NaNs
+        window: length of the filter window, in rows
+        order: order of the polynomial fit within each window
+
+    Returns:
+        smoothed copy of `values`; unchanged if there are fewer rows than `window`
+    """
+    if len(values) < window:
+        return values.copy()
+
+    missing = ~np.isfinite(values)
+    smoothed = savgol_filter(np.where(missing, 0.0, values), window, order, axis=0, mode="interp")
+    if not missing.any():
+        return smoothed
+
+    # rows within half a window of a missing value; the first and last half windows are fit to the first and last windows
+    half = window // 2
+    tainted = maximum_filter1d(missing, size=window, axis=0, mode="constant", cval=False)
+    tainted[:half] |= missing[:window].any(axis=0)
+    tainted[-half:] |= missing[-window:].any(axis=0)
+    return np.where(tainted, values, smoothed)
+
+
+def fill_and_smooth(df: pd.DataFrame, post_processing: PostProcessing) -> pd.DataFrame:
+    """Fill gaps in, and then smooth, the trace of every node of every video (and instance) of `df`.
+
+    Each trace is processed as a 2D array holding the x and y coordinates of all nodes, so every node is filled
+    and smoothed at once. Gaps are measured and interpolated over frame indices, so frames without any row
+    count towards the length of a gap; smoothing treats consecutive rows as consecutive frames. Score columns
+    are left untouched.
+
+    Args:
+        df: dataframe of node coordinates, as produced by `paws_tools.extraction.node_positions_to_dataframe()`
+        post_processing: gap filling and smoothing to perform
+
+    Returns:
+        new dataframe with gaps filled and traces smoothed
+    """
+    if not post_processing.enabled or len(df) == 0:
+        return df
+
+    xy_cols = _coordinate_columns(df)
+    values = df.to_numpy(dtype=np.float64, copy=True)
+    frames = df.index.get_level_values("frame_idx").to_numpy()
+    # one trace per video, or per video and instance (or track) for policies producing many rows per frame
+    trace_levels = [name for name in df.index.names if name != "frame_idx"]
+    traces = df.groupby(level=trace_levels if len(trace_levels) > 1 else trace_levels[0], sort=False).indices
+    for rows in traces.values():
+        trace = values[np.ix_(rows, xy_cols)]
+        if post_processing.interpolate is not None:
+            trace = _fill_gaps(frames[rows], trace, post_processing.interpolate, post_processing.max_gap)
+        if post_processing.smooth is not None:
+            trace = _smooth(trace, *post_processing.smooth)
+        values[np.ix_(rows, xy_cols)] = trace
+    return pd.DataFrame(values, index=df.index, columns=df.columns)
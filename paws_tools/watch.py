@@ -0,0 +1,229 @@
+"""Watch a directory for new or modified *.slp files, converting each once it has finished being written.
+
+The directory is polled rather than watched with OS notifications, which are not delivered for files written
+over network shares, where inference results usually land. A file is considered finished once its size and
+modification time have not changed for a settle time; files modified again afterwards are converted again.
+
+Files are converted by `paws_tools.batch.convert_file_task()`, over a bounded pool of worker processes. The
+fingerprint and outcome of each conversion is kept in a state file, so a restarted watcher only converts files
+which are new or were modified while it was not running. Files which fail to convert are not retried until they are modified.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing.pool import AsyncResult
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from paws_tools.batch import convert_file_task, find_slp_files, make_file_task
+from paws_tools.cache import ConversionCache, file_fingerprint
+from paws_tools.constants import DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE_TIME
+from paws_tools.plotting import init_plot_worker
+from paws_tools.profiling import Metrics
+
+# Name of the state file, stored in the destination directory
+STATE_FILENAME = ".paws-tools-watch.json"
+
+# Version of the state file layout, state files with another version are discarded
+STATE_VERSION = 1
+
+
+class WatchState:
+    """Persistent record of the files converted by `watch_directory()`, keyed by absolute path."""
+
+    def __init__(self, filename: str):
+        """Load the state stored in `filename`, if any.
+
+        Args:
+            filename: path of the state file
+        """
+        self.filename = filename
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                if state.get("version") == STATE_VERSION:
+                    self.files = state["files"]
+            except (OSError, ValueError, KeyError):
+                pass  # an unreadable state file is equivalent to an empty one
+
+    def is_done(self, slp_file: str, fingerprint: Dict[str, int]) -> bool:
+        """Check whether `slp_file` was already converted, or failed to convert, in its current state.
+
+        Args:
+            slp_file: path to the *.slp file
+            fingerprint: current fingerprint of the file, see `paws_tools.cache.file_fingerprint()`
+
+        Returns:
+            True if the file has not been modified since it was last converted
+        """
+        entry = self.files.get(os.path.abspath(slp_file))
+        return entry is not None and entry["fingerprint"] == fingerprint
+
+    def record(self, slp_file: str, fingerprint: Dict[str, int], row: Dict[str, Any]) -> None:
+        """Record the conversion of `slp_file`.
+
+        Args:
+            slp_file: path to the *.slp file
+            fingerprint: fingerprint of the file when it was converted
+            row: summary of the conversion, see `paws_tools.batch.SUMMARY_COLUMNS`
+        """
+        entry = {key: value for key, value in row.items() if key not in ("file", "traceback")}
+        self.files[os.path.abspath(slp_file)] = {"fingerprint": fingerprint, "converted_at": time.time(), **entry}
+
+    def save(self) -> None:
+        """Write the state, replacing the previous one atomically."""
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "files": self.files}, f, indent=2, sort_keys=True)
+        os.replace(tmp_filename, self.filename)
+
+
+def _fingerprint_or_none(filename: str) -> Optional[Dict[str, int]]:
+    """Get the fingerprint of a file, or None if it has disappeared since it was found."""
+    try:
+        return file_fingerprint(filename)
+    except OSError:
+        return None
+
+
+def _print_row(row: Dict[str, Any]) -> None:
+    """Print the outcome of converting one file."""
+    stamp = time.strftime("%H:%M:%S")
+    if row["status"] == "ok":
+        print(f'[{stamp}] Converted "{row["file"]}": {row["converted"]} video(s) converted, {row["skipped"]} skipped in {row["seconds"]}s')
+    else:
+        print(f'[{stamp}] Failed to convert "{row["file"]}":\n{row.get("traceback", row["error"])}')
+
+
+def watch_directory(
+    directory: str,
+    dest_dir: str,
+    jobs: int = 1,
+    max_tasks_per_worker: Optional[int] = None,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    settle_time: float = DEFAULT_SETTLE_TIME,
+    state_file: Optional[str] = None,
+    once: bool = False,
+    force: bool = False,
+    metrics: Optional[Metrics] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    **kwargs,
+) -> List[Dict[str, Any]]:
+    """Convert *.slp files in `directory` (searched recursively) as they are written, see `convert_slp_file()`.
+
+    Every `poll_interval` seconds the directory is scanned for *.slp files which are new, or modified since they
+    were last converted. Each is converted once its size and modification time have been unchanged for
+    `settle_time` seconds. At most `jobs` files are converted at once; further files wait for a free worker.
+
+    Runs until interrupted (i.e. by KeyboardInterrupt), until `should_stop` returns True, or, with `once`, until
+    every file found has been converted. Conversions in progress are completed before returning, unless
+    interrupted, in which case they are abandoned and the files are converted again when next watched.
+
+    Args:
+        directory: directory to watch
+        dest_dir: destination directory for the produced files
+        jobs: number of worker processes, each converting one file at a time. With 1, files are converted within
+            this process, one at a time
+        max_tasks_per_worker: number of files a worker converts before being replaced, or None for no limit
+        poll_interval: seconds between scans of `directory`
+        settle_time: seconds a file must be left unchanged before it is converted
+        state_file: path of the state file, defaults to `STATE_FILENAME` in `dest_dir`
+        once: if True, return once every file found has been converted, rather than watching indefinitely
+        force: if True, convert every file found, even those already converted, and every video within them
+        metrics: if provided, the time taken by each stage of every conversion is recorded here, see
+            `paws_tools.batch.batch_convert()`
+        should_stop: optional function called after each scan, returning True to stop watching
+        **kwargs: additional arguments for `convert_slp_file()`
+
+    Returns:
+        summary of each conversion made, see `paws_tools.batch.SUMMARY_COLUMNS`, in the order they completed
+
+    Raises:
+        ValueError: if two *.slp files in `directory` have the same basename, see `paws_tools.batch.check_unique_names()`
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    state = WatchState(state_file or os.path.join(dest_dir, STATE_FILENAME))
+    if force:
+        state.files = {}
+    cache = ConversionCache(dest_dir, force=force)
+    kwargs = dict(kwargs, jobs=1)
+
+    # files waiting to settle, with their fingerprint and when it was first seen
+    settling: Dict[str, Tuple[Dict[str, int], float]] = {}
+    # files being converted, with their fingerprint when they were submitted
+    running: Dict[str, Tuple[AsyncResult, Dict[str, int]]] = {}
+    completed: List[Dict[str, Any]] = []
+
+    def finish(row: Dict[str, Any], fingerprint: Dict[str, int], file_cache: Optional[ConversionCache], file_metrics: Optional[Metrics]):
+        """Record a completed conversion in the cache manifest, the metrics and the state file."""
+        _print_row(row)
+        if file_cache is not None:
+            cache.merge(file_cache)
+            cache.save()
+        if metrics is not None and file_metrics is not None:
+            metrics.merge(file_metrics)
+        row.pop("traceback", None)
+        state.record(row["file"], fingerprint, row)
+        state.save()
+        completed.append(row)
+
+    pool = multiprocessing.Pool(jobs, initializer=init_plot_worker, maxtasksperchild=max_tasks_per_worker) if jobs > 1 else None
+    interrupted = True
+    try:
+        while True:
+            for slp_file, (result, fingerprint) in list(running.items()):
+                if result.ready():
+                    del running[slp_file]
+                    row, file_cache, file_metrics = result.get()
+                    finish(row, fingerprint, file_cache, file_metrics)
+
+            now = time.monotonic()
+            found = set()
+            for slp_file in find_slp_files([directory]):
+                found.add(slp_file)
+                current = _fingerprint_or_none(slp_file)
+                if current is None or slp_file in running or state.is_done(slp_file, current):
+                    settling.pop(slp_file, None)
+                    continue
+                if slp_file not in settling or settling[slp_file][0] != current:
+                    # new, or still being written
+                    settling[slp_file] = (current, now)
+            for slp_file in set(settling) - found:
+                del settling[slp_file]  # deleted before it settled
+
+            ready = sorted(fn for fn, (_, seen) in settling.items() if now - seen >= settle_time)
+            for slp_file in ready:
+                if pool is not None and len(running) >= jobs:
+                    break  # wait for a free worker, leaving the rest settled
+                fingerprint = settling.pop(slp_file)[0]
+                task = make_file_task(slp_file, dest_dir, force, metrics, **kwargs)
+                if pool is None:
+                    row, file_cache, file_metrics = convert_file_task(task)
+                    finish(row, fingerprint, file_cache, file_metrics)
+                else:
+                    running[slp_file] = (pool.apply_async(convert_file_task, (task,)), fingerprint)
+
+            if once and len(settling) == 0 and len(running) == 0:
+                break
+            if should_stop is not None and should_stop():
+                break
+            time.sleep(poll_interval)
+        interrupted = False
+    finally:
+        if pool is not None:
+            if interrupted:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+        if not interrupted:
+            # complete the conversions still running when told to stop
+            for result, fingerprint in running.values():
+                row, file_cache, file_metrics = result.get()
+                finish(row, fingerprint, file_cache, file_metrics)
+        state.save()
+
+    return completed
@@ -1,9 +1,124 @@
-"""Fixtures that return paths to .slp files."""
+"""Fixtures that return paths to .slp files, and a generator of synthetic labels for tests and benchmarks."""
+
+import json
+import os
+from typing import Sequence
+
+import h5py
+import numpy as np
 import pytest
 import sleap_io
+from sleap_io import Instance, Labels, LabeledFrame, PredictedInstance, Skeleton, Track, Video
+from sleap_io.io import slp
+
+
+def make_labels(
+    n_videos: int = 2,
+    n_frames: int = 100,
+    node_names: Sequence[str] = ("Toe", "Heel", "Top_Box", "Bot_Box"),
+    empty_frame_rate: float = 0.1,
+    seed: int = 0,
+    n_instances: int = 1,
+    n_tracks: int = 0,
+    missing_node_rate: float = 0.0,
+    user_instance_rate: float = 0.0,
+) -> Labels:
+    """Build an in-memory `Labels` object containing random predictions.
+
+    The defaults give a small dataset suitable for tests, larger datasets for benchmarks are made by
+    increasing `n_videos` and `n_frames`.
+
+    Args:
+        n_videos: number of videos to generate
+        n_frames: number of labeled frames per video
+        node_names: names of the skeleton nodes
+        empty_frame_rate: fraction of frames which will not have any predicted instance
+        seed: seed for the random number generator
+        n_instances: number of predicted instances in each non-empty frame
+        n_tracks: number of tracks; if non-zero, each instance is assigned a random track
+        missing_node_rate: fraction of predicted points which are missing, i.e. have NaN coordinates
+        user_instance_rate: fraction of non-empty frames which also have a user-labeled `Instance`, stored
+            before the predicted instances
+
+    Returns:
+        `Labels` with `n_instances` predicted instances in each non-empty frame
+    """
+    rng = np.random.default_rng(seed)
+    skeleton = Skeleton(nodes=list(node_names))
+    videos = [Video(filename=f"/data/video_{i}.mp4") for i in range(n_videos)]
+    tracks = [Track(name=f"track_{i}") for i in range(n_tracks)]
+
+    labeled_frames = []
+    for video in videos:
+        # shuffle frame order so consumers cannot rely on the order frames were stored in
+        for frame_idx in rng.permutation(n_frames):
+            instances = []
+            if rng.random() >= empty_frame_rate:
+                if user_instance_rate > 0 and rng.random() < user_instance_rate:
+                    instances.append(Instance.from_numpy(points=rng.uniform(0, 512, size=(len(node_names), 2)), skeleton=skeleton))
+                for _ in range(n_instances):
+                    points = rng.uniform(0, 512, size=(len(node_names), 2))
+                    if missing_node_rate > 0:
+                        points[rng.random(len(node_names)) < missing_node_rate] = np.nan
+                    instances.append(
+                        PredictedInstance.from_numpy(
+                            points=points,
+                            point_scores=rng.uniform(size=len(node_names)),
+                            instance_score=rng.uniform(),
+                            skeleton=skeleton,
+                            track=tracks[rng.integers(n_tracks)] if n_tracks > 0 else None,
+                        )
+                    )
+            labeled_frames.append(LabeledFrame(video=video, frame_idx=int(frame_idx), instances=instances))
+
+    return Labels(labeled_frames=labeled_frames, videos=videos, skeletons=[skeleton], tracks=tracks)
+
+
+def write_slp(labels: Labels, filename: str) -> str:
+    """Save `labels` to a *.slp file.
+
+    `sleap_io.save_slp()` cannot serialize videos without a backend, so the videos are written
+    directly and the remaining datasets are written using `sleap_io`.
+
+    Args:
+        labels: labels to save
+        filename: destination *.slp file
+
+    Returns:
+        `filename`
+    """
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    with h5py.File(filename, "a") as f:
+        videos_json = [np.string_(json.dumps({"backend": {"filename": video.filename}})) for video in labels.videos]
+        f.create_dataset("videos_json", data=videos_json, maxshape=(None,))
+    slp.write_tracks(filename, labels.tracks)
+    slp.write_metadata(filename, labels)
+    slp.write_lfs(filename, labels)
+    return filename
+
+
+@pytest.fixture
+def slp_synthetic() -> sleap_io.Labels:
+    """Small synthetic `Labels` with two videos, predicted instances and some empty frames."""
+    return make_labels()
+
+
+@pytest.fixture
+def slp_synthetic_file(tmp_path, slp_synthetic: Labels) -> str:
+    """Path to a *.slp file containing the `slp_synthetic` labels."""
+    return write_slp(slp_synthetic, str(tmp_path / "synthetic.slp"))
+
+
+@pytest.fixture
+def slp_typical_file(tmp_path) -> str:
+    """Path to a typical *.slp file including `PredictedInstance`, `Instance`, `Track` and `Skeleton` objects."""
+    labels = make_labels(n_videos=3, n_instances=2, n_tracks=2, missing_node_rate=0.05, user_instance_rate=0.2, seed=1)
+    return write_slp(labels, str(tmp_path / "typical.slp"))
 
 
 @pytest.fixture
-def slp_typical() -> sleap_io.Labels:
+def slp_typical(slp_typical_file: str) -> sleap_io.Labels:
     """Typical SLP file including  `PredictedInstance`, `Instance`, `Track` and `Skeleton` objects."""
-    return sleap_io.load_slp(r"H:\Abraira_Lab\Tom V\2022_08_12_SLEAP\labels.v004.slp")
+    return sleap_io.load_slp(slp_typical_file)
@@ -0,0 +1,82 @@
+import os
+from typing import Any, Dict
+
+import pytest
+from sleap_io import Labels
+
+from paws_tools.batch import batch_convert, find_slp_files
+from paws_tools.cache import ConversionCache
+from tests.fixtures.slp import make_labels, write_slp
+
+
+def test_find_slp_files(tmp_path):
+    """Test files, directories and glob patterns are expanded to unique *.slp files."""
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    for fn in ["one.slp", "a/two.slp", "a/b/three.slp", "a/notes.txt"]:
+        (tmp_path / fn).touch()
+
+    assert find_slp_files([str(tmp_path / "one.slp")]) == [str(tmp_path / "one.slp")]
+    assert find_slp_files([str(tmp_path / "a")]) == [str(tmp_path / "a" / "b" / "three.slp"), str(tmp_path / "a" / "two.slp")]
+    assert find_slp_files([str(tmp_path / "*.slp"), str(tmp_path / "**" / "*.slp")]) == [
+        str(tmp_path / "one.slp"),
+        str(tmp_path / "a" / "b" / "three.slp"),
+        str(tmp_path / "a" / "two.slp"),
+    ]
+    with pytest.raises(FileNotFoundError):
+        find_slp_files([str(tmp_path / "missing*.slp")])
+
+    # files of the same name in different directories would overwrite each other's outputs
+    (tmp_path / "a" / "one.slp").touch()
+    with pytest.raises(ValueError, match="same name"):
+        find_slp_files([str(tmp_path)])
+    with pytest.raises(ValueError, match="same name"):
+        batch_convert([str(tmp_path / "one.slp"), str(tmp_path / "a" / "one.slp")], str(tmp_path / "out"))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch_convert(tmp_path, slp_synthetic: Labels, jobs: int):
+    """Test files are converted, failures are reported without stopping the batch, and the cache is shared."""
+    good_file = write_slp(slp_synthetic, str(tmp_path / "good.slp"))
+    other_labels = make_labels(n_videos=1, seed=1)
+    other_labels.videos[0].filename = "/data/other.mp4"
+    other_file = write_slp(other_labels, str(tmp_path / "other.slp"))
+    bad_file = str(tmp_path / "bad.slp")
+    with open(bad_file, "w") as f:
+        f.write("not a slp file")
+
+    dest_dir = str(tmp_path / "out")
+    kwargs: Dict[str, Any] = dict(
+        body_parts=["Toe"], ignore_body_parts=[], frame_height=512, calibration=("Top_Box", "Bot_Box", 1.0), plot=False
+    )
+    summary = batch_convert([good_file, bad_file, other_file], dest_dir, jobs=jobs, max_tasks_per_worker=1, **kwargs)
+
+    assert summary["file"].tolist() == [good_file, bad_file, other_file]
+    assert summary["status"].tolist() == ["ok", "failed", "ok"]
+    assert summary["videos"].tolist()[::2] == [2, 1]
+    assert summary["frames"].tolist()[::2] == [200, 100]
+    assert summary["converted"].tolist()[::2] == [2, 1]
+    assert summary.loc[1, "error"] != ""
+    assert sorted(fn for fn in os.listdir(dest_dir) if fn.endswith(".px.tsv")) == ["other.px.tsv", "video_0.px.tsv", "video_1.px.tsv"]
+
+    # a second run hits the cache, recorded by the first run
+    summary = batch_convert([good_file, other_file], dest_dir, jobs=jobs, **kwargs)
+    assert summary["skipped"].tolist() == [2, 1]
+
+
+def test_batch_convert_interrupted(tmp_path, monkeypatch):
+    """Test files still queued are abandoned, rather than waited for, when the batch is interrupted."""
+    slp_files = []
+    for i in range(8):
+        labels = make_labels(n_videos=1, seed=i)
+        labels.videos[0].filename = f"/data/file_{i}.mp4"
+        slp_files.append(write_slp(labels, str(tmp_path / f"file_{i}.slp")))
+
+    def interrupt(self, other):
+        raise KeyboardInterrupt()
+
+    # raised in this process as soon as the first file completes
+    monkeypatch.setattr(ConversionCache, "merge", interrupt)
+    dest_dir = tmp_path / "out"
+    with pytest.raises(KeyboardInterrupt):
+        batch_convert(slp_files, str(dest_dir), jobs=2, body_parts=["Toe"], ignore_body_parts=[], frame_height=512, plot=False)
+    assert len([fn for fn in os.listdir(dest_dir) if fn.endswith(".px.tsv")]) < len(slp_files)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sleap_io import Labels
+
+from paws_tools.calibration import calibrate_dataframe, calibrate_slp, compute_calibration, conversion_factors, grouped_median
+from paws_tools.slp_reader import SlpReader
+from paws_tools.slp_to_csv import get_nodes_for_bodyparts, node_positions_to_dataframe
+
+
+def test_grouped_median():
+    """Test grouped medians and counts match `numpy.nanmedian` applied to each group."""
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, 5, size=1000)
+    values = rng.normal(size=1000)
+    values[rng.random(1000) < 0.2] = np.nan
+    values[codes == 3] = np.nan  # a group without any values
+
+    counts, medians = grouped_median(codes, values, 6)
+    for group in range(6):
+        group_values = values[codes == group]
+        assert counts[group] == np.isfinite(group_values).sum()
+        if counts[group] > 0:
+            assert medians[group] == np.nanmedian(group_values)
+        else:
+            assert np.isnan(medians[group])
+
+
+def test_compute_calibration():
+    """Test per-video statistics and factors are computed, and outlier videos are flagged."""
+    videos = ["a.mp4", "b.mp4", "c.mp4", "d.mp4", "e.mp4"]
+    # similar distances in videos a-d, a far off distance in e, and a frame without calibration nodes in a
+    distances = np.array([5.0, 5.0, np.nan, 5.0, 5.1, 4.9, 5.2, 10.0, 10.0])
+    codes = np.array([0, 0, 0, 1, 2, 3, 3, 4, 4])
+
+    report = compute_calibration(videos, codes, distances, true_dist=10.0)
+
+    assert report.index.tolist() == videos
+    assert report["frames"].tolist() == [3, 1, 1, 2, 2]
+    assert report["valid_frames"].tolist() == [2, 1, 1, 2, 2]
+    assert report.loc["a.mp4", "conv_factor"] == 2.0
+    assert report.loc["d.mp4", "median_px_dist"] == pytest.approx(5.05)
+    assert report["outlier"].tolist() == [False, False, False, False, True]
+
+    factors = conversion_factors(report, warn=False)
+    assert factors["a.mp4"] == 2.0
+    assert factors["e.mp4"] == 1.0
+
+
+def test_calibrate_missing_nodes():
+    """Test the Euclidean distance is used, and videos where the calibration nodes are never found are not calibrated."""
+    index = pd.MultiIndex.from_product([["a.mp4", "b.mp4"], [0, 1]], names=["video", "frame_idx"])
+    columns = pd.MultiIndex.from_product([["Top_Box", "Bot_Box"], ["x", "y"]])
+    values = np.array([[0.0, 0.0, 3.0, 4.0], [0.0, 0.0, 3.0, 4.0], [np.nan] * 4, [np.nan] * 4])
+    report = calibrate_dataframe(pd.DataFrame(values, index=index, columns=columns), "Top_Box", "Bot_Box", 1.0)
+
+    assert conversion_factors(report, warn=False) == {"a.mp4": 0.2, "b.mp4": None}
+    assert report.loc["b.mp4", "valid_frames"] == 0
+    assert not report.loc["b.mp4", "outlier"]
+
+
+def test_calibrate_slp(slp_synthetic: Labels, slp_synthetic_file: str):
+    """Test calibrating directly from a *.slp file matches calibrating the extracted dataframe."""
+    df = node_positions_to_dataframe(slp_synthetic, get_nodes_for_bodyparts(slp_synthetic, ["Top_Box", "Bot_Box"]))
+    expected = calibrate_dataframe(df, "Top_Box", "Bot_Box", 2.0)
+
+    with SlpReader(slp_synthetic_file) as reader:
+        report = calibrate_slp(reader, "Top_Box", "Bot_Box", 2.0, chunk_size=7)
+
+    pd.testing.assert_frame_equal(report, expected)
@@ -0,0 +1,273 @@
+import json
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from sleap_io import Labels
+
+from paws_tools.cache import MANIFEST_FILENAME
+from paws_tools.cli import cli
+from paws_tools.coord_store import CoordinateStore
+from paws_tools.dataframe_io import read_dataframe
+from paws_tools.slp_reader import FrameSelection
+from paws_tools.slp_to_csv import select_frames
+from tests.fixtures.slp import make_labels, write_slp
+
+
+def read_outputs(dest_dir: str) -> dict:
+    """Read all files in `dest_dir`, except the cache manifest, keyed by filename."""
+    outputs = {}
+    for fn in sorted(os.listdir(dest_dir)):
+        if fn == MANIFEST_FILENAME:
+            continue
+        with open(os.path.join(dest_dir, fn), "rb") as f:
+            outputs[fn] = f.read()
+    return outputs
+
+
+@pytest.mark.parametrize(
+    "mode_args",
+    [
+        ["--streaming", "--chunk-size", "16"],
+        ["--jobs", "2"],
+        ["--pipeline"],
+        ["--pipeline", "--streaming", "--chunk-size", "16", "--jobs", "2"],
+    ],
+)
+def test_slp_to_csv_modes(tmp_path, slp_synthetic_file: str, mode_args: List[str]):
+    """Test --streaming, --jobs and --pipeline produce identical files to the default in-memory conversion."""
+    runner = CliRunner()
+    args = ["slp-to-csv", slp_synthetic_file, "-bp", "Toe", "-bp", "Heel", "--no-plot", "--dest-dir"]
+
+    result = runner.invoke(cli, args + [str(tmp_path / "memory")])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli, args + [str(tmp_path / "streaming")] + mode_args)
+    assert result.exit_code == 0, result.output
+
+    expected = read_outputs(str(tmp_path / "memory"))
+    assert sorted(expected.keys()) == ["synthetic.calibration.tsv", "video_0.mm.tsv", "video_0.px.tsv", "video_1.mm.tsv", "video_1.px.tsv"]
+    assert read_outputs(str(tmp_path / "streaming")) == expected
+
+
+def test_slp_to_csv_post_processing(tmp_path, slp_synthetic_file: str):
+    """Test --interpolate and --smooth give identical files when streaming, and fill missing points."""
+    runner = CliRunner()
+    args = ["slp-to-csv", slp_synthetic_file, "--no-plot", "--interpolate", "spline", "--smooth", "savgol:5,2", "--dest-dir"]
+
+    result = runner.invoke(cli, args + [str(tmp_path / "memory")])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli, args + [str(tmp_path / "streaming"), "--streaming", "--chunk-size", "16"])
+    assert result.exit_code == 0, result.output
+    assert read_outputs(str(tmp_path / "streaming")) == read_outputs(str(tmp_path / "memory"))
+    assert not read_dataframe(str(tmp_path / "memory" / "video_0.px.tsv")).isna().any().any()
+
+    for bad_args in [
+        ["--smooth", "savgol:4,2"],
+        ["--smooth", "median:5"],
+        ["--interpolate", "none", "--max-gap", "3"],
+        ["--streaming", "--chunk-size", "0"],
+    ]:
+        result = runner.invoke(cli, args + [str(tmp_path / "bad")] + bad_args)
+        assert result.exit_code == 2, result.output
+
+
+@pytest.mark.parametrize("instance_policy", ["best", "track", "all"])
+def test_slp_to_csv_instance_policy(tmp_path, instance_policy: str):
+    """Test multi-instance extraction produces identical files in memory and streaming, and round-trips through plotting."""
+    slp_file = write_slp(make_labels(n_instances=3, n_tracks=2), str(tmp_path / "multi.slp"))
+    runner = CliRunner()
+    args = ["slp-to-csv", slp_file, "-bp", "Toe", "--instance-policy", instance_policy, "--dest-dir"]
+
+    result = runner.invoke(cli, args + [str(tmp_path / "memory")])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli, args + [str(tmp_path / "streaming"), "--streaming", "--chunk-size", "16", "--no-plot"])
+    assert result.exit_code == 0, result.output
+
+    expected = read_outputs(str(tmp_path / "memory"))
+    assert "video_0.mp4_[Toe]_ycord_vs_time.px.png" in expected
+    streamed = read_outputs(str(tmp_path / "streaming"))
+    assert streamed == {fn: data for fn, data in expected.items() if not fn.endswith(".png")}
+
+    df = read_dataframe(str(tmp_path / "memory" / "video_0.px.tsv"))
+    assert df.index.names[:2] == ["video", "frame_idx"]
+    assert ("Toe", "score") in df.columns and ("instance", "score") in df.columns
+
+
+def test_slp_to_csv_cache(tmp_path, slp_synthetic: Labels):
+    """Test unchanged videos are skipped on re-runs, changed videos and --force are converted again."""
+    slp_file = write_slp(slp_synthetic, str(tmp_path / "labels.slp"))
+    dest_dir = tmp_path / "out"
+    runner = CliRunner()
+    args = ["slp-to-csv", slp_file, "--no-plot", "--dest-dir", str(dest_dir)]
+
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "0 video(s) unchanged and skipped, 2 video(s) converted" in result.output
+    expected = read_outputs(str(dest_dir))
+
+    # nothing changed
+    result = runner.invoke(cli, args)
+    assert "2 video(s) unchanged and skipped, 0 video(s) converted" in result.output
+
+    # a removed output file is regenerated
+    os.remove(dest_dir / "video_0.mm.tsv")
+    result = runner.invoke(cli, args)
+    assert "1 video(s) unchanged and skipped, 1 video(s) converted" in result.output
+    assert read_outputs(str(dest_dir)) == expected
+
+    # changing the data of one video only converts that video
+    instance = next(lf for lf in slp_synthetic.labeled_frames if lf.video is slp_synthetic.videos[1] and lf.instances).instances[0]
+    instance.points[slp_synthetic.skeletons[0]["Toe"]].x += 1
+    write_slp(slp_synthetic, slp_file)
+    result = runner.invoke(cli, args)
+    assert "1 video(s) unchanged and skipped, 1 video(s) converted" in result.output
+    assert read_outputs(str(dest_dir))["video_0.px.tsv"] == expected["video_0.px.tsv"]
+    assert read_outputs(str(dest_dir))["video_1.px.tsv"] != expected["video_1.px.tsv"]
+
+    # changed parameters, or --force, convert everything
+    result = runner.invoke(cli, args + ["--frame-height", "256"])
+    assert "0 video(s) unchanged and skipped, 2 video(s) converted" in result.output
+    result = runner.invoke(cli, args + ["--frame-height", "256", "--force"])
+    assert "0 video(s) unchanged and skipped, 2 video(s) converted" in result.output
+
+
+@pytest.mark.parametrize("mode_args", [[], ["--streaming"]])
+def test_slp_to_csv_metrics(tmp_path, slp_synthetic_file: str, mode_args: List[str]):
+    """Test --metrics-file and --cprofile-dir save the metrics of each stage and video."""
+    metrics_file = str(tmp_path / "metrics.json")
+    cprofile_dir = tmp_path / "prof"
+    args = ["slp-to-csv", slp_synthetic_file, "--no-plot", "--dest-dir", str(tmp_path / "out"), "--profile"]
+    result = CliRunner().invoke(cli, args + ["--metrics-file", metrics_file, "--cprofile-dir", str(cprofile_dir)] + mode_args)
+    assert result.exit_code == 0, result.output
+    assert "peak RSS" in result.output
+
+    with open(metrics_file) as f:
+        metrics = json.load(f)
+    assert {"calibrate", "invert_y", "convert_units", "write"} <= set(metrics["totals"].keys())
+    assert {s["video"] for s in metrics["stages"] if s["stage"] == "write"} >= {"/data/video_0.mp4", "/data/video_1.mp4"}
+    assert metrics["totals"]["write"]["bytes_written"] > 0
+    assert "write.video_0.prof" in os.listdir(cprofile_dir)
+
+
+@pytest.mark.parametrize("mode_args", [[], ["--streaming", "--chunk-size", "16"]])
+def test_slp_to_csv_store(tmp_path, slp_synthetic_file: str, mode_args: List[str]):
+    """Test --store saves coordinate stores holding the same data as the per-video files, readable by plot-trace."""
+    dest_dir = tmp_path / "out"
+    runner = CliRunner()
+    result = runner.invoke(cli, ["slp-to-csv", slp_synthetic_file, "--store", "--no-plot", "--dest-dir", str(dest_dir)] + mode_args)
+    assert result.exit_code == 0, result.output
+
+    for suffix in ["px", "mm"]:
+        store = CoordinateStore(str(dest_dir / f"synthetic.{suffix}.coords"))
+        assert store.units == suffix
+        for video in store.videos:
+            expected = read_dataframe(str(dest_dir / f"{os.path.splitext(os.path.basename(video))[0]}.{suffix}.tsv"))
+            frame_idx, coords = store.select(video)
+            np.testing.assert_array_equal(frame_idx, expected.index.get_level_values("frame_idx"))
+            np.testing.assert_allclose(coords.reshape(len(frame_idx), -1), expected.to_numpy(), rtol=1e-6)
+
+    # a missing store is rebuilt, even when every video is unchanged
+    os.remove(dest_dir / "synthetic.mm.coords")
+    result = runner.invoke(cli, ["slp-to-csv", slp_synthetic_file, "--store", "--no-plot", "--dest-dir", str(dest_dir)] + mode_args)
+    assert "2 video(s) unchanged and skipped" in result.output
+    assert os.path.exists(dest_dir / "synthetic.mm.coords")
+
+    result = runner.invoke(cli, ["plot-trace", str(dest_dir / "synthetic.px.coords"), "--dest-dir", str(tmp_path / "plots")])
+    assert result.exit_code == 0, result.output
+    assert sorted(os.listdir(tmp_path / "plots")) == [f"video_{i}.mp4_[Toe]_ycord_vs_time.px.png" for i in range(2)]
+
+    result = runner.invoke(cli, ["slp-to-csv", slp_synthetic_file, "--store", "--instance-policy", "all", "--dest-dir", str(dest_dir)])
+    assert result.exit_code == 2
+    assert "one row per frame" in result.output
+
+
+def test_overview(tmp_path, slp_synthetic_file: str):
+    """Test --overview plots every video to a single file when streaming, and plot-trace plots overviews of saved files."""
+    dest_dir = tmp_path / "out"
+    args = ["slp-to-csv", slp_synthetic_file, "--no-plot", "--overview", "pdf", "--streaming", "--dest-dir", str(dest_dir)]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert sorted(fn for fn in os.listdir(dest_dir) if "overview" in fn) == ["synthetic.mm.overview.pdf", "synthetic.px.overview.pdf"]
+
+    result = CliRunner().invoke(cli, ["plot-trace", str(dest_dir / "video_0.px.tsv"), "--overview", "grid", "--dest-dir", str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    assert os.path.exists(tmp_path / "video_0.px.overview.png")
+
+
+def test_frame_selection(tmp_path, slp_synthetic_file: str):
+    """Test --videos, --frame-range and --stride only convert and plot the selected videos and frames."""
+    runner = CliRunner()
+    args = ["slp-to-csv", slp_synthetic_file, "--no-plot", "--store", "--dest-dir"]
+    selection = ["--videos", "video_1", "--frame-range", "5:40", "--stride", "3"]
+    result = runner.invoke(cli, args + [str(tmp_path / "all")])
+    assert result.exit_code == 0, result.output
+    for mode_args in [[], ["--pipeline", "--chunk-size", "4"]]:
+        dest_dir = tmp_path / "selected"
+        result = runner.invoke(cli, args + [str(dest_dir), "--force"] + selection + mode_args)
+        assert result.exit_code == 0, result.output
+        assert sorted(fn for fn in os.listdir(dest_dir) if fn.endswith(".tsv")) == [
+            "synthetic.calibration.tsv",
+            "video_1.mm.tsv",
+            "video_1.px.tsv",
+        ]
+        expected = select_frames(read_dataframe(str(tmp_path / "all" / "video_1.px.tsv")), frames=FrameSelection(5, 40, 3))
+        pd.testing.assert_frame_equal(read_dataframe(str(dest_dir / "video_1.px.tsv")), expected)
+        assert CoordinateStore(str(dest_dir / "synthetic.px.coords")).videos == ["/data/video_1.mp4"]
+
+    plots_dir = tmp_path / "plots"
+    result = runner.invoke(cli, ["plot-trace", str(tmp_path / "all" / "synthetic.px.coords"), "--dest-dir", str(plots_dir)] + selection)
+    assert result.exit_code == 0, result.output
+    assert os.listdir(plots_dir) == ["video_1.mp4_[Toe]_ycord_vs_time.px.png"]
+
+    for bad_args in [["--frame-range", "40:5"], ["--frame-range", "5"], ["--stride", "0"]]:
+        result = runner.invoke(cli, args + [str(tmp_path / "bad")] + bad_args)
+        assert result.exit_code == 2, result.output
+    result = runner.invoke(
+        cli, ["plot-trace", str(tmp_path / "all" / "video_0.px.tsv"), "--videos", "video_1", "--dest-dir", str(plots_dir)]
+    )
+    assert result.exit_code == 2, result.output
+
+    # selections matching no frames are rejected before plotting
+    for source in ["video_0.px.tsv", "synthetic.px.coords"]:
+        args = ["plot-trace", str(tmp_path / "all" / source), "--frame-range", "1000:2000", "--dest-dir", str(tmp_path / "empty")]
+        result = runner.invoke(cli, args)
+        assert result.exit_code == 2 and "No frames" in result.output, result.output
+    assert not os.path.exists(tmp_path / "empty")
+
+
+def test_watch(tmp_path, slp_synthetic_file: str):
+    """Test watch --once converts the *.slp files of a directory, and skips them when run again."""
+    args = ["watch", os.path.dirname(slp_synthetic_file), "--once", "--settle-time", "0", "--no-plot", "--dest-dir", str(tmp_path / "out")]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "2 video(s) converted" in result.output
+    assert os.path.exists(tmp_path / "out" / "video_0.px.tsv")
+
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "Converted" not in result.output
+
+
+def test_features(tmp_path, slp_synthetic_file: str):
+    """Test features are extracted from a *.slp file, and from the files written by slp-to-csv."""
+    runner = CliRunner()
+    dest_slp = str(tmp_path / "from_slp.tsv")
+    result = runner.invoke(cli, ["features", slp_synthetic_file, "--calibrate", "--dest-file", dest_slp])
+    assert result.exit_code == 0, result.output
+
+    result = runner.invoke(cli, ["slp-to-csv", slp_synthetic_file, "--calibrate", "--no-plot", "--dest-dir", str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    dest_tsv = str(tmp_path / "from_tsv.tsv")
+    result = runner.invoke(cli, ["features", str(tmp_path / "video_0.mm.tsv"), "--dest-file", dest_tsv])
+    assert result.exit_code == 0, result.output
+
+    with open(dest_slp) as f:
+        from_slp = f.read().splitlines()
+    with open(dest_tsv) as f:
+        from_tsv = f.read().splitlines()
+    assert len(from_slp) == 3
+    assert from_tsv[0] == from_slp[0]
+    assert [float(v) for v in from_tsv[1].split("\t")[1:]] == pytest.approx([float(v) for v in from_slp[1].split("\t")[1:]])
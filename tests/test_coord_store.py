@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from paws_tools.coord_store import CoordinateStore, CoordinateStoreWriter
+from paws_tools.dataframe_io import read_dataframe
+from paws_tools import streaming
+from paws_tools.slp_to_csv import get_nodes_for_bodyparts, node_positions_to_dataframe
+from paws_tools.streaming import save_coordinate_stores
+from tests.fixtures.slp import make_labels
+
+
+@pytest.fixture
+def coords() -> pd.DataFrame:
+    """Coordinates of three nodes of two videos, with some missing points."""
+    labels = make_labels(missing_node_rate=0.1)
+    return node_positions_to_dataframe(labels, get_nodes_for_bodyparts(labels, ["Toe", "Heel", "Top_Box"]))
+
+
+def test_coordinate_store(tmp_path, coords: pd.DataFrame):
+    """Test a store round-trips a coordinate dataframe, and selections are views of the memory-mapped file."""
+    node_names = ["Heel", "Toe", "Top_Box"]
+    dest = str(tmp_path / "labels.px.coords")
+    with CoordinateStoreWriter(dest, node_names, units="px") as writer:
+        writer.append_dataframe(coords)
+
+    store = CoordinateStore(dest)
+    assert store.videos == ["/data/video_0.mp4", "/data/video_1.mp4"]
+    assert store.nodes == node_names
+    assert store.units == "px"
+    assert len(store) == len(coords)
+    expected = coords.loc[:, (node_names, ["x", "y"])].astype(np.float32).astype(np.float64)
+    pd.testing.assert_frame_equal(store.to_dataframe(), expected, check_index_type=False)
+    pd.testing.assert_frame_equal(read_dataframe(dest), expected, check_index_type=False)
+
+    video = "/data/video_1.mp4"
+    frame_idx, values = store.select(video, 20, 50, ["Toe", "Top_Box"])
+    video_coords = expected.loc[video]
+    in_range = video_coords[(video_coords.index >= 20) & (video_coords.index < 50)]
+    np.testing.assert_array_equal(frame_idx, in_range.index.to_numpy())
+    np.testing.assert_array_equal(values, in_range.loc[:, (["Toe", "Top_Box"], ["x", "y"])].to_numpy().reshape(-1, 2, 2))
+    assert np.shares_memory(values, store._coords)
+
+    # nodes which are not consecutive in the store are copied
+    assert store.node_indices(["Top_Box", "Heel"]) == [2, 0]
+    assert store.select(video, nodes=["Top_Box", "Heel"])[1].shape == (len(video_coords), 2, 2)
+    assert len(store.select(video, 1000)[0]) == 0
+    with pytest.raises(KeyError):
+        store.select("/data/missing.mp4")
+
+
+def test_coordinate_store_writer_errors(tmp_path, coords: pd.DataFrame):
+    """Test out-of-order appends are rejected, and an interrupted write leaves any existing store untouched."""
+    dest = str(tmp_path / "labels.coords")
+    video_0 = coords.loc[["/data/video_0.mp4"], [("Toe", "x"), ("Toe", "y")]]
+    with CoordinateStoreWriter(dest, ["Toe"]) as writer:
+        writer.append_dataframe(video_0)
+
+    with pytest.raises(ValueError, match="ascending order"):
+        with CoordinateStoreWriter(dest, ["Toe"]) as writer:
+            writer.append_dataframe(video_0.iloc[::-1])
+    with pytest.raises(ValueError, match="appended together"):
+        with CoordinateStoreWriter(dest, ["Toe"]) as writer:
+            writer.append("a.mp4", np.arange(2), np.zeros((2, 1, 2)))
+            writer.append("b.mp4", np.arange(2), np.zeros((2, 1, 2)))
+            writer.append("a.mp4", np.arange(2, 4), np.zeros((2, 1, 2)))
+
+    assert os.listdir(tmp_path) == ["labels.coords"]
+    assert CoordinateStore(dest).videos == ["/data/video_0.mp4"]
+
+
+def test_save_coordinate_stores_writer_error(tmp_path, monkeypatch, slp_synthetic_file: str):
+    """Test the temporary files of stores already created are removed when creating another store fails."""
+
+    def make_writer(dest, node_names, units=None):
+        if units == "mm":
+            raise OSError("No space left on device")
+        return CoordinateStoreWriter(dest, node_names, units)
+
+    monkeypatch.setattr(streaming, "CoordinateStoreWriter", make_writer)
+    dest_dir = tmp_path / "stores"
+    with pytest.raises(OSError):
+        save_coordinate_stores(slp_synthetic_file, ["Toe"], str(dest_dir), 512, conv_factors={})
+    assert os.listdir(dest_dir) == []
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from paws_tools.constants import Compression, DataFrameFormat, InstancePolicy
+from paws_tools.dataframe_io import (
+    COMPRESSION_EXTENSIONS,
+    COMPRESSIONS,
+    FORMATS,
+    DataFrameWriter,
+    open_text,
+    read_dataframe,
+    write_dataframe,
+)
+from paws_tools.slp_to_csv import get_nodes_for_bodyparts, node_positions_to_dataframe
+from tests.fixtures.slp import make_labels
+
+
+@pytest.mark.parametrize("instance_policy", ["first", "track", "all"])
+@pytest.mark.parametrize("format", FORMATS)
+def test_dataframe_round_trip(tmp_path, format: DataFrameFormat, instance_policy: InstancePolicy):
+    """Test dataframes survive a write/read round trip in every format, including chunked writes and extra index levels."""
+    if format in ["parquet", "feather"]:
+        pytest.importorskip("pyarrow")
+
+    labels = make_labels(n_instances=2, n_tracks=2)
+    df = node_positions_to_dataframe(labels, get_nodes_for_bodyparts(labels, ["Toe", "Heel"]), instance_policy)
+    df = df.loc[[df.index.get_level_values("video")[0]]]
+
+    dest = str(tmp_path / f"coords.{format}")
+    write_dataframe(df, dest)
+    actual = read_dataframe(dest)
+    # text formats do not round-trip floats exactly
+    pd.testing.assert_frame_equal(actual, df, check_exact=format not in ["tsv", "csv"])
+
+    dest = str(tmp_path / f"chunked.{format}")
+    with DataFrameWriter(dest, format) as writer:
+        for start in range(0, len(df), 30):
+            writer.write(df.iloc[start : start + 30])
+    assert writer.rows_written == len(df)
+    pd.testing.assert_frame_equal(read_dataframe(dest), actual)
+
+
+def test_read_dataframe_unknown_format(tmp_path):
+    """Test reading a file with an unsupported extension raises a helpful error."""
+    with pytest.raises(ValueError, match="Unable to determine format"):
+        read_dataframe(str(tmp_path / "coords.xlsx"))
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_compressed_round_trip(tmp_path, compression: Compression):
+    """Test compressed text files, written as many blocks, decompress to the same text as uncompressed files."""
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+
+    labels = make_labels(n_videos=1)
+    df = node_positions_to_dataframe(labels, get_nodes_for_bodyparts(labels, ["Toe", "Heel"]))
+    plain = str(tmp_path / "coords.tsv")
+    write_dataframe(df, plain)
+
+    dest = str(tmp_path / f"coords.tsv.{COMPRESSION_EXTENSIONS[compression]}")
+    with DataFrameWriter(dest, "tsv", compression, block_rows=7, compression_threads=2) as writer:
+        for start in range(0, len(df), 30):
+            writer.write(df.iloc[start : start + 30])
+
+    with open_text(dest) as f, open(plain) as g:
+        assert f.read() == g.read()
+    pd.testing.assert_frame_equal(read_dataframe(dest), read_dataframe(plain))
+    assert os.path.getsize(dest) < os.path.getsize(plain)
+
+
+def test_atomic_write(tmp_path):
+    """Test an interrupted write leaves neither a partial file nor a temporary file, and keeps any existing file."""
+    df = pd.DataFrame(
+        {("Toe", "x"): np.arange(10.0)}, index=pd.MultiIndex.from_product([["a.mp4"], range(10)], names=["video", "frame_idx"])
+    )
+    dest = str(tmp_path / "coords.tsv.gz")
+    write_dataframe(df, dest)
+    expected = read_dataframe(dest)
+
+    with pytest.raises(RuntimeError):
+        with DataFrameWriter(dest, "tsv", "gzip") as writer:
+            writer.write(df.iloc[:5] * 2)
+            raise RuntimeError("interrupted")
+    assert os.listdir(tmp_path) == ["coords.tsv.gz"]
+    pd.testing.assert_frame_equal(read_dataframe(dest), expected)
+
+    with pytest.raises(ValueError, match="Compression is only supported"):
+        DataFrameWriter(str(tmp_path / "coords.npz"), "npz", "gzip")
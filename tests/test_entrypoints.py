@@ -1,6 +1,8 @@
 import os
 import pkgutil
 import subprocess
+import sys
+import time
 from importlib import import_module
 from pathlib import Path
 from typing import List
@@ -39,3 +41,31 @@ def test_entry_point(entry_point):
 def test_import(module_path):
     import_module(module_path)
     assert True
+
+
+# Modules which are slow to import, and should only be imported by the commands which need them
+HEAVY_MODULES = ["h5py", "matplotlib", "numpy", "pandas", "PIL", "seaborn", "sleap_io"]
+
+
+def test_cli_startup():
+    """Test the CLI starts quickly, without importing heavy modules."""
+    code = "import sys; n = len(sys.modules); import paws_tools.cli; print(len(sys.modules) - n); print(' '.join(sys.modules))"
+    count, modules = subprocess.check_output([sys.executable, "-c", code], text=True).splitlines()
+    assert int(count) < 100
+    assert [m for m in HEAVY_MODULES if m in modules.split()] == []
+
+    start = time.perf_counter()
+    subprocess.check_call(["paws-tools", "--help"], stdout=subprocess.DEVNULL)
+    assert time.perf_counter() - start < 2.0
+
+
+def test_no_plot_skips_plotting_imports(tmp_path, slp_synthetic_file: str):
+    """Test plotting libraries are not imported when converting without plots."""
+    code = (
+        "import sys; from paws_tools.cli import cli; "
+        f"cli(['slp-to-csv', {slp_synthetic_file!r}, '--no-plot', '--dest-dir', {str(tmp_path)!r}], standalone_mode=False); "
+        "print(' '.join(sys.modules))"
+    )
+    modules = subprocess.check_output([sys.executable, "-c", code], text=True, stderr=subprocess.DEVNULL).splitlines()[-1].split()
+    assert "pandas" in modules
+    assert [m for m in ["matplotlib", "seaborn", "PIL"] if m in modules] == []
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.interpolate import CubicSpline
+
+from paws_tools.features import FeatureParameters, extract_features, fill_gaps
+
+
+def make_trajectory(n_frames: int = 2000, fps: float = 4000.0, height: float = 10.0, shake_hz: float = 40.0) -> np.ndarray:
+    """Build a paw trajectory which rises to `height` in 50ms, then shakes for 200ms at `shake_hz`.
+
+    Returns:
+        array of shape (frames, 2) holding x and y coordinates
+    """
+    t = np.arange(n_frames) / fps
+    y = np.where(t < 0.05, height * np.sin(np.pi / 2 * t / 0.05), height)
+    y += np.where((t > 0.15) & (t < 0.35), 0.1 * height * np.sin(2 * np.pi * shake_hz * (t - 0.15)), 0.0)
+    x = np.where(t < 0.05, 5 * t / 0.05, 5.0)
+    return np.stack([x, y], axis=1)
+
+
+def make_dataframe(trajectories: dict) -> pd.DataFrame:
+    """Build a coordinate dataframe of the "Toe" node from per-video trajectories."""
+    dfs = []
+    for video, xy in trajectories.items():
+        index = pd.MultiIndex.from_product([[video], range(len(xy))], names=["video", "frame_idx"])
+        dfs.append(pd.DataFrame(xy, index=index, columns=pd.MultiIndex.from_product([["Toe"], ["x", "y"]])))
+    return pd.concat(dfs)
+
+
+def test_fill_gaps():
+    """Test interior gaps are filled by a cubic spline and leading/trailing gaps with the nearest value."""
+    values = np.array([np.nan, 1.0, 4.0, np.nan, 16.0, np.nan, 36.0, np.nan])
+    filled = fill_gaps(values)
+
+    valid = np.isfinite(values)
+    spline = CubicSpline(np.flatnonzero(valid), values[valid])
+    np.testing.assert_allclose(filled[[3, 5]], spline([3, 5]))
+    assert filled[0] == 1.0 and filled[-1] == 36.0
+    assert np.isnan(fill_gaps(np.full(3, np.nan))).all()
+
+
+def test_extract_features():
+    """Test features of a synthetic trajectory, and that trials of different lengths are handled independently."""
+    trajectory = make_trajectory()
+    gappy = trajectory.copy()
+    gappy[300:340] = np.nan
+    df = make_dataframe({"a.mp4": trajectory, "b.mp4": trajectory[:1500], "c.mp4": np.full((100, 2), np.nan), "d.mp4": gappy})
+
+    features = extract_features(df, "Toe", FeatureParameters(fps=4000))
+
+    assert features.index.tolist() == ["a.mp4", "b.mp4", "c.mp4", "d.mp4"]
+    assert features["frames"].tolist() == [2000, 1500, 100, 2000]
+    assert features.loc["a.mp4", "peak_time"] == pytest.approx(0.05, abs=0.01)
+    assert features.loc["a.mp4", "pre_peak_max_height"] == pytest.approx(10.0, rel=0.02)
+    assert features.loc["a.mp4", "pre_peak_max_x_velocity"] == pytest.approx(100.0, rel=0.05)
+    # 8 shakes in 200ms, the shake filter may miss the one at either end
+    assert 6 <= features.loc["a.mp4", "post_peak_number_of_shakes"] <= 8
+    assert features.loc["a.mp4", "post_peak_shaking_duration"] == pytest.approx(0.175, abs=0.03)
+
+    # a shorter trial, up to the end of the shaking, has the same pre-peak features
+    pre_peak = [c for c in features.columns if c.startswith("pre_peak")]
+    pd.testing.assert_series_equal(features.loc["b.mp4", pre_peak], features.loc["a.mp4", pre_peak], check_names=False, rtol=1e-3)
+
+    # gaps are filled, videos without any coordinates have no features
+    assert features.loc["d.mp4"].notna().all()
+    assert features.loc["c.mp4"].drop("frames").isna().all()
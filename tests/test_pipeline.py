@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from typing import Any, Dict
+
+import pandas as pd
+import pytest
+
+from paws_tools.dataframe_io import DataFrameWriter, read_dataframe
+from paws_tools.pipeline import BackgroundConsumer, Prefetcher
+from paws_tools.slp_to_csv import stream_slp_to_csv
+
+
+def test_prefetcher():
+    """Test items are read ahead in order, at most `depth` ahead, and errors are re-raised in the consumer."""
+    read = []
+
+    def items():
+        for i in range(10):
+            read.append(i)
+            yield i
+
+    with Prefetcher(items(), depth=2) as prefetcher:
+        iterator = iter(prefetcher)
+        assert next(iterator) == 0
+        time.sleep(0.2)
+        # one item being consumed, two queued and one waiting to be queued
+        assert len(read) <= 4
+        assert list(iterator) == list(range(1, 10))
+
+    def failing():
+        yield 1
+        raise ValueError("bad chunk")
+
+    with pytest.raises(ValueError, match="bad chunk"), Prefetcher(failing()) as prefetcher:
+        assert list(prefetcher) == [1]
+
+    # stopping early stops the background thread
+    with Prefetcher(iter(range(1000)), depth=1) as prefetcher:
+        next(iter(prefetcher))
+    assert not any(t.name == "paws-tools-prefetch" for t in threading.enumerate())
+
+
+def test_background_consumer():
+    """Test items are processed in order, put blocks while the queue is full, and errors are re-raised by the producer."""
+    processed = []
+    release = threading.Event()
+
+    def slow(item: int):
+        release.wait()
+        processed.append(item)
+
+    with BackgroundConsumer(slow, depth=1) as consumer:
+        consumer.put(0)
+        consumer.put(1)
+        blocked = threading.Thread(target=consumer.put, args=(2,))
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+        release.set()
+        blocked.join()
+    assert processed == [0, 1, 2]
+
+    def failing(item: int):
+        if item == 1:
+            raise ValueError("bad chunk")
+
+    with pytest.raises(ValueError, match="bad chunk"), BackgroundConsumer(failing, depth=1) as consumer:
+        for i in range(100):
+            consumer.put(i)
+
+
+def test_stream_pipelined(tmp_path, slp_synthetic_file: str, monkeypatch):
+    """Test pipelined conversions save the same files and plots, and leave no partial files when a stage fails."""
+    kwargs: Dict[str, Any] = dict(calibration=("Top_Box", "Bot_Box", 1.0), chunk_size=16, plot=True)
+    expected = stream_slp_to_csv(slp_synthetic_file, ["Toe"], str(tmp_path / "serial"), 512, **kwargs)
+    actual = stream_slp_to_csv(slp_synthetic_file, ["Toe"], str(tmp_path / "pipelined"), 512, pipeline_depth=1, **kwargs)
+    assert {suffix: [os.path.basename(fn) for fn in files] for suffix, files in actual.items()} == {
+        suffix: [os.path.basename(fn) for fn in files] for suffix, files in expected.items()
+    }
+    assert sorted(os.listdir(tmp_path / "pipelined")) == sorted(os.listdir(tmp_path / "serial"))
+    for fn in expected["px"] + expected["mm"]:
+        pd.testing.assert_frame_equal(read_dataframe(fn.replace("serial", "pipelined")), read_dataframe(fn))
+
+    def failing_write(self, df):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(DataFrameWriter, "write", failing_write)
+    with pytest.raises(OSError, match="disk full"):
+        stream_slp_to_csv(slp_synthetic_file, ["Toe"], str(tmp_path / "failed"), 512, pipeline_depth=1, **kwargs)
+    assert not any(fn.endswith(".tmp") for fn in os.listdir(tmp_path / "failed"))
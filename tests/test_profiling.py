@@ -0,0 +1,51 @@
+import json
+import os
+import pickle
+
+from paws_tools.profiling import Metrics, stage
+
+
+def test_stage():
+    """Test repeated stages are accumulated per stage and video, and summed over videos in the totals."""
+    metrics = Metrics()
+    for video in ["a.mp4", "a.mp4", "b.mp4"]:
+        with metrics.stage("write", video, frames=10) as counters:
+            counters["bytes_written"] = 100
+    with stage(metrics, "open"):
+        pass
+    with stage(None, "open", frames=5) as counters:
+        assert counters == {"frames": 5, "bytes_written": 0}
+
+    assert metrics.records[("write", "a.mp4")]["calls"] == 2
+    assert metrics.records[("write", "a.mp4")]["frames"] == 20
+    assert metrics.records[("write", "b.mp4")]["bytes_written"] == 100
+
+    summary = metrics.to_dict()
+    assert [(s["stage"], s["video"]) for s in summary["stages"]] == [("write", "a.mp4"), ("write", "b.mp4"), ("open", None)]
+    assert list(summary["totals"].keys()) == ["write", "open"]
+    assert summary["totals"]["write"]["calls"] == 3
+    assert summary["totals"]["write"]["bytes_written"] == 300
+    assert "write" in metrics.report()
+
+
+def test_merge_and_pickle(tmp_path):
+    """Test metrics survive pickling (as when returned by a worker process) and merge into existing metrics."""
+    metrics = Metrics(str(tmp_path / "prof"))
+    worker = Metrics(str(tmp_path / "prof"))
+    with metrics.stage("read", "a.mp4", frames=10):
+        pass
+    with worker.stage("read", "a.mp4", frames=5):
+        pass
+    with worker.stage("plot", "a.mp4"):
+        pass
+
+    assert not os.path.exists(worker.cprofile_dir)
+    assert sorted(os.path.basename(fn) for fn in worker.dump_profiles()) == ["plot.a.prof", "read.a.prof"]
+    metrics.merge(pickle.loads(pickle.dumps(worker)))
+    assert metrics.records[("read", "a.mp4")]["calls"] == 2
+    assert metrics.records[("read", "a.mp4")]["frames"] == 15
+    assert metrics.records[("plot", "a.mp4")]["calls"] == 1
+
+    metrics.write(str(tmp_path / "metrics.json"))
+    with open(tmp_path / "metrics.json") as f:
+        assert json.load(f)["totals"]["read"]["frames"] == 15
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sleap_io import Labels, Skeleton, Video
+
+from paws_tools.dataframe_io import read_dataframe
+from paws_tools.skeleton_index import SkeletonIndex
+from paws_tools.slp_reader import SlpReader, read_skeletons
+from paws_tools.slp_to_csv import (
+    convert_slp_file,
+    get_nodes_for_bodyparts,
+    instances_to_dataframe,
+    invert_y_axis,
+    node_positions_to_dataframe,
+    select_nodes,
+)
+from tests.fixtures.slp import make_labels, write_slp
+
+
+def make_two_skeleton_labels() -> Labels:
+    """Make labels whose videos are predicted with two skeletons, which share some nodes in a different order."""
+    paw = make_labels(n_frames=30, node_names=("Toe", "Heel", "Top_Box", "Bot_Box"), missing_node_rate=0.1)
+    head = make_labels(n_frames=30, node_names=("Heel", "Nose", "Toe"), seed=1)
+    for i, video in enumerate(head.videos):
+        # give the videos of the second skeleton their own filenames
+        renamed = Video(filename=f"/data/head_{i}.mp4")
+        for frame in head.labeled_frames:
+            if frame.video is video:
+                frame.video = renamed
+        head.videos[i] = renamed
+    return Labels(
+        labeled_frames=paw.labeled_frames + head.labeled_frames, videos=paw.videos + head.videos, skeletons=paw.skeletons + head.skeletons
+    )
+
+
+def test_resolve():
+    """Test body-part names and patterns resolve to ordered, unique node names over all skeletons."""
+    index = SkeletonIndex([Skeleton(nodes=["Toe", "Heel", "Top_Box", "Bot_Box"]), Skeleton(nodes=["Heel", "Nose", "Toe_2"])])
+    assert index.node_names == ["Toe", "Heel", "Top_Box", "Bot_Box", "Nose", "Toe_2"]
+    assert "Nose" in index and len(index) == 6 and index.index("Nose") == 4
+
+    assert index.resolve("Heel") == ["Heel"]
+    assert index.resolve(["Nose", "Toe*"]) == ["Nose", "Toe", "Toe_2"]
+    assert index.resolve(["*_Box", "Top_Box", "re:(Heel|Nose)"]) == ["Top_Box", "Bot_Box", "Heel", "Nose"]
+    assert index.resolve(["Heel", "all"]) == ["Heel", "Toe", "Top_Box", "Bot_Box", "Nose", "Toe_2"]
+    for body_part in ["Tail", "Tail*", "re:T", "re:("]:
+        with pytest.raises(KeyError):
+            index.resolve(body_part)
+
+    columns = index.columns(["Toe", "Heel", "Nose"])
+    np.testing.assert_array_equal(columns, [[0, 1, -1], [-1, 0, 1]])
+    assert index.columns(["Toe", "Heel", "Nose"]) is columns
+    assert index.skeleton_nodes(["Nose", "Heel"], 1) == index.skeletons[1].nodes[1::-1]
+    assert index.skeleton_nodes(["Nose"], 0) == [None]
+
+
+def test_get_nodes_for_bodyparts_order(slp_synthetic: Labels):
+    """Test nodes are returned in the order of the body-parts, and selections are sorted by name."""
+    assert [n.name for n in get_nodes_for_bodyparts(slp_synthetic, ["Top_Box", "*_Box", "Toe"])] == ["Top_Box", "Bot_Box", "Toe"]
+    assert [n.name for n in select_nodes(slp_synthetic, ["all"], ["re:.*_Box"])] == ["Heel", "Toe"]
+
+
+def test_multiple_skeletons(tmp_path):
+    """Test nodes are extracted from the instances of every skeleton, the same as when streaming."""
+    labels = make_two_skeleton_labels()
+    node_names = ["Toe", "Heel", "Nose"]
+    df = node_positions_to_dataframe(labels, node_names)
+
+    # each skeleton's nodes are read by name, nodes missing from a skeleton are NaN
+    assert df.loc["/data/video_0.mp4", "Nose"].isna().all().all()
+    assert not df.loc["/data/head_0.mp4", "Nose"].isna().all().all()
+    frame = next(f for f in labels.labeled_frames if f.video.filename == "/data/head_1.mp4" and len(f.instances) > 0)
+    expected = frame.instances[0].numpy()[[2, 0, 1]]
+    np.testing.assert_array_equal(df.loc[("/data/head_1.mp4", frame.frame_idx)].to_numpy().reshape(-1, 2), expected)
+
+    slp_file = write_slp(labels, str(tmp_path / "two_skeletons.slp"))
+    assert [s.node_names for s in read_skeletons(slp_file)] == [s.node_names for s in labels.skeletons]
+    with SlpReader(slp_file) as reader:
+        chunks = []
+        for video in reader.videos:
+            for positions in reader.iter_instances(video, node_names, chunk_size=7, scores=False):
+                video_ids = np.zeros(len(positions.frame_inds), dtype=int)
+                chunks.append(instances_to_dataframe([video], video_ids, positions, node_names, "first", reader.tracks))
+    pd.testing.assert_frame_equal(pd.concat(chunks), df)
+
+
+def test_convert_multiple_skeletons(tmp_path):
+    """Test files holding several skeletons convert by default, the same as when streaming and as from the labels."""
+    labels = make_two_skeleton_labels()
+    slp_file = write_slp(labels, str(tmp_path / "two_skeletons.slp"))
+    kwargs = dict(body_parts=["Toe", "Nose"], ignore_body_parts=[], frame_height=512, plot=False)
+    convert_slp_file(slp_file, str(tmp_path / "default"), **kwargs)
+    convert_slp_file(slp_file, str(tmp_path / "streaming"), streaming=True, chunk_size=7, **kwargs)
+
+    expected = invert_y_axis(node_positions_to_dataframe(labels, ["Toe", "Nose"]), 512)
+    for video in ["video_0", "video_1", "head_0", "head_1"]:
+        df = read_dataframe(str(tmp_path / "default" / f"{video}.px.tsv"))
+        pd.testing.assert_frame_equal(df, read_dataframe(str(tmp_path / "streaming" / f"{video}.px.tsv")))
+        np.testing.assert_allclose(df.to_numpy(), expected.loc[[f"/data/{video}.mp4"], df.columns].to_numpy(), rtol=1e-6)
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+import sleap_io
+
+from paws_tools.constants import InstancePolicy
+from paws_tools.slp_reader import FrameSelection, SlpReader, read_video_filenames, select_instances, select_videos
+from paws_tools.slp_to_csv import (
+    coords_to_dataframe,
+    get_nodes_for_bodyparts,
+    instances_to_dataframe,
+    node_positions_to_dataframe,
+    select_frames,
+)
+from tests.fixtures.slp import make_labels, write_slp
+
+
+def test_read_video_filenames(slp_synthetic_file: str):
+    """Test reading video filenames matches `sleap_io.load_slp()`."""
+    labels = sleap_io.load_slp(slp_synthetic_file)
+    assert read_video_filenames(slp_synthetic_file) == [video.filename for video in labels.videos]
+
+
+def test_iter_positions(slp_synthetic_file: str):
+    """Test streamed coordinates match those extracted from the fully loaded labels."""
+    labels = sleap_io.load_slp(slp_synthetic_file)
+    nodes = get_nodes_for_bodyparts(labels, ["Toe", "Heel"])
+    node_names = [n.name for n in nodes]
+    expected = node_positions_to_dataframe(labels, nodes)
+
+    with SlpReader(slp_synthetic_file) as reader:
+        chunks = []
+        for video in reader.videos:
+            # use a small chunk size to exercise chunk boundaries
+            for frame_inds, coords in reader.iter_positions(video, node_names, chunk_size=7):
+                assert np.all(np.diff(frame_inds) > 0)
+                chunks.append(coords_to_dataframe([video], np.zeros(len(frame_inds), dtype=int), frame_inds, coords, node_names))
+
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+
+def test_select_instances():
+    """Test each instance policy selects the expected instances."""
+    # frame 0: two untracked instances, frame 1: none, frame 2: three instances over two tracks, one with a NaN score
+    inst_frame = np.array([0, 0, 2, 2, 2])
+    inst_score = np.array([0.2, 0.9, np.nan, 0.5, 0.7])
+    inst_track = np.array([-1, -1, 1, 0, 1])
+
+    def select(policy):
+        return [a.tolist() for a in select_instances(inst_frame, inst_score, inst_track, 3, policy)]
+
+    assert select("first") == [[0, 1, 2], [0, -1, 2], [0, 0, 0]]
+    assert select("best") == [[0, 1, 2], [1, -1, 4], [0, 0, 0]]
+    assert select("track") == [[2, 2], [3, 4], [0, 1]]
+    assert select("all") == [[0, 0, 2, 2, 2], [0, 1, 2, 3, 4], [0, 1, 0, 1, 2]]
+
+
+@pytest.mark.parametrize("instance_policy", ["first", "best", "track", "all"])
+def test_iter_instances(tmp_path, instance_policy: InstancePolicy):
+    """Test streamed instances match those extracted from the fully loaded labels, for each instance policy."""
+    slp_file = write_slp(make_labels(n_instances=3, n_tracks=2), str(tmp_path / "multi.slp"))
+    labels = sleap_io.load_slp(slp_file)
+    nodes = get_nodes_for_bodyparts(labels, ["Toe", "Heel"])
+    node_names = [n.name for n in nodes]
+    expected = node_positions_to_dataframe(labels, nodes, instance_policy)
+
+    with SlpReader(slp_file) as reader:
+        chunks = []
+        for video in reader.videos:
+            for positions in reader.iter_instances(video, node_names, instance_policy, chunk_size=7, scores=instance_policy != "first"):
+                video_ids = np.zeros(len(positions.frame_inds), dtype=int)
+                chunks.append(instances_to_dataframe([video], video_ids, positions, node_names, instance_policy, reader.tracks))
+        # the whole file gathered at once from the arrays of the file matches too
+        pd.testing.assert_frame_equal(node_positions_to_dataframe(reader, node_names, instance_policy), expected)
+
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+
+def test_frame_selection():
+    """Test frames are selected by range and stride of frame index, and videos by filename, basename or pattern."""
+    frame_inds = np.arange(20)
+    np.testing.assert_array_equal(frame_inds[FrameSelection(start=5, stop=15, stride=3).mask(frame_inds)], [5, 8, 11, 14])
+    np.testing.assert_array_equal(frame_inds[FrameSelection(stop=4).mask(frame_inds)], [0, 1, 2, 3])
+    assert FrameSelection(start=2, stride=2).contains(6) and not FrameSelection(start=2, stride=2).contains(5)
+    assert not FrameSelection().enabled
+    for bad in [dict(start=-1), dict(start=5, stop=5), dict(stride=0)]:
+        with pytest.raises(ValueError):
+            FrameSelection(**bad)
+
+    videos = ["/data/video_0.mp4", "/data/video_1.mp4", "/data/other.mp4"]
+    assert select_videos(videos, ["video_1"]) == ["/data/video_1.mp4"]
+    assert select_videos(videos, ["other.mp4", "video_*"]) == videos
+    assert select_videos(videos, ["/data/video_0.mp4"]) == ["/data/video_0.mp4"]
+    with pytest.raises(KeyError):
+        select_videos(videos, ["video_2"])
+
+
+@pytest.mark.parametrize("instance_policy", ["first", "all"])
+def test_iter_instances_frame_selection(slp_synthetic_file: str, instance_policy: InstancePolicy):
+    """Test selected videos and frames are read without reading the rest, matching a selection of all the data."""
+    labels = sleap_io.load_slp(slp_synthetic_file)
+    node_names = ["Toe", "Heel"]
+    frames = FrameSelection(start=5, stop=40, stride=3)
+    expected = select_frames(node_positions_to_dataframe(labels, node_names, instance_policy), ["/data/video_1.mp4"], frames)
+    assert len(expected) > 0 and set(expected.index.get_level_values("frame_idx")) <= set(range(5, 40, 3))
+    df = node_positions_to_dataframe(labels, node_names, instance_policy, videos=["/data/video_1.mp4"], frames=frames)
+    pd.testing.assert_frame_equal(df, expected)
+
+    with SlpReader(slp_synthetic_file) as reader:
+        chunks = []
+        scores = instance_policy != "first"
+        for positions in reader.iter_instances(
+            "/data/video_1.mp4", node_names, instance_policy, chunk_size=4, scores=scores, frames=frames
+        ):
+            video_ids = np.zeros(len(positions.frame_inds), dtype=int)
+            chunks.append(instances_to_dataframe(["/data/video_1.mp4"], video_ids, positions, node_names, instance_policy, reader.tracks))
+        df = node_positions_to_dataframe(reader, node_names, instance_policy, videos=["/data/video_1.mp4"], frames=frames)
+        pd.testing.assert_frame_equal(df, expected)
+        assert len(node_positions_to_dataframe(reader, node_names, instance_policy, videos=[])) == 0
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
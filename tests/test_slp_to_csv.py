@@ -1,5 +1,28 @@
-from sleap_io import Labels
-from paws_tools.slp_to_csv import get_nodes_for_bodyparts
+import os
+import re
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pytest
+from sleap_io import Labels, Node
+
+from paws_tools.constants import Interpolation, OverviewLayout
+from paws_tools.features import fill_gaps
+
+from paws_tools.slp_to_csv import (
+    compute_conversion_factors,
+    convert_physical_units,
+    PostProcessing,
+    decimate_trace,
+    fill_and_smooth,
+    get_nodes_for_bodyparts,
+    invert_y_axis,
+    node_positions_to_dataframe,
+    plot_bodyparts_y_pos_over_time,
+    plot_grouped_bodyparts_y_pos_over_time,
+    plot_overview,
+)
 
 
 def assert_lists_equal_ignore_order(actual: list, expected: list):
@@ -33,23 +56,235 @@ def assert_lists_equal_ignore_order(actual: list, expected: list):
     assert not message
 
 
-# def test_get_nodes_for_bodyparts(slp_typical: Labels):
-#     """Test getting the nodes given some bodyparts."""
+def test_get_nodes_for_bodyparts(slp_typical: Labels):
+    """Test getting the nodes given some bodyparts."""
+
+    # test getting a single bodypart
+    nodes = get_nodes_for_bodyparts(slp_typical, slp_typical.skeletons[0].nodes[0].name)
+    expected_nodes = [slp_typical.skeletons[0].nodes[0]]
+    assert len(nodes) == len(expected_nodes)
+    assert_lists_equal_ignore_order(nodes, expected_nodes)
+
+    # test getting all bodyparts explicitly
+    nodes = get_nodes_for_bodyparts(slp_typical, slp_typical.skeletons[0].node_names)
+    expected_nodes = slp_typical.skeletons[0].nodes
+    assert len(nodes) == len(expected_nodes)
+    assert_lists_equal_ignore_order(nodes, expected_nodes)
+
+    # test getting all bodyparts via special `all` value
+    nodes = get_nodes_for_bodyparts(slp_typical, "all")
+    expected_nodes = slp_typical.skeletons[0].nodes
+    assert len(nodes) == len(expected_nodes)
+    assert_lists_equal_ignore_order(nodes, expected_nodes)
+
+
+def legacy_node_positions_to_dataframe(labels: Labels, nodes: List[Node]) -> pd.DataFrame:
+    """Reference implementation of `node_positions_to_dataframe()`, building one dict per frame."""
+    data = []
+    for frame in labels.labeled_frames:
+        row: Dict[Union[str, Tuple[str, str]], Any] = {"video": frame.video.filename, "frame_idx": frame.frame_idx}
+        for node in nodes:
+            if (len(frame.predicted_instances) <= 0) or (node not in frame.predicted_instances[0].points):
+                row[(node.name, "x")] = np.nan
+                row[(node.name, "y")] = np.nan
+            else:
+                row[(node.name, "x")] = frame.predicted_instances[0].points[node].x
+                row[(node.name, "y")] = frame.predicted_instances[0].points[node].y
+        data.append(row)
+
+    df = pd.DataFrame(data)
+    df = df.sort_values(["video", "frame_idx"])
+    df = df.set_index(["video", "frame_idx"])
+    df.columns = pd.MultiIndex.from_product([[n.name for n in nodes], ["x", "y"]])
+    return df
+
+
+@pytest.mark.parametrize("labels_fixture", ["slp_synthetic", "slp_typical"])
+def test_node_positions_to_dataframe(request, labels_fixture: str):
+    """Test the array-backed extraction matches the reference per-frame implementation."""
+    labels = request.getfixturevalue(labels_fixture)
+    nodes = [labels.skeletons[0]["Toe"], labels.skeletons[0]["Heel"]]
+
+    actual = node_positions_to_dataframe(labels, nodes)
+    expected = legacy_node_positions_to_dataframe(labels, nodes)
+
+    assert actual.index.names == ["video", "frame_idx"]
+    assert list(actual.columns) == [("Toe", "x"), ("Toe", "y"), ("Heel", "x"), ("Heel", "y")]
+    assert actual.isna().any(axis=None)  # frames without predictions should be present as NaNs
+    # the reference keeps frame indices of loaded files as uint64, rather than int64
+    pd.testing.assert_frame_equal(actual, expected, check_index_type=False)
+
+
+def make_coords_dataframe() -> pd.DataFrame:
+    """Build a small coordinate dataframe with two videos, a body part and two calibration nodes."""
+    index = pd.MultiIndex.from_product([["a.mp4", "b.mp4"], [0, 1, 2]], names=["video", "frame_idx"])
+    columns = pd.MultiIndex.from_product([["Toe", "Top_Box", "Bot_Box"], ["x", "y"]])
+    values = np.array(
+        [
+            # video a.mp4: calibration nodes are 10px apart
+            [1.0, 2.0, 0.0, 20.0, 0.0, 10.0],
+            [3.0, 4.0, 0.0, 20.0, 0.0, 10.0],
+            [5.0, np.nan, 0.0, np.nan, 0.0, np.nan],
+            # video b.mp4: calibration nodes are never detected
+            [1.0, 2.0, np.nan, np.nan, np.nan, np.nan],
+            [3.0, 4.0, np.nan, np.nan, np.nan, np.nan],
+            [5.0, 6.0, np.nan, np.nan, np.nan, np.nan],
+        ]
+    )
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def test_invert_y_axis():
+    """Test the y-axis is inverted, leaving the x-axis and the input dataframe untouched."""
+    df = make_coords_dataframe()
+    original = df.copy()
+
+    inverted = invert_y_axis(df, 512)
+
+    pd.testing.assert_frame_equal(df, original)
+    pd.testing.assert_frame_equal(inverted.xs("x", axis=1, level=1), df.xs("x", axis=1, level=1))
+    pd.testing.assert_frame_equal(inverted.xs("y", axis=1, level=1), 512 - df.xs("y", axis=1, level=1))
+
+
+def test_convert_physical_units():
+    """Test calibration factors are computed per video, and videos without a factor are left in px."""
+    df = make_coords_dataframe()
+
+    conv_factors = compute_conversion_factors(df, "Top_Box", "Bot_Box", 5.0)
+    assert conv_factors == {"a.mp4": 0.5, "b.mp4": None}
+
+    converted = convert_physical_units(df, conv_factors)
+    pd.testing.assert_frame_equal(converted.loc["a.mp4"], df.loc["a.mp4"] * 0.5)
+    pd.testing.assert_frame_equal(converted.loc["b.mp4"], df.loc["b.mp4"])
+
 
-#     # test getting a single bodypart
-#     nodes = get_nodes_for_bodyparts(slp_typical, slp_typical.skeletons[0].nodes[0].name)
-#     expected_nodes = [slp_typical.skeletons[0].nodes[0]]
-#     assert len(nodes) == len(expected_nodes)
-#     assert_lists_equal_ignore_order(nodes, expected_nodes)
+def make_gappy_dataframe() -> pd.DataFrame:
+    """Make a dataframe of two videos of a smooth trace, with gaps of 1 to 20 frames in each node."""
+    rng = np.random.default_rng(0)
+    frames = np.arange(300)
+    index = pd.MultiIndex.from_product([["a.mp4", "b.mp4"], frames], names=["video", "frame_idx"])
+    columns = pd.MultiIndex.from_product([["Toe", "Heel"], ["x", "y"]], names=["bodyparts", "coords"])
+    values = np.column_stack([np.sin(np.tile(frames, 2) / (10.0 + i)) * 50 + 100 for i in range(4)])
+    for col in range(4):
+        for start in rng.choice(np.arange(5, 580), 12, replace=False):
+            values[start : start + rng.integers(1, 21), col] = np.nan
+    return pd.DataFrame(values, index=index, columns=columns)
 
-#     # test getting all bodyparts explicitly
-#     nodes = get_nodes_for_bodyparts(slp_typical, slp_typical.skeletons[0].node_names)
-#     expected_nodes = slp_typical.skeletons[0].nodes
-#     assert len(nodes) == len(expected_nodes)
-#     assert_lists_equal_ignore_order(nodes, expected_nodes)
 
-#     # test getting all bodyparts via special `all` value
-#     nodes = get_nodes_for_bodyparts(slp_typical, "all")
-#     expected_nodes = slp_typical.skeletons[0].nodes
-#     assert len(nodes) == len(expected_nodes)
-#     assert_lists_equal_ignore_order(nodes, expected_nodes)
+@pytest.mark.parametrize("method", ["linear", "spline"])
+def test_fill_and_smooth_interpolate(method: Interpolation):
+    """Test gaps of each node and video are filled as by `np.interp` or `features.fill_gaps()`."""
+    df = make_gappy_dataframe()
+    filled = fill_and_smooth(df, PostProcessing(interpolate=method))
+
+    assert not filled.isna().any().any()
+    for video in ["a.mp4", "b.mp4"]:
+        for col in df.columns:
+            trace = df.loc[video, col].to_numpy()
+            if method == "linear":
+                valid = ~np.isnan(trace)
+                expected = np.interp(np.arange(len(trace)), np.flatnonzero(valid), trace[valid])
+            else:
+                expected = fill_gaps(trace)
+            np.testing.assert_allclose(filled.loc[video, col].to_numpy(), expected)
+
+
+def test_fill_and_smooth_max_gap_and_smooth():
+    """Test gaps longer than --max-gap are left missing, and smoothing leaves points next to gaps untouched."""
+    df = make_gappy_dataframe()
+    filled = fill_and_smooth(df, PostProcessing(interpolate="linear", max_gap=5))
+    for video in ["a.mp4", "b.mp4"]:
+        for col in df.columns:
+            missing = df.loc[video, col].isna().to_numpy()
+            # lengths of the runs of missing values, and whether each run remains missing
+            edges = np.flatnonzero(np.diff(np.concatenate([[0], missing.astype(int), [0]])))
+            for start, stop in zip(edges[::2], edges[1::2]):
+                assert filled.loc[video, col].iloc[start:stop].isna().all() == (stop - start > 5)
+
+    smoothed = fill_and_smooth(df, PostProcessing(smooth=(7, 2)))
+    pd.testing.assert_frame_equal(smoothed.isna(), df.isna())
+    near_gap = df.isna().rolling(7, center=True, min_periods=1).max().astype(bool) | df.isna()
+    pd.testing.assert_frame_equal(smoothed[near_gap], df[near_gap])
+    assert not np.allclose(smoothed.to_numpy()[~near_gap.to_numpy()], df.to_numpy()[~near_gap.to_numpy()])
+
+    with pytest.raises(ValueError):
+        PostProcessing(smooth=(6, 2))
+
+
+def test_decimate_trace():
+    """Test decimation keeps the min/max envelope of each bin in order, and keeps gaps as NaN."""
+    x = np.arange(1000)
+    y = np.sin(x / 10.0)
+    y[100:300] = np.nan
+
+    dx, dy = decimate_trace(x, y, 100)
+    assert len(dx) == len(dy) == 100
+    assert np.all(np.diff(dx) >= 0)
+    assert np.nanmin(dy) == np.nanmin(y) and np.nanmax(dy) == np.nanmax(y)
+    assert np.isnan(dy[(dx >= 100) & (dx < 300)]).all()
+
+    # short traces are returned untouched
+    dx, dy = decimate_trace(x[:50], y[:50], 100)
+    assert len(dx) == len(dy) == 50
+
+
+def test_plot_grouped_skip_unchanged(tmp_path):
+    """Test one plot is made per video, and plots are only re-rendered when their data changes."""
+    df = make_coords_dataframe()
+
+    plots = plot_grouped_bodyparts_y_pos_over_time(df, str(tmp_path), ["Toe"], suffix="px")
+    assert [os.path.basename(p) for p in plots] == ["a.mp4_[Toe]_ycord_vs_time.px.png", "b.mp4_[Toe]_ycord_vs_time.px.png"]
+    mtimes = [os.stat(p).st_mtime_ns for p in plots]
+
+    # unchanged data, nothing is rendered
+    plot_grouped_bodyparts_y_pos_over_time(df, str(tmp_path), ["Toe"], suffix="px")
+    assert [os.stat(p).st_mtime_ns for p in plots] == mtimes
+
+    # only the plot of the changed video is rendered
+    df.loc[("b.mp4", 0), ("Toe", "y")] = 100.0
+    plot_grouped_bodyparts_y_pos_over_time(df, str(tmp_path), ["Toe"], suffix="px")
+    assert os.stat(plots[0]).st_mtime_ns == mtimes[0]
+    assert os.stat(plots[1]).st_mtime_ns != mtimes[1]
+
+
+def test_plot_reuses_figure(tmp_path):
+    """Test plots drawn on the reused figure are identical to those of a fresh figure, with a bounded number of ticks."""
+    from matplotlib.figure import Figure
+
+    df = make_coords_dataframe()
+    first = plot_bodyparts_y_pos_over_time(df.loc[["a.mp4"]], str(tmp_path / "first"), ["Toe"])
+    long_df = pd.DataFrame(
+        {("Toe", "y"): np.sin(np.arange(200_000) / 100.0)},
+        index=pd.MultiIndex.from_product([["long.mp4"], np.arange(200_000)], names=["video", "frame_idx"]),
+    )
+    plot_bodyparts_y_pos_over_time(long_df, str(tmp_path), ["Toe"])
+    again = plot_bodyparts_y_pos_over_time(df.loc[["a.mp4"]], str(tmp_path / "again"), ["Toe"])
+    with open(first, "rb") as f1, open(again, "rb") as f2:
+        assert f1.read() == f2.read()
+
+    ax = Figure(figsize=(20, 10)).subplots()
+    plot_bodyparts_y_pos_over_time(long_df, str(tmp_path), ["Toe"], ax=ax)
+    assert len(ax.get_xticks()) <= 20
+    assert max(len(line.get_xdata()) for line in ax.get_lines()) <= 4000
+
+
+@pytest.mark.parametrize("layout", ["pdf", "grid"])
+def test_plot_overview(tmp_path, layout: OverviewLayout):
+    """Test every video is plotted to a single overview, from dataframes or the files saved for each video."""
+    from PIL import Image
+
+    df = make_coords_dataframe()
+    dest = str(tmp_path / f"overview.{'pdf' if layout == 'pdf' else 'png'}")
+    sources = {}
+    for video, video_df in df.groupby(level="video"):
+        sources[video] = str(tmp_path / f"{video}.tsv")
+        video_df.to_csv(sources[video], sep="\t")
+
+    for source in [df, sources]:
+        assert plot_overview(source, dest, ["Toe", "Top_Box"], layout=layout) == dest
+        if layout == "pdf":
+            with open(dest, "rb") as f:
+                assert len(re.findall(rb"/Type\s*/Page\b", f.read())) == 2
+        else:
+            with Image.open(dest) as image:
+                assert image.size == (1200, 350)
@@ -0,0 +1,62 @@
+import json
+import os
+from typing import Any, Dict, List
+
+import pytest
+from sleap_io import Labels
+
+from paws_tools.watch import STATE_FILENAME, WatchState, watch_directory
+from tests.fixtures.slp import make_labels, write_slp
+
+KWARGS: Dict[str, Any] = dict(body_parts=["Toe"], ignore_body_parts=[], frame_height=512, calibration=None, plot=False)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_watch_directory(tmp_path, slp_synthetic: Labels, jobs: int):
+    """Test new and modified files are converted once each, and the state file prevents reprocessing on restart."""
+    watched = tmp_path / "inference"
+    (watched / "day_1").mkdir(parents=True)
+    first = write_slp(slp_synthetic, str(watched / "first.slp"))
+    other_labels = make_labels(n_videos=1, seed=1)
+    other_labels.videos[0].filename = "/data/other.mp4"
+    second = write_slp(other_labels, str(watched / "day_1" / "second.slp"))
+    bad = str(watched / "bad.slp")
+    with open(bad, "w") as f:
+        f.write("not a slp file")
+
+    dest_dir = str(tmp_path / "out")
+    rows = watch_directory(str(watched), dest_dir, jobs=jobs, settle_time=0, poll_interval=0.1, once=True, **KWARGS)
+    assert sorted((row["file"], row["status"]) for row in rows) == sorted([(bad, "failed"), (first, "ok"), (second, "ok")])
+    assert sorted(fn for fn in os.listdir(dest_dir) if fn.endswith(".px.tsv")) == ["other.px.tsv", "video_0.px.tsv", "video_1.px.tsv"]
+
+    with open(os.path.join(dest_dir, STATE_FILENAME)) as f:
+        state = json.load(f)["files"]
+    assert state[os.path.abspath(first)]["converted"] == 2
+    assert state[os.path.abspath(bad)]["status"] == "failed"
+
+    # a restart converts nothing, not even the failed file, until files are modified
+    assert watch_directory(str(watched), dest_dir, jobs=jobs, settle_time=0, poll_interval=0.1, once=True, **KWARGS) == []
+    write_slp(make_labels(seed=2), first)
+    rows = watch_directory(str(watched), dest_dir, jobs=jobs, settle_time=0, poll_interval=0.1, once=True, **KWARGS)
+    assert [(row["file"], row["converted"]) for row in rows] == [(first, 2)]
+
+
+def test_watch_directory_settle(tmp_path, slp_synthetic: Labels):
+    """Test files are only converted once left unchanged for the settle time."""
+    watched = tmp_path / "inference"
+    watched.mkdir()
+    slp_file = write_slp(slp_synthetic, str(watched / "labels.slp"))
+    dest_dir = str(tmp_path / "out")
+
+    polls: List[None] = []
+
+    def stop_after_polls() -> bool:
+        polls.append(None)
+        if len(polls) < 3:
+            # keep modifying the file, as if it were still being written
+            os.utime(slp_file, ns=(0, len(polls) * 10**9))
+        return len(polls) >= 8
+
+    rows = watch_directory(str(watched), dest_dir, settle_time=0.25, poll_interval=0.1, should_stop=stop_after_polls, **KWARGS)
+    assert [row["file"] for row in rows] == [slp_file]
+    assert WatchState(os.path.join(dest_dir, STATE_FILENAME)).is_done(slp_file, {"size": os.path.getsize(slp_file), "mtime_ns": 2 * 10**9})